@@ -0,0 +1,70 @@
+"""
+Микро-бенчмарк отрисовки списков событий (rendering.py).
+
+Сравнивает прежний способ (datetime.fromisoformat + strftime на каждое
+событие и сборка строки через +=) с render_events + split_message
+на списках разной длины.
+
+Запуск: python benchmarks/bench_rendering.py
+"""
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from rendering import render_events, split_message, message_length, TELEGRAM_MESSAGE_LIMIT  # noqa: E402
+
+SIZES = (10, 100, 1000, 10000)
+
+
+def make_events(count: int) -> list:
+    start = datetime(2026, 1, 1, 9, 0)
+    return [
+        {
+            "event_title": f"Встреча <команды> №{i} & обсуждение",
+            "start_datetime": (start + timedelta(minutes=30 * i)).strftime("%Y-%m-%dT%H:%M:%S"),
+            "event_place": "Zoom" if i % 2 else None,
+            "event_description": "Обсудим релиз и планы на следующий спринт" if i % 3 == 0 else None,
+        }
+        for i in range(count)
+    ]
+
+
+def baseline(events: list) -> str:
+    # Прежняя реализация: разбор даты через datetime и конкатенация через +=
+    response = "📅 События:\n\n"
+    for ev in events:
+        dt = ev["start_datetime"]
+        date_part = dt.split("T")[0]
+        time_part = dt.split("T")[1][:5]
+        formatted_date = datetime.fromisoformat(date_part).strftime("%d.%m.%Y")
+        place = f"\n📍 {ev['event_place']}" if ev["event_place"] else ""
+        desc = f"\n📝 {ev['event_description']}" if ev["event_description"] else ""
+        response += f"• <b>{ev['event_title']}</b> — {formatted_date} {time_part}{place}{desc}\n\n"
+    return response.strip()
+
+
+def current(events: list) -> list:
+    return split_message(["📅 События:", *render_events(events)])
+
+
+def measure(func, events: list) -> float:
+    number = max(1, 20000 // len(events))
+    return min(timeit.repeat(lambda: func(events), number=number, repeat=5)) / number * 1000
+
+
+def main():
+    print(f"{'событий':>8}{'прежний, мс':>14}{'rendering, мс':>16}{'сообщений':>11}")
+    for size in SIZES:
+        events = make_events(size)
+        messages = current(events)
+        assert all(message_length(text) <= TELEGRAM_MESSAGE_LIMIT for text in messages)
+        print(
+            f"{size:>8}{measure(baseline, events):>14.3f}{measure(current, events):>16.3f}{len(messages):>11}"
+        )
+
+
+if __name__ == "__main__":
+    main()
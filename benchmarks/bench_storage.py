@@ -0,0 +1,94 @@
+"""
+Бенчмарк запросов SQLiteStorage (storage.py) на большой базе.
+
+Заполняет временную базу событиями (по умолчанию 1 000 000 событий у
+10 000 пользователей) и замеряет запросы, которые выполняют хендлеры и
+дайджест: период, точное время, поиск по названию, последнее событие,
+загрузку поискового индекса и все события дня для дайджеста.
+
+Запуск: python benchmarks/bench_storage.py [--events 1000000] [--users 10000]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Хранилище создаётся при импорте — выбираем SQLite в памяти, чтобы не нужен был Supabase
+os.environ["STORAGE_BACKEND"] = "sqlite"
+os.environ["SQLITE_PATH"] = ":memory:"
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from storage import SQLiteStorage, _norm_title  # noqa: E402
+
+TITLES = ("Встреча с командой", "Созвон с клиентом", "Обед", "Презентация проекта", "Тренировка", "Врач")
+START = datetime(2026, 1, 1, 8, 0)
+REPEAT = 20
+
+
+def populate(storage: SQLiteStorage, events: int, users: int):
+    conn = storage.conn
+    conn.executemany("INSERT INTO users (telegram_id) VALUES (?)", ((str(i),) for i in range(users)))
+    rng = random.Random(42)
+
+    def rows():
+        for _ in range(events):
+            title = rng.choice(TITLES)
+            start = START + timedelta(minutes=30 * rng.randrange(365 * 24))
+            yield (
+                rng.randrange(users) + 1, title, _norm_title(title), None,
+                start.strftime("%Y-%m-%dT%H:%M:%S"), (start + timedelta(hours=1)).strftime("%Y-%m-%dT%H:%M:%S"),
+                "Офис" if rng.random() < 0.3 else None, 0,
+            )
+
+    conn.executemany(
+        "INSERT INTO events (user_id, event_title, event_title_norm, event_description, "
+        "start_datetime, end_datetime, event_place, event_weekly) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        rows()
+    )
+    conn.commit()
+    conn.execute("ANALYZE")
+
+
+async def measure(name: str, make_call):
+    timings = []
+    for i in range(REPEAT):
+        started = time.perf_counter()
+        result = await make_call(i)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    rows = len(result) if hasattr(result, "__len__") else 1
+    print(f"{name:<34}{timings[len(timings) // 2]:>10.2f}{timings[-1]:>10.2f}{rows:>9}")
+
+
+async def run(events: int, users: int):
+    with tempfile.TemporaryDirectory() as directory:
+        storage = SQLiteStorage(os.path.join(directory, "bench.db"))
+        started = time.perf_counter()
+        populate(storage, events, users)
+        print(f"База: {events} событий, {users} пользователей, заполнение {time.perf_counter() - started:.1f} с\n")
+
+        print(f"{'запрос':<34}{'p50, мс':>10}{'max, мс':>10}{'строк':>9}")
+        user = lambda i: (i * 7919) % users + 1  # noqa: E731
+        await measure("период (неделя)", lambda i: storage.find_events(
+            user(i), start="2026-03-02T00:00:00", end="2026-03-08T23:59:59"))
+        await measure("точное время", lambda i: storage.find_events(user(i), exact="2026-03-02T10:00:00"))
+        await measure("поиск по названию", lambda i: storage.find_events(user(i), title="встреча"))
+        await measure("последнее событие", lambda i: storage.find_events(user(i), latest=True, limit=1))
+        await measure("строки поискового индекса", lambda i: storage.list_index_rows(user(i)))
+        await measure("дайджест: все события дня", lambda i: storage.get_day_events(f"2026-03-{i % 28 + 1:02d}"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--events", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    args = parser.parse_args()
+    asyncio.run(run(args.events, args.users))
+
+
+if __name__ == "__main__":
+    main()
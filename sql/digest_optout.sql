@@ -0,0 +1,7 @@
+-- Пользователи, отключившие утренний дайджест командой /digest_off.
+-- Используется SupabaseStorage.set_digest_enabled и get_day_events.
+-- Выполнить один раз в SQL Editor проекта Supabase.
+create table if not exists digest_optout (
+    telegram_id text primary key,
+    created_at timestamptz not null default now()
+);
@@ -0,0 +1,14 @@
+-- Сдвиг событий на заданное число минут одним запросом.
+-- Используется SupabaseStorage.shift_events (массовый перенос событий периода):
+-- PostgREST не умеет UPDATE с выражением над текущим значением столбца.
+-- Выполнить один раз в SQL Editor проекта Supabase.
+create or replace function shift_events(event_ids uuid[], shift_minutes integer)
+returns setof events
+language sql
+as $$
+    update events
+    set start_datetime = start_datetime + make_interval(mins => shift_minutes),
+        end_datetime = end_datetime + make_interval(mins => shift_minutes)
+    where id = any(event_ids)
+    returning *;
+$$;
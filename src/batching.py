@@ -0,0 +1,127 @@
+import asyncio
+import contextvars
+import time
+
+# --- Адаптивная микро-пакетизация запросов ---
+# Запросы одного вида, пришедшие почти одновременно от разных пользователей,
+# собираются в пакет и обрабатываются одним вызовом run_batch. Окно ожидания
+# подстраивается под нагрузку: при редких запросах каждый уходит сразу через
+# run_single и задержки не добавляется. Признак нагрузки — частые запросы
+# (по сглаженной паузе между ними) или ещё не завершённые вызовы к модели.
+
+# Коэффициент сглаживания для средней паузы между запросами
+_EWMA_ALPHA = 0.3
+
+
+class MicroBatcher:
+    def __init__(self, run_batch, run_single, max_batch: int, max_wait: float):
+        """
+        run_batch(items) -> список результатов той же длины; None на месте
+        элемента означает "ответ для него не разобран" — тогда он уйдёт в run_single.
+        run_single(item) -> результат для одного элемента.
+        max_wait — верхняя граница окна ожидания в секундах.
+        """
+        self.run_batch = run_batch
+        self.run_single = run_single
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._pending = []
+        self._flush_handle = None
+        self._last_arrival = None
+        self._avg_gap = float("inf")
+        self._in_flight = 0
+        self._tasks = set()
+
+    def _spawn(self, coro):
+        # Пакет обслуживает разных пользователей, поэтому задача запускается в чистом
+        # контексте и не наследует дедлайн того, чей запрос вызвал отправку.
+        # Ссылки на задачи держим, чтобы их не собрал сборщик мусора.
+        task = asyncio.create_task(coro, context=contextvars.Context())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _observe_arrival(self):
+        now = time.monotonic()
+        if self._last_arrival is not None:
+            gap = now - self._last_arrival
+            if self._avg_gap == float("inf"):
+                self._avg_gap = gap
+            else:
+                self._avg_gap = _EWMA_ALPHA * gap + (1 - _EWMA_ALPHA) * self._avg_gap
+        self._last_arrival = now
+
+    def window(self) -> float:
+        """Текущее окно ожидания: 0, если запросы редкие и модель не занята"""
+        if not self._in_flight and self._avg_gap >= self.max_wait:
+            return 0.0
+        # Ждём примерно столько, сколько нужно, чтобы набрать полный пакет
+        return min(self.max_wait, self._avg_gap * (self.max_batch - 1))
+
+    async def submit(self, item):
+        self._observe_arrival()
+        window = self.window()
+
+        # Простой — отправляем сразу, без пакетного промпта
+        if window == 0 and not self._pending:
+            self._in_flight += 1
+            try:
+                return await self.run_single(item)
+            finally:
+                self._in_flight -= 1
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((item, future))
+
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(window, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            self._spawn(self._dispatch(batch))
+
+    async def _dispatch(self, batch):
+        items = [item for item, _ in batch]
+        if len(items) == 1:
+            results = [None]
+        else:
+            self._in_flight += 1
+            try:
+                results = await self.run_batch(items)
+            except Exception as e:
+                print(f"Ошибка пакетного запроса ({len(items)} шт.), обрабатываю по одному: {e}")
+                results = [None] * len(items)
+            finally:
+                self._in_flight -= 1
+            # Модель могла вернуть меньше элементов — недостающие пойдут по одному
+            results = list(results)[:len(items)]
+            results += [None] * (len(items) - len(results))
+
+        for (item, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if result is None:
+                # Ответ для элемента не разобран — запасной путь по одному
+                self._spawn(self._resolve_single(item, future))
+            else:
+                future.set_result(result)
+
+    async def _resolve_single(self, item, future):
+        self._in_flight += 1
+        try:
+            result = await self.run_single(item)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        finally:
+            self._in_flight -= 1
+        if not future.done():
+            future.set_result(result)
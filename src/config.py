@@ -1,5 +1,4 @@
 import os
-from supabase import create_client
 
 # --- Конфиг ---
 SUPABASE_URL = os.getenv("SUPABASE_URL")
@@ -7,6 +6,60 @@ SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
 DEEPSEEK_URL = "https://api.deepseek.com/v1/chat/completions"
+# Пакетирование одновременных запросов к LLM (1 — включено)
+LLM_BATCHING = os.getenv("LLM_BATCHING", "0") == "1"
+LLM_BATCH_MAX_SIZE = int(os.getenv("LLM_BATCH_MAX_SIZE", "8"))
+LLM_BATCH_MAX_WAIT_MS = float(os.getenv("LLM_BATCH_MAX_WAIT_MS", "20"))
 
-# --- Клиент Supabase ---
-supabase_client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# --- Бюджет времени на сообщение ---
+# NRF: ≤ 5 секунд для 99% запросов; часть бюджета оставляем на отправку ответа
+UPDATE_DEADLINE = float(os.getenv("UPDATE_DEADLINE", "4.5"))
+
+# --- Хранилище ---
+# supabase — облачная база (по умолчанию), sqlite — локальный файл SQLITE_PATH
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "supabase")
+SQLITE_PATH = os.getenv("SQLITE_PATH", "calendar.db")
+
+# --- Состояния диалогов (FSM) ---
+# Брошенный диалог удаляется после FSM_IDLE_TTL секунд без сообщений
+FSM_IDLE_TTL = float(os.getenv("FSM_IDLE_TTL", "1800"))
+FSM_SWEEP_INTERVAL = float(os.getenv("FSM_SWEEP_INTERVAL", "60"))
+FSM_MAX_DATA_BYTES = int(os.getenv("FSM_MAX_DATA_BYTES", "16384"))
+
+# --- Профилирование ---
+# telegram_id администраторов через запятую — им доступны /profile и /profile_dump
+PROFILE_ADMIN_IDS = {int(x) for x in os.getenv("PROFILE_ADMIN_IDS", "").split(",") if x.strip()}
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+# Включить профилирование при запуске: "20" — на 20 сообщений, "60s" / "5m" — на время
+PROFILE_ON_START = os.getenv("PROFILE_ON_START", "")
+
+# --- Утренний дайджест ---
+# Время рассылки в формате HH:MM; пустое значение отключает дайджест
+DIGEST_TIME = os.getenv("DIGEST_TIME", "")
+DIGEST_PROGRESS_PATH = os.getenv("DIGEST_PROGRESS_PATH", "digest_progress.jsonl")
+# Сколько получателей обслуживается одновременно (общий лимит задаёт TELEGRAM_GLOBAL_RATE)
+DIGEST_CONCURRENCY = int(os.getenv("DIGEST_CONCURRENCY", "10"))
+# Лимиты Telegram: ~30 сообщений в секунду на бота и ~1 в секунду в один чат
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "25"))
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+
+# --- Подписка на календарь (ICS) ---
+# Порт HTTP-сервера с лентами; 0 — подписка выключена
+FEED_PORT = int(os.getenv("FEED_PORT", "0"))
+FEED_HOST = os.getenv("FEED_HOST", "0.0.0.0")
+# Публичный адрес сервера для ссылок в /feed (например, https://bot.example.com)
+FEED_BASE_URL = os.getenv("FEED_BASE_URL", "")
+# Ключ подписи ссылок; смена ключа отзывает все выданные ссылки
+FEED_SECRET = os.getenv("FEED_SECRET") or TELEGRAM_BOT_TOKEN or ""
+FEED_CACHE_SIZE = int(os.getenv("FEED_CACHE_SIZE", "1000"))
+
+# --- Запись трафика ---
+# Файл, в который дописываются обезличенные сообщения с ответами LLM и базы
+# для воспроизведения через traffic.py; пустое значение — запись выключена
+TRAFFIC_RECORD_PATH = os.getenv("TRAFFIC_RECORD_PATH", "")
+
+# --- Поисковый индекс событий ---
+# Через сколько секунд индекс пользователя перечитывается из базы
+# (чтобы увидеть записи других реплик) и сколько пользователей держать в памяти
+SEARCH_INDEX_TTL = float(os.getenv("SEARCH_INDEX_TTL", "300"))
+SEARCH_INDEX_MAX_USERS = int(os.getenv("SEARCH_INDEX_MAX_USERS", "1000"))
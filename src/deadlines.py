@@ -0,0 +1,77 @@
+import asyncio
+import time
+from contextvars import ContextVar
+
+from aiogram import BaseMiddleware
+
+from replies import ReplyPipeline, current_reply
+
+# --- Бюджет времени на обработку сообщения ---
+# Middleware задаёт каждому сообщению дедлайн (UPDATE_DEADLINE секунд).
+# Запросы к LLM и чтение из базы оборачиваются в within_deadline и получают
+# таймаут из оставшегося бюджета. Когда бюджет исчерпан, хендлер прерывается
+# исключением DeadlineExceeded, а middleware отправляет то, что хендлер успел
+# накопить в ReplyPipeline, с пометкой о том, что ответ неполный.
+#
+# Запись в базу бюджетом не ограничивается: блокирующий вызов в потоке нельзя
+# отменить, и прерванная на середине запись только сбила бы пользователя.
+
+_deadline: ContextVar = ContextVar("deadline", default=None)
+
+DEGRADED_TEXT = "⏳ Не успел обработать запрос вовремя — сервис сейчас отвечает медленно. Попробуйте отправить сообщение ещё раз."
+
+
+class DeadlineExceeded(BaseException):
+    """
+    Бюджет времени на сообщение исчерпан.
+    Как и CancelledError, наследуется от BaseException, чтобы общие
+    except Exception в хендлерах не превращали его в "ошибку базы".
+    """
+
+
+def remaining():
+    """Сколько секунд осталось до дедлайна текущего сообщения (None — дедлайна нет)"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+async def within_deadline(awaitable, timeout: float = None):
+    """
+    Ждёт awaitable не дольше min(timeout, остаток бюджета).
+    По своему таймауту — TimeoutError, по дедлайну — DeadlineExceeded.
+    """
+    left = remaining()
+    if left is None or (timeout is not None and timeout < left):
+        if timeout is None:
+            return await awaitable
+        return await asyncio.wait_for(awaitable, timeout)
+
+    if left <= 0:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise DeadlineExceeded()
+    try:
+        return await asyncio.wait_for(awaitable, left)
+    except TimeoutError:
+        raise DeadlineExceeded() from None
+
+
+class DeadlineMiddleware(BaseMiddleware):
+    def __init__(self, budget: float):
+        self.budget = budget
+
+    async def __call__(self, handler, event, data):
+        deadline_token = _deadline.set(time.monotonic() + self.budget)
+        reply_token = current_reply.set(None)
+        try:
+            return await handler(event, data)
+        except DeadlineExceeded:
+            print(f"Бюджет {self.budget} с исчерпан в {data['handler'].callback.__name__}")
+            # Отправляем накопленную часть ответа (или обновляем сообщение о ходе обработки)
+            reply = current_reply.get() or ReplyPipeline(event)
+            await reply.finish(DEGRADED_TEXT)
+        finally:
+            _deadline.reset(deadline_token)
+            current_reply.reset(reply_token)
@@ -0,0 +1,252 @@
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import Message
+
+from config import (
+    DIGEST_TIME, DIGEST_PROGRESS_PATH, DIGEST_CONCURRENCY, TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_RATE
+)
+from storage import storage
+from rendering import render_events, split_message
+
+# Сколько раз повторить отправку после TelegramRetryAfter
+_MAX_RETRY_AFTER = 3
+# Повторные проходы по не получившим дайджест и пауза перед каждым
+_RETRY_ROUNDS = 2
+_RETRY_PAUSE = 30
+
+
+# --- Ограничение частоты отправки ---
+class TokenBucket:
+    """Классический token bucket: rate токенов в секунду, не больше capacity в запасе"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class ThrottledSender:
+    """Отправка сообщений с учётом общего лимита бота и лимита на один чат"""
+
+    def __init__(self, bot: Bot, global_rate: float = TELEGRAM_GLOBAL_RATE,
+                 chat_rate: float = TELEGRAM_CHAT_RATE):
+        self.bot = bot
+        self.global_bucket = TokenBucket(global_rate)
+        self.chat_rate = chat_rate
+        self.chat_buckets = {}
+
+    async def send(self, chat_id, text: str, **kwargs) -> bool:
+        """
+        True — доставлено, False — чат недоступен навсегда (бот заблокирован, чат удалён).
+        Временные ошибки (сеть, TelegramRetryAfter сверх _MAX_RETRY_AFTER) пробрасываются.
+        """
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, 1)
+        await bucket.acquire()
+        await self.global_bucket.acquire()
+
+        for attempt in range(_MAX_RETRY_AFTER + 1):
+            try:
+                await self.bot.send_message(chat_id, text, **kwargs)
+                return True
+            except TelegramRetryAfter as e:
+                # Telegram сам говорит, сколько подождать — ждём и пробуем ещё раз
+                if attempt == _MAX_RETRY_AFTER:
+                    raise
+                await asyncio.sleep(e.retry_after)
+            except (TelegramForbiddenError, TelegramBadRequest) as e:
+                # Пользователь заблокировал бота или чат недоступен — повторять бесполезно
+                print(f"Сообщение для {chat_id} не доставлено: {e}")
+                return False
+
+
+# --- Прогресс рассылки (для продолжения после перезапуска) ---
+class DigestProgress:
+    """
+    Append-only журнал рассылки за день:
+    {"date": ..., "started": true}, затем {"date": ..., "sent": telegram_id}
+    на каждого получателя и {"date": ..., "finished": true} в конце.
+    """
+
+    def __init__(self, path: str, day: str):
+        self.path = path
+        self.day = day
+        self.started = False
+        self.finished = False
+        self.sent = set()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Последняя строка могла оборваться при падении процесса
+                    continue
+                if record.get("date") != self.day:
+                    continue
+                self.started = self.started or record.get("started", False)
+                self.finished = self.finished or record.get("finished", False)
+                if "sent" in record:
+                    self.sent.add(record["sent"])
+
+    def _append(self, record: dict):
+        record["date"] = self.day
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def start(self):
+        if not self.started:
+            # Журнал прошлых дней больше не нужен
+            with open(self.path, "w", encoding="utf-8"):
+                pass
+            self._append({"started": True})
+            self.started = True
+
+    def mark_sent(self, telegram_id: str):
+        self.sent.add(telegram_id)
+        self._append({"sent": telegram_id})
+
+    def finish(self):
+        self._append({"finished": True})
+        self.finished = True
+
+
+def render_digest(day: str, events: list) -> list:
+    """Сообщения дайджеста: обычно одно, при очень длинном списке — несколько"""
+    formatted_date = datetime.fromisoformat(day).strftime("%d.%m.%Y")
+    header = f"☀️ Доброе утро! Ваши события на сегодня ({formatted_date}):"
+    footer = "Отключить утренний дайджест: /digest_off"
+    return split_message([header, *render_events(events), footer])
+
+
+# --- Рассылка ---
+async def send_daily_digest(bot: Bot, day: str = None):
+    day = day or datetime.now().strftime("%Y-%m-%d")
+    progress = DigestProgress(DIGEST_PROGRESS_PATH, day)
+    if progress.finished:
+        return
+
+    # Все события дня одним запросом, сгруппированные по telegram_id
+    by_user = await storage.get_day_events(day)
+    progress.start()
+    sender = ThrottledSender(bot)
+
+    pending = [tid for tid in by_user if tid not in progress.sent]
+    print(f"Дайджест {day}: {len(pending)} получателей, уже отправлено {len(progress.sent)}")
+
+    failed = await _deliver(sender, day, by_user, pending, progress)
+    for _ in range(_RETRY_ROUNDS):
+        if not failed:
+            break
+        await asyncio.sleep(_RETRY_PAUSE)
+        print(f"Дайджест {day}: повторная отправка {len(failed)} получателям")
+        failed = await _deliver(sender, day, by_user, failed, progress)
+
+    if failed:
+        # Без отметки finished рассылка будет дослана после перезапуска
+        print(f"Дайджест {day}: не доставлен {len(failed)} получателям")
+        return
+    progress.finish()
+
+
+async def _deliver(sender: ThrottledSender, day: str, by_user: dict, telegram_ids: list,
+                   progress: DigestProgress) -> list:
+    """
+    Отправляет дайджест получателям из telegram_ids силами DIGEST_CONCURRENCY
+    параллельных отправителей и возвращает тех, кому отправить не удалось
+    """
+    queue = deque(telegram_ids)
+    failed = []
+
+    async def worker():
+        while queue:
+            telegram_id = queue.popleft()
+            try:
+                for text in render_digest(day, by_user[telegram_id]):
+                    if not await sender.send(telegram_id, text, parse_mode="HTML"):
+                        break
+            except Exception as e:
+                print(f"Ошибка при отправке дайджеста {telegram_id}: {e}")
+                failed.append(telegram_id)
+                continue
+            # Недоступный навсегда чат тоже отмечаем — повторять бесполезно
+            progress.mark_sent(telegram_id)
+
+    await asyncio.gather(*(worker() for _ in range(min(DIGEST_CONCURRENCY, len(queue)))))
+    return failed
+
+
+def _next_run(now: datetime) -> datetime:
+    hour, minute = map(int, DIGEST_TIME.split(":"))
+    run_at = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if run_at <= now:
+        run_at += timedelta(days=1)
+    return run_at
+
+
+async def digest_scheduler(bot: Bot):
+    """Фоновая задача: раз в день в DIGEST_TIME отправляет дайджест"""
+    # Если процесс перезапустился посреди сегодняшней рассылки — досылаем
+    today = datetime.now().strftime("%Y-%m-%d")
+    progress = DigestProgress(DIGEST_PROGRESS_PATH, today)
+    if progress.started and not progress.finished:
+        await _run_safely(bot, today)
+
+    while True:
+        now = datetime.now()
+        run_at = _next_run(now)
+        await asyncio.sleep((run_at - now).total_seconds())
+        await _run_safely(bot, run_at.strftime("%Y-%m-%d"))
+
+
+# --- Хендлеры команд /digest_off и /digest_on ---
+async def cmd_digest_off(message: Message):
+    try:
+        await storage.set_digest_enabled(str(message.from_user.id), False)
+    except Exception as e:
+        print(f"Ошибка при отключении дайджеста: {e}")
+        await message.reply("❌ Не удалось отключить дайджест. Попробуйте позже.")
+        return
+    await message.reply("🔕 Утренний дайджест отключён. Включить снова: /digest_on")
+
+
+async def cmd_digest_on(message: Message):
+    try:
+        await storage.set_digest_enabled(str(message.from_user.id), True)
+    except Exception as e:
+        print(f"Ошибка при включении дайджеста: {e}")
+        await message.reply("❌ Не удалось включить дайджест. Попробуйте позже.")
+        return
+    await message.reply("🔔 Утренний дайджест включён.")
+
+
+async def _run_safely(bot: Bot, day: str):
+    try:
+        await send_daily_digest(bot, day)
+    except Exception as e:
+        print(f"Ошибка при рассылке дайджеста: {e}")
@@ -0,0 +1,232 @@
+import hashlib
+import hmac
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from email.utils import formatdate, parsedate_to_datetime
+
+from aiohttp import web
+from aiogram.types import Message
+
+from config import FEED_HOST, FEED_PORT, FEED_BASE_URL, FEED_SECRET, FEED_CACHE_SIZE
+from storage import storage
+
+# --- Подписка на календарь (ICS) ---
+# Каждый пользователь получает секретную ссылку /feed/<telegram_id>/<token>.ics,
+# которую можно добавить в календарь телефона. Календари опрашивают ссылку
+# регулярно, поэтому:
+# - версия ленты (ETag/Last-Modified) хранится в памяти и меняется только при
+#   записи через бота — на неизменённую ленту отвечаем 304, не трогая базу;
+# - отрисованная лента кэшируется и сбрасывается хендлерами добавления,
+#   изменения и удаления;
+# - тело отдаётся потоком по частям.
+# После перезапуска версии неизвестны, поэтому каждый клиент один раз
+# получает ленту заново.
+
+# Размер части при потоковой отдаче
+_CHUNK_BYTES = 32 * 1024
+_BOOT_TIME = int(time.time())
+
+
+def feed_token(telegram_id) -> str:
+    """Секрет ссылки: HMAC от telegram_id, без хранения в базе"""
+    digest = hmac.new(FEED_SECRET.encode(), str(telegram_id).encode(), hashlib.sha256)
+    return digest.hexdigest()[:32]
+
+
+def feed_url(telegram_id) -> str:
+    base = (FEED_BASE_URL or f"http://localhost:{FEED_PORT}").rstrip("/")
+    return f"{base}/feed/{telegram_id}/{feed_token(telegram_id)}.ics"
+
+
+# --- Формирование ICS ---
+def _escape(value: str) -> str:
+    return (
+        value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+        .replace("\r\n", "\\n").replace("\n", "\\n")
+    )
+
+
+def _fold(line: str) -> str:
+    """Перенос строк длиннее 75 байт (RFC 5545), не разрывая символы UTF-8"""
+    if len(line.encode("utf-8")) <= 75:
+        return line + "\r\n"
+    parts, current, size = [], "", 0
+    for char in line:
+        char_size = len(char.encode("utf-8"))
+        # Продолжение начинается с пробела, он тоже занимает байт
+        if size + char_size > (75 if not parts else 74):
+            parts.append(current)
+            current, size = "", 0
+        current += char
+        size += char_size
+    parts.append(current)
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def _ics_datetime(value: str):
+    """'YYYY-MM-DDTHH:MM:SS' → 'YYYYMMDDTHHMMSS' (локальное время без часового пояса)"""
+    try:
+        return datetime.fromisoformat(value).strftime("%Y%m%dT%H%M%S")
+    except (TypeError, ValueError):
+        return None
+
+
+def render_event(ev: dict, stamp: str) -> str:
+    start = _ics_datetime(ev.get("start_datetime"))
+    if not start:
+        return ""
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:{ev['id']}@calendar-bot",
+        f"DTSTAMP:{stamp}",
+        f"DTSTART:{start}",
+    ]
+    end = _ics_datetime(ev.get("end_datetime"))
+    if end:
+        lines.append(f"DTEND:{end}")
+    lines.append(f"SUMMARY:{_escape(ev.get('event_title') or 'Без названия')}")
+    if ev.get("event_place"):
+        lines.append(f"LOCATION:{_escape(ev['event_place'])}")
+    if ev.get("event_description"):
+        lines.append(f"DESCRIPTION:{_escape(ev['event_description'])}")
+    if ev.get("event_weekly"):
+        lines.append("RRULE:FREQ=WEEKLY")
+    lines.append("END:VEVENT")
+    return "".join(_fold(line) for line in lines)
+
+
+def render_feed(events: list, last_modified: int) -> list:
+    """Лента в виде списка частей (bytes) для потоковой отдачи"""
+    stamp = datetime.fromtimestamp(last_modified, timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    chunks, buffer = [], [
+        "BEGIN:VCALENDAR\r\n"
+        "VERSION:2.0\r\n"
+        "PRODID:-//calendar-bot//RU\r\n"
+        "CALSCALE:GREGORIAN\r\n"
+        + _fold(f"X-WR-CALNAME:{_escape('Календарь бота')}")
+    ]
+    size = len(buffer[0])
+    for ev in events:
+        text = render_event(ev, stamp)
+        buffer.append(text)
+        size += len(text)
+        if size >= _CHUNK_BYTES:
+            chunks.append("".join(buffer).encode("utf-8"))
+            buffer, size = [], 0
+    buffer.append("END:VCALENDAR\r\n")
+    chunks.append("".join(buffer).encode("utf-8"))
+    return chunks
+
+
+# --- Версии и кэш лент ---
+class FeedCache:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        # telegram_id → (last_modified, etag); меняется при каждой записи
+        self._versions = {}
+        # telegram_id → (etag, части ленты), вытеснение давно не запрошенных
+        self._bodies = OrderedDict()
+
+    def version(self, telegram_id: int):
+        version = self._versions.get(telegram_id)
+        if version is None:
+            version = (_BOOT_TIME, f'"{telegram_id}-{_BOOT_TIME}-0"')
+        return version
+
+    def invalidate(self, telegram_id):
+        """Вызывается после любой записи событий пользователя"""
+        telegram_id = int(telegram_id)
+        self._versions[telegram_id] = (int(time.time()), f'"{telegram_id}-{time.time_ns()}"')
+        self._bodies.pop(telegram_id, None)
+
+    async def get_body(self, telegram_id: int) -> list:
+        last_modified, etag = self.version(telegram_id)
+        cached = self._bodies.get(telegram_id)
+        if cached and cached[0] == etag:
+            self._bodies.move_to_end(telegram_id)
+            return cached[1]
+
+        user_id = await storage.get_user_id(str(telegram_id))
+        events = await storage.find_events(user_id) if user_id else []
+        chunks = render_feed(events, last_modified)
+
+        # Пока читали базу, лента могла измениться — такую версию не кэшируем
+        if self.version(telegram_id)[1] == etag:
+            self._bodies[telegram_id] = (etag, chunks)
+            self._bodies.move_to_end(telegram_id)
+            while len(self._bodies) > self.max_entries:
+                self._bodies.popitem(last=False)
+        return chunks
+
+
+feed_cache = FeedCache(FEED_CACHE_SIZE)
+
+
+# --- HTTP-эндпоинт ---
+def _not_modified(request: web.Request, etag: str, last_modified: int) -> bool:
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+    if_modified_since = request.headers.get("If-Modified-Since")
+    if if_modified_since:
+        try:
+            return last_modified <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+async def handle_feed(request: web.Request) -> web.StreamResponse:
+    try:
+        telegram_id = int(request.match_info["telegram_id"])
+    except ValueError:
+        raise web.HTTPNotFound()
+    # Сравниваем байты: compare_digest падает с TypeError на str с не-ASCII символами
+    if not hmac.compare_digest(request.match_info["token"].encode(), feed_token(telegram_id).encode()):
+        raise web.HTTPNotFound()
+
+    last_modified, etag = feed_cache.version(telegram_id)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(last_modified, usegmt=True),
+        "Cache-Control": "private, no-cache",
+    }
+    if _not_modified(request, etag, last_modified):
+        return web.Response(status=304, headers=headers)
+
+    chunks = await feed_cache.get_body(telegram_id)
+    response = web.StreamResponse(headers=headers)
+    response.content_type = "text/calendar"
+    response.charset = "utf-8"
+    response.content_length = sum(len(chunk) for chunk in chunks)
+    await response.prepare(request)
+    if request.method != "HEAD":
+        for chunk in chunks:
+            await response.write(chunk)
+    await response.write_eof()
+    return response
+
+
+async def start_feed_server() -> web.AppRunner:
+    app = web.Application()
+    app.router.add_get("/feed/{telegram_id}/{token}.ics", handle_feed)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, FEED_HOST, FEED_PORT).start()
+    print(f"Лента календаря: http://{FEED_HOST}:{FEED_PORT}/feed/...")
+    return runner
+
+
+# --- Хендлер команды /feed ---
+async def cmd_feed(message: Message):
+    if not FEED_PORT:
+        await message.reply("Подписка на календарь не настроена.")
+        return
+    await message.reply(
+        "📆 Ссылка для подписки на ваш календарь:\n\n"
+        f"{feed_url(message.from_user.id)}\n\n"
+        "Добавьте её в календарь телефона как подписку (iCal / ICS). "
+        "Не передавайте ссылку другим — по ней видны все ваши события."
+    )
@@ -0,0 +1,150 @@
+import asyncio
+import json
+import time
+from typing import Any, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from keyboards import main_menu
+from replies import ReplyPipeline, current_reply
+
+# --- FSM-хранилище в памяти с истечением по времени ---
+# В отличие от MemoryStorage, брошенные на полпути диалоги (partial_event,
+# event_ids_to_delete, updated_fields, pending_text) не живут вечно:
+# запись удаляется, если пользователь молчит дольше idle_ttl секунд.
+
+# Примерная стоимость самой записи (ключ, объект, словарь) сверх данных
+_RECORD_OVERHEAD_BYTES = 400
+
+
+STATE_TOO_LARGE_TEXT = "❌ Слишком много данных в одном запросе. Отправьте его частями (например, по несколько событий)."
+
+
+class StateDataTooLarge(ValueError):
+    """Данные диалога превышают допустимый размер"""
+
+
+class _Record:
+    __slots__ = ("state", "data", "data_bytes", "touched")
+
+    def __init__(self):
+        self.state = None
+        self.data = {}
+        self.data_bytes = 0
+        self.touched = time.monotonic()
+
+
+def estimate_size(data: Dict[str, Any]) -> int:
+    """Размер данных диалога в байтах (по JSON-представлению)"""
+    if not data:
+        return 0
+    return len(json.dumps(data, ensure_ascii=False, default=str).encode("utf-8"))
+
+
+class ExpiringMemoryStorage(BaseStorage):
+    def __init__(self, idle_ttl: float, max_data_bytes: int):
+        self.idle_ttl = idle_ttl
+        self.max_data_bytes = max_data_bytes
+        self.storage: Dict[StorageKey, _Record] = {}
+
+    def _get(self, key: StorageKey) -> Optional[_Record]:
+        record = self.storage.get(key)
+        if record is None:
+            return None
+        if time.monotonic() - record.touched > self.idle_ttl:
+            del self.storage[key]
+            return None
+        record.touched = time.monotonic()
+        return record
+
+    def _get_or_create(self, key: StorageKey) -> _Record:
+        record = self._get(key)
+        if record is None:
+            record = self.storage[key] = _Record()
+        return record
+
+    def _drop_if_empty(self, key: StorageKey, record: _Record):
+        # Завершённый диалог (state.clear()) не занимает память
+        if record.state is None and not record.data:
+            self.storage.pop(key, None)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = self._get_or_create(key)
+        record.state = state.state if isinstance(state, State) else state
+        self._drop_if_empty(key, record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        record = self._get(key)
+        return record.state if record else None
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        data_bytes = estimate_size(data)
+        if data_bytes > self.max_data_bytes:
+            raise StateDataTooLarge(
+                f"Данные диалога {key.user_id}: {data_bytes} байт при лимите {self.max_data_bytes}"
+            )
+        record = self._get_or_create(key)
+        record.data = data.copy()
+        record.data_bytes = data_bytes
+        self._drop_if_empty(key, record)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        record = self._get(key)
+        return record.data.copy() if record else {}
+
+    async def close(self) -> None:
+        self.storage.clear()
+
+    # --- Очистка и метрики ---
+    def sweep(self) -> int:
+        """Удаляет просроченные записи, возвращает их количество"""
+        deadline = time.monotonic() - self.idle_ttl
+        expired = [key for key, record in self.storage.items() if record.touched < deadline]
+        for key in expired:
+            del self.storage[key]
+        return len(expired)
+
+    def stats(self) -> dict:
+        """
+        live_conversations — пользователи в середине сценария (state задан),
+        records — все записи, включая данные без состояния,
+        memory_bytes — оценка занимаемой памяти.
+        """
+        records = self.storage.values()
+        return {
+            "live_conversations": sum(1 for record in records if record.state is not None),
+            "records": len(self.storage),
+            "memory_bytes": sum(record.data_bytes + _RECORD_OVERHEAD_BYTES for record in records),
+        }
+
+    async def sweep_forever(self, interval: float):
+        """Фоновая задача: периодически чистит хранилище и пишет метрики в лог"""
+        while True:
+            await asyncio.sleep(interval)
+            expired = self.sweep()
+            stats = self.stats()
+            print(
+                f"FSM: удалено просроченных {expired}, активных диалогов {stats['live_conversations']}, "
+                f"записей {stats['records']}, память ~{stats['memory_bytes']} байт"
+            )
+
+
+# --- Ответ пользователю при превышении лимита ---
+class StateDataLimitMiddleware(BaseMiddleware):
+    """
+    Хендлеры сохраняют состояние до того, как задать вопрос, поэтому при
+    StateDataTooLarge вопрос ещё не отправлен: сбрасываем диалог и вместо
+    накопленного ответа сообщаем, что запрос слишком большой.
+    """
+
+    async def __call__(self, handler, event, data):
+        try:
+            return await handler(event, data)
+        except StateDataTooLarge as e:
+            print(f"{e} ({data['handler'].callback.__name__})")
+            await data["state"].clear()
+            reply = current_reply.get() or ReplyPipeline(event)
+            reply.discard()
+            await reply.finish(STATE_TOO_LARGE_TEXT, reply_markup=main_menu)
@@ -1,13 +1,32 @@
+import asyncio
+import time
+
 from aiogram import F
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.types import Message
-from datetime import datetime
-
-from config import supabase_client
-from keyboards import main_menu, confirm_kb, exit_add_kb
+from datetime import date, datetime
+
+from feed import feed_cache
+from fsm_storage import StateDataTooLarge
+from intents import classify_intent, is_bulk_request, INTENT_ADD, INTENT_VIEW, INTENT_DELETE, INTENT_EDIT
+from keyboards import main_menu, confirm_kb, exit_add_kb, paged_confirm_kb, PAGE_PREV, PAGE_NEXT
+from rendering import escape, format_time, render_event
+from replies import ReplyPipeline
+from search_index import event_index
 from states import EventForm
-from utils import extract_event_data, extract_date_range, extract_event_to_delete, extract_edit_data
+from storage import storage, normalize_datetime
+from utils import (
+    extract_events_data, extract_date_range, extract_event_to_delete, extract_edit_data,
+    extract_bulk_operation
+)
+
+# Событий на одной странице подтверждения
+CONFIRM_PAGE_SIZE = 10
+# Больше событий за раз не трогаем: их id хранятся в состоянии диалога
+BULK_MAX_EVENTS = 300
+# Неразобранный текст ждёт выбора действия не дольше (секунд)
+PENDING_TEXT_TTL = 120
 
 
 def clean_null_values(data):
@@ -21,10 +40,94 @@ def clean_null_values(data):
     return cleaned
 
 
+async def ensure_user_index(user_id):
+    """Загружает события пользователя в поисковый индекс (впервые, после вытеснения или по истечении TTL)"""
+    if event_index.is_loaded(user_id):
+        return
+    event_index.load(user_id, await storage.list_index_rows(user_id))
+
+
+async def find_events_by_title(user_id, title, date=None, exact_datetime=None):
+    """
+    Ищет события по названию в локальном индексе.
+    Возвращает полные строки лучших совпадений (по убыванию релевантности) или [].
+    """
+    await ensure_user_index(user_id)
+    hits = event_index.search(user_id, title, date=date, exact_datetime=exact_datetime)
+    if not hits:
+        return []
+
+    # Оставляем только совпадения, близкие к лучшему
+    best_score = hits[0][1]
+    ids = [event_id for event_id, score in hits if score >= best_score * 0.8]
+
+    rows = {row["id"]: row for row in await storage.get_events(ids)}
+    return [rows[event_id] for event_id in ids if event_id in rows]
+
+
+async def resume_pending_text(message: Message, state: FSMContext, handler) -> bool:
+    """
+    Если пользователь до нажатия кнопки уже написал текст, который не удалось
+    однозначно отнести к действию, сразу обрабатываем его выбранным хендлером.
+    """
+    data = await state.get_data()
+    pending_text = data.pop("pending_text", None)
+    pending_at = data.pop("pending_text_at", 0)
+    if pending_text is None:
+        return False
+    await state.set_data(data)
+    # Устаревший текст не обрабатываем: пользователь мог давно о нём забыть
+    if not pending_text or time.time() - pending_at > PENDING_TEXT_TTL:
+        return False
+    await handler(message.model_copy(update={"text": pending_text}), state)
+    return True
+
+
+async def drop_pending_text(state: FSMContext):
+    """Забывает неразобранный текст: пользователь перешёл к другому действию"""
+    data = await state.get_data()
+    if "pending_text" in data:
+        data.pop("pending_text")
+        data.pop("pending_text_at", None)
+        await state.set_data(data)
+
+
+async def show_confirm_page(reply: ReplyPipeline, state: FSMContext, page: int = 0, events: list = None):
+    """
+    Показывает страницу списка событий, которых коснётся операция (confirm_ids в состоянии),
+    с заголовком и вопросом. events — уже загруженные строки, чтобы не читать их повторно.
+    """
+    data = await state.get_data()
+    ids = data["confirm_ids"]
+    pages = (len(ids) + CONFIRM_PAGE_SIZE - 1) // CONFIRM_PAGE_SIZE
+    page = max(0, min(page, pages - 1))
+    page_ids = ids[page * CONFIRM_PAGE_SIZE:(page + 1) * CONFIRM_PAGE_SIZE]
+
+    rows = {ev["id"]: ev for ev in events or []}
+    missing = [event_id for event_id in page_ids if event_id not in rows]
+    if missing:
+        rows.update({row["id"]: row for row in await storage.get_events(missing)})
+
+    reply.add(data["confirm_header"])
+    reply.add_events(rows[event_id] for event_id in page_ids if event_id in rows)
+    if pages > 1:
+        reply.add(f"📄 Страница {page + 1} из {pages}")
+
+    await state.update_data(confirm_page=page)
+    await reply.finish(data["confirm_question"], reply_markup=paged_confirm_kb if pages > 1 else confirm_kb)
+
+
+async def turn_confirm_page(message: Message, state: FSMContext):
+    data = await state.get_data()
+    step = -1 if message.text == PAGE_PREV else 1
+    await show_confirm_page(ReplyPipeline(message), state, data.get("confirm_page", 0) + step)
+
+
 # --- Хендлер: старт и главное меню ---
-async def cmd_start(message: Message):
+async def cmd_start(message: Message, state: FSMContext):
+    await drop_pending_text(state)
     # Убираем любую предыдущую клавиатуру
-    await message.answer(
+    await ReplyPipeline(message).finish(
         "👋 Привет! Я твой умный помощник по управлению расписанием через Telegram!\n\n"
 
         "📌 Я помогу тебе легко управлять событиями в календаре — просто напиши мне, что нужно добавить в календарь (или изменить, удалить, показать) в свободной форме,"
@@ -42,41 +145,54 @@ async def cmd_start(message: Message):
 
         "🎯 Чтобы начать, выбери действие ниже:",
         parse_mode="HTML",
-        reply_markup=main_menu
+        reply_markup=main_menu,
+        force_keyboard=True
     )
 
 
 # --- Хендлер: "Добавить событие" ---
 async def add_event_handler(message: Message, state: FSMContext):
     await state.set_state(EventForm.waiting_for_event)
+    if await resume_pending_text(message, state, handle_new_event):
+        return
     await message.answer("Напиши, какое событие нужно добавить, а также дату и время начала (если хочешь можешь добавть другую информацию):", reply_markup=None)
 
 
 # --- Хендлер: "Посмотреть события" ---
 async def view_events_handler(message: Message, state: FSMContext):
     await state.set_state(EventForm.waiting_for_period)
+    if await resume_pending_text(message, state, handle_view_events):
+        return
     await message.answer("На какую дату или за какой период показать события?", reply_markup=None)
 
 
 # --- Хендлер: Выход из режима добавления события ---
 async def exit_add_event_mode(message: Message, state: FSMContext):
     await state.clear()
-    await message.answer("❌ Выход из режима добавления события. Что дальше?", reply_markup=main_menu)
+    await ReplyPipeline(message).finish(
+        "❌ Выход из режима добавления события. Что дальше?", reply_markup=main_menu, force_keyboard=True
+    )
 
 
 # --- Хендлер: Получение события для добавления ---
 async def handle_new_event(message: Message, state: FSMContext):
-    await message.reply("🔍 Обрабатываю событие...")
+    reply = ReplyPipeline(message)
+    await reply.progress("🔍 Обрабатываю событие...")
 
     # Получаем сохраненные данные из предыдущих сообщений
     state_data = await state.get_data()
     saved_event = state_data.get("partial_event", {})
 
-    # Извлекаем данные из текущего сообщения
-    extracted = await extract_event_data(message.text)
-    
+    # Извлекаем события из текущего сообщения (их может быть несколько)
+    events = await extract_events_data(message.text)
+
+    # Несколько событий в одном сообщении — одно общее подтверждение
+    if len(events) > 1:
+        await propose_events(reply, state, events)
+        return
+
     # Очищаем null значения
-    extracted = clean_null_values(extracted)
+    extracted = clean_null_values(events[0])
     saved_event = clean_null_values(saved_event)
 
     # Объединяем сохраненные данные с новыми (новые имеют приоритет)
@@ -101,16 +217,16 @@ async def handle_new_event(message: Message, state: FSMContext):
         has_collected_data = False
         
         if merged_event["event_title"]:
-            collected_info += f"• Название: <b>{merged_event['event_title']}</b>\n"
+            collected_info += f"• Название: <b>{escape(merged_event['event_title'])}</b>\n"
             has_collected_data = True
         if merged_event["start_datetime"]:
-            collected_info += f"• Дата/время: <b>{merged_event['start_datetime']}</b>\n"
+            collected_info += f"• Дата/время: <b>{escape(merged_event['start_datetime'])}</b>\n"
             has_collected_data = True
         if merged_event["event_place"]:
-            collected_info += f"• Место: <b>{merged_event['event_place']}</b>\n"
+            collected_info += f"• Место: <b>{escape(merged_event['event_place'])}</b>\n"
             has_collected_data = True
         if merged_event["event_description"]:
-            collected_info += f"• Описание: <b>{merged_event['event_description']}</b>\n"
+            collected_info += f"• Описание: <b>{escape(merged_event['event_description'])}</b>\n"
             has_collected_data = True
         
         if has_collected_data:
@@ -132,7 +248,7 @@ async def handle_new_event(message: Message, state: FSMContext):
                 error_msg += collected_info + "\n"
             error_msg += "🔍 Введите дату и время или выйдите из режима добавления."
         
-        await message.reply(error_msg, parse_mode="HTML", reply_markup=exit_add_kb)
+        await reply.finish(error_msg, parse_mode="HTML", reply_markup=exit_add_kb)
         return
 
     # Если все данные есть, показываем что получилось и сохраняем
@@ -140,18 +256,7 @@ async def handle_new_event(message: Message, state: FSMContext):
 
     # Получаем или создаём пользователя
     try:
-        user_res = supabase_client.table("users") \
-            .select("id") \
-            .eq("telegram_id", str(message.from_user.id)) \
-            .execute()
-
-        user_id = user_res.data[0]["id"] if user_res.data else None
-
-        if not user_id:
-            new_user = supabase_client.table("users") \
-                .insert({"telegram_id": str(message.from_user.id)}) \
-                .execute()
-            user_id = new_user.data[0]["id"]
+        user_id = await storage.get_or_create_user_id(str(message.from_user.id))
 
         # Сохраняем событие
         event_data = {
@@ -164,38 +269,104 @@ async def handle_new_event(message: Message, state: FSMContext):
             "event_weekly": False
         }
 
-        supabase_client.table("events").insert(event_data).execute()
+        inserted = await storage.insert_event(event_data)
+        event_index.upsert(user_id, inserted)
+        feed_cache.invalidate(message.from_user.id)
 
-        await message.reply(
-            f"✅ Событие добавлено в календарь:\n\n"
-            f"<b>{extracted['event_title']}</b>\n"
-            f"🕐 {extracted['start_datetime']}\n"
-            f"{'📍 ' + extracted['event_place'] if extracted['event_place'] else ''}\n"
-            f"{'📝 ' + extracted['event_description'] if extracted['event_description'] else ''}",
-            parse_mode="HTML"
-        )
+        reply.add("✅ Событие добавлено в календарь:")
+        reply.add(render_event(inserted), parse_mode="HTML")
 
     except Exception as e:
         # Сохраняем данные для повторной попытки
         await state.update_data(partial_event=extracted)
-        await message.reply("❌ Ошибка при сохранении в базу.\n\nПопробуйте еще раз или выйдите из режима добавления.", reply_markup=exit_add_kb)
+        await reply.finish("❌ Ошибка при сохранении в базу.\n\nПопробуйте еще раз или выйдите из режима добавления.", reply_markup=exit_add_kb)
         print(f"Ошибка: {e}")
         return
 
     await state.clear()
-    await message.answer("Что дальше?", reply_markup=main_menu)
+    await reply.finish("Что дальше?", reply_markup=main_menu)
+
+
+async def propose_events(reply: ReplyPipeline, state: FSMContext, events: list):
+    """Показывает все распознанные события одним сообщением и ждёт подтверждения"""
+    complete = []
+    skipped = 0
+    for ev in events:
+        ev = clean_null_values(ev)
+        if ev["event_title"] and ev["start_datetime"]:
+            ev["start_datetime"] = normalize_datetime(ev["start_datetime"])
+            ev["end_datetime"] = normalize_datetime(ev["end_datetime"])
+            complete.append(ev)
+        else:
+            skipped += 1
+
+    if not complete:
+        await reply.finish(
+            "❌ Не удалось распознать название и дату/время ни для одного события.\n\n"
+            "🔍 Введите события еще раз или выйдите из режима добавления.",
+            reply_markup=exit_add_kb
+        )
+        return
+
+    reply.add(f"Найдено событий: {len(complete)}")
+    reply.add_events(complete)
+    if skipped:
+        reply.add(f"⚠️ Пропущено: {skipped} (не удалось распознать название или дату/время)")
+
+    # Состояние сохраняем до ответа: если данные не влезут в лимит, пользователь
+    # не увидит вопрос, на который бот уже не сможет принять ответ
+    await state.update_data(pending_events=complete)
+    await state.set_state(EventForm.confirming_add)
+    await reply.finish("Добавить все в календарь?", reply_markup=confirm_kb)
+
+
+# --- Хендлер: Подтверждение добавления нескольких событий ---
+async def confirm_add(message: Message, state: FSMContext):
+    if message.text == "❌ Нет":
+        await state.clear()
+        await ReplyPipeline(message).finish("❌ Добавление отменено.", reply_markup=main_menu)
+        return
+
+    elif message.text == "✅ Да":
+        data = await state.get_data()
+        events = data.get("pending_events", [])
+        reply = ReplyPipeline(message)
+
+        try:
+            user_id = await storage.get_or_create_user_id(str(message.from_user.id))
+
+            # Все события — одной пакетной вставкой
+            inserted = await storage.insert_events([
+                {"user_id": user_id, **ev, "event_weekly": False} for ev in events
+            ])
+            for row in inserted:
+                event_index.upsert(user_id, row)
+            feed_cache.invalidate(message.from_user.id)
+
+            reply.add(f"✅ Добавлено событий в календарь: {len(inserted)}.")
+        except Exception as e:
+            reply.add("❌ Ошибка при сохранении в базу.")
+            print(f"Ошибка: {e}")
+
+        await state.clear()
+        await reply.finish("Что дальше?", reply_markup=main_menu)
+        return
+
+    else:
+        await message.reply("Пожалуйста, выберите: ✅ Да или ❌ Нет")
 
 
 # --- Хендлер: Получение периода для просмотра событий ---
 async def handle_view_events(message: Message, state: FSMContext):
-    await message.reply("🔍 Определяю период и время...")
+    reply = ReplyPipeline(message)
+    await reply.progress("🔍 Определяю период и время...")
 
     range_data = await extract_date_range(message.text)
 
     if not range_data["start_date"] and not range_data["end_date"]:
-        await message.reply("❌ Не удалось определить дату.")
+        reply.add("❌ Не удалось определить дату.")
         await state.clear()
-        await message.answer("Что дальше?", reply_markup=main_menu)
+        await reply.finish("Что дальше?", reply_markup=main_menu)
         return
 
     # Установим дефолтные значения
@@ -204,96 +375,68 @@ async def handle_view_events(message: Message, state: FSMContext):
 
     try:
         # Получаем пользователя
-        user_res = supabase_client.table("users") \
-            .select("id") \
-            .eq("telegram_id", str(message.from_user.id)) \
-            .execute()
+        user_id = await storage.get_user_id(str(message.from_user.id))
 
-        if not user_res:
-            await message.reply("❌ Пользователь не найден.")
+        if not user_id:
+            reply.add("❌ Пользователь не найден.")
+            await state.clear()
+            await reply.finish("Что дальше?", reply_markup=main_menu)
             return
 
-        user_id = user_res.data[0]["id"]
-
-        # Начинаем строить запрос
-        query = supabase_client.table("events") \
-            .select("*") \
-            .eq("user_id", user_id) \
-            .gte("start_datetime", f"{start_date}T00:00:00") \
-            .lte("start_datetime", f"{end_date}T23:59:59")
+        # Границы периода
+        period_start = f"{start_date}T00:00:00"
+        period_end = f"{end_date}T23:59:59"
+        exact = None
 
         # Фильтр по времени
         if range_data["exact_time"]:
             # Только события в точное время
-            query = query.eq("start_datetime", f"{start_date}T{range_data['exact_time']}:00")
+            exact = f"{start_date}T{range_data['exact_time']}:00"
 
         else:
             # Диапазон времени
             if range_data["start_time"]:
-                time_str = f"{start_date}T{range_data['start_time']}:00"
-                query = query.gte("start_datetime", time_str)
+                period_start = f"{start_date}T{range_data['start_time']}:00"
 
             if range_data["end_time"]:
-                time_str = f"{end_date}T{range_data['end_time']}:00"
-                query = query.lte("start_datetime", time_str)
+                period_end = f"{end_date}T{range_data['end_time']}:00"
 
-        events_res = query.order("start_datetime").execute()
+        events = await storage.find_events(user_id, start=period_start, end=period_end, exact=exact)
 
-        if not events_res.data or len(events_res.data) == 0:
+        if not events:
             # Формируем сообщение с учетом времени
             if range_data["exact_time"]:
-                await message.reply(f"На {start_date} в {range_data['exact_time']} нет запланированных событий.")
+                reply.add(f"На {start_date} в {range_data['exact_time']} нет запланированных событий.")
             else:
-                await message.reply(f"На {start_date} нет запланированных событий.")
+                reply.add(f"На {start_date} нет запланированных событий.")
         else:
-            # Формируем ответ с датой и временем
-            response = f"📅 События "
+            # Заголовок с датой и временем, затем события — каждое отдельной частью,
+            # чтобы длинный список делился на сообщения между событиями
             if range_data["exact_time"]:
-                response += f"на {start_date} в {range_data['exact_time']}:\n\n"
+                header = f"на {start_date} в {range_data['exact_time']}"
             elif range_data["start_time"] and not range_data["end_time"]:
-                response += f"после {range_data['start_time']} на {start_date}:\n\n"
+                header = f"после {range_data['start_time']} на {start_date}"
             elif range_data["end_time"] and not range_data["start_time"]:
-                response += f"до {range_data['end_time']} на {start_date}:\n\n"
+                header = f"до {range_data['end_time']} на {start_date}"
             else:
-                response += f"с {start_date} по {end_date}:\n\n"
-
-            for ev in events_res.data:
-                title = ev["event_title"]
-
-                if ev["start_datetime"]:
-                    dt = ev["start_datetime"]
-                    date_part = dt.split("T")[0]
-                    time_part = dt.split("T")[1][:5]
-                    try:
-                        from datetime import datetime as dt_module
-                        parsed = dt_module.fromisoformat(date_part)
-                        formatted_date = parsed.strftime("%d.%m.%Y")
-                        datetime_display = f"{formatted_date} {time_part}"
-                    except:
-                        datetime_display = f"{date_part} {time_part}"
-                else:
-                    datetime_display = "??.??.???? ??:??"
-
-                place = f"\n📍 {ev['event_place']}" if ev["event_place"] else ""
-                desc = f"\n📝 {ev['event_description']}" if ev["event_description"] else ""
-
-                response += (
-                    f"• <b>{title}</b> — {datetime_display}{place}{desc}\n\n"
-                )
-
-            await message.reply(response.strip(), parse_mode="HTML")
+                header = f"с {start_date} по {end_date}"
+
+            reply.add(f"📅 События {header}:")
+            reply.add_events(events)
 
     except Exception as e:
-        await message.reply("❌ Ошибка при получении событий.")
+        reply.add("❌ Ошибка при получении событий.")
         print(f"Ошибка: {e}")
 
     await state.clear()
-    await message.answer("Что дальше?", reply_markup=main_menu)
+    await reply.finish("Что дальше?", reply_markup=main_menu)
 
 
 # --- Хендлер: Удаление события ---
 async def delete_event_handler(message: Message, state: FSMContext):
     await state.set_state(EventForm.waiting_for_delete)
+    if await resume_pending_text(message, state, handle_delete_event):
+        return
     await message.answer(
         "Какое событие нужно удалить?\n"
         "Напиши название или упомяни дату.",
@@ -303,116 +446,111 @@ async def delete_event_handler(message: Message, state: FSMContext):
 
 # --- Хендлер: Обработка запроса на удаление ---
 async def handle_delete_event(message: Message, state: FSMContext):
-    await message.reply("🔍 Ищу событие для удаления...")
+    if is_bulk_request(message.text):
+        await handle_bulk_operation(message, state)
+        return
+
+    reply = ReplyPipeline(message)
+    await reply.progress("🔍 Ищу событие для удаления...")
 
     # Извлекаем данные
     deletion_data = await extract_event_to_delete(message.text)
 
     if not deletion_data["start_date"]:
-        await message.reply("❌ Не удалось определить дату события.")
+        reply.add("❌ Не удалось определить дату события.")
         await state.clear()
-        await message.answer("Что дальше?", reply_markup=main_menu)
+        await reply.finish("Что дальше?", reply_markup=main_menu)
         return
 
     try:
         # Получаем пользователя
-        user_res = supabase_client.table("users") \
-            .select("id") \
-            .eq("telegram_id", str(message.from_user.id)) \
-            .execute()
+        user_id = await storage.get_user_id(str(message.from_user.id))
 
-        if not user_res:
-            await message.reply("❌ Пользователь не найден.")
+        if not user_id:
+            reply.add("❌ Пользователь не найден.")
+            await state.clear()
+            await reply.finish("Что дальше?", reply_markup=main_menu)
             return
 
-        user_id = user_res.data[0]["id"]
-
-        # Формируем запрос
-        query = supabase_client.table("events") \
-            .select("*") \
-            .eq("user_id", user_id) \
-            .gte("start_datetime", f"{deletion_data['start_date']}T00:00:00") \
-            .lte("start_datetime", f"{deletion_data['start_date']}T23:59:59")
-
-        # Если указано точное время — фильтруем по нему
+        target_time = None
         if deletion_data["exact_time"]:
             target_time = f"{deletion_data['start_date']}T{deletion_data['exact_time']}:00"
-            query = query.eq("start_datetime", target_time)
 
-        # Если есть название — добавляем поиск по нему
+        # Сначала ищем по названию в локальном индексе (учитывает словоформы)
+        found_events = []
         if deletion_data["event_title"]:
-            query = query.ilike("event_title", f"%{deletion_data['event_title']}%")
-
-        events_res = query.execute()
-
-        if not events_res:
-            await message.reply(f"❌ Событие на {deletion_data['start_date']} не найдено.")
+            found_events = await find_events_by_title(
+                user_id,
+                deletion_data["event_title"],
+                date=deletion_data["start_date"],
+                exact_datetime=target_time
+            )
+
+        if not found_events:
+            # Запрос в базу: день, точное время (если указано) и подстрока названия
+            found_events = await storage.find_events(
+                user_id,
+                start=f"{deletion_data['start_date']}T00:00:00",
+                end=f"{deletion_data['start_date']}T23:59:59",
+                exact=target_time,
+                title=deletion_data["event_title"]
+            )
+
+        if not found_events:
+            reply.add(f"❌ Событие на {deletion_data['start_date']} не найдено.")
             await state.clear()
-            await message.answer("Что дальше?", reply_markup=main_menu)
+            await reply.finish("Что дальше?", reply_markup=main_menu)
             return
 
-        # Сохраняем ID событий
-        found_events = events_res.data
-        event_ids = [ev["id"] for ev in found_events]
-
-        # Показываем найденное событие
-        first_ev = found_events[0]
-        title = first_ev["event_title"] or "Без названия"
-
-        if first_ev["start_datetime"]:
-            dt = first_ev["start_datetime"]
-            date_part = dt.split("T")[0]
-            time_part = dt.split("T")[1][:5]
-            try:
-                from datetime import datetime as dt_module
-                parsed = dt_module.fromisoformat(date_part)
-                formatted_date = parsed.strftime("%d.%m.%Y")
-                datetime_str = f"{formatted_date} {time_part}"
-            except:
-                datetime_str = f"{date_part} {time_part}"
+        # Показываем все найденные события — удалены будут именно они
+        if len(found_events) == 1:
+            header, question = "Найдено событие:", "Вы уверены, что хотите его удалить?"
         else:
-            datetime_str = "??.??.???? ??:??"
+            header, question = f"Найдено событий: {len(found_events)}", "Вы уверены, что хотите удалить их все?"
 
-        place = f"\n📍 {first_ev['event_place']}" if first_ev['event_place'] else ""
-        desc = f"\n📝 {first_ev['event_description']}" if first_ev['event_description'] else ""
-
-        confirmation_msg = (
-            f"Найдено событие:\n\n"
-            f"• <b>{title}</b> — {datetime_str}{place}{desc}\n\n"
-            f"Вы уверены, что хотите его удалить?"
+        await state.update_data(
+            confirm_ids=[ev["id"] for ev in found_events],
+            confirm_header=header,
+            confirm_question=question
         )
-        await message.reply(confirmation_msg, parse_mode="HTML", reply_markup=confirm_kb)
-
-        # Сохраняем ID в состояние
-        await state.update_data(event_ids_to_delete=event_ids)
         await state.set_state(EventForm.confirming_delete)
+        await show_confirm_page(reply, state, events=found_events)
 
+    except StateDataTooLarge:
+        # Ответит StateDataLimitMiddleware
+        raise
     except Exception as e:
-        await message.reply("❌ Ошибка при поиске события.")
+        reply.add("❌ Ошибка при поиске события.")
         print(f"Ошибка: {e}")
         await state.clear()
-        await message.answer("Что дальше?", reply_markup=main_menu)
+        await reply.finish("Что дальше?", reply_markup=main_menu)
 
 
 # --- Хендлер: Подтверждение удаления ---
 async def confirm_delete(message: Message, state: FSMContext):
     if message.text == "❌ Нет":
-        await message.reply("❌ Удаление отменено.", reply_markup=main_menu)
+        await ReplyPipeline(message).finish("❌ Удаление отменено.", reply_markup=main_menu)
         await state.clear()
         return
 
+    elif message.text in (PAGE_PREV, PAGE_NEXT):
+        await turn_confirm_page(message, state)
+        return
+
     elif message.text == "✅ Да":
         data = await state.get_data()
-        event_ids = data.get("event_ids_to_delete", [])
+        event_ids = data.get("confirm_ids", [])
 
         try:
             # Удаляем события
-            supabase_client.table("events").delete().in_("id", event_ids).execute()
+            await storage.delete_events(event_ids)
+            event_index.remove(event_ids)
+            feed_cache.invalidate(message.from_user.id)
             count = len(event_ids)
             s = "событие" if count == 1 else "события"
-            await message.reply(f"✅ Успешно удалено {count} {s}.", reply_markup=main_menu)
+            await ReplyPipeline(message).finish(f"✅ Успешно удалено {count} {s}.", reply_markup=main_menu)
         except Exception as e:
-            await message.reply("❌ Ошибка при удалении события.")
+            await ReplyPipeline(message).finish("❌ Ошибка при удалении события.", reply_markup=main_menu)
             print(f"Ошибка: {e}")
 
         await state.clear()
@@ -425,6 +563,8 @@ async def confirm_delete(message: Message, state: FSMContext):
 # --- Хендлер: Изменение события ---
 async def edit_event_handler(message: Message, state: FSMContext):
     await state.set_state(EventForm.waiting_for_edit)
+    if await resume_pending_text(message, state, handle_edit_event):
+        return
     await message.answer(
         "Какое событие нужно изменить?\n"
         "Напиши, что нужно поменять.\n\n"
@@ -438,71 +578,77 @@ async def edit_event_handler(message: Message, state: FSMContext):
 
 # --- Хендлер: Обработка запроса на изменение ---
 async def handle_edit_event(message: Message, state: FSMContext):
-    await message.reply("🔍 Ищу событие для изменения...")
+    if is_bulk_request(message.text):
+        await handle_bulk_operation(message, state)
+        return
 
-    # Шаг 1: Извлечь, ЧТО менять
-    changes = await extract_edit_data(message.text)
+    reply = ReplyPipeline(message)
+    await reply.progress("🔍 Ищу событие для изменения...")
+
+    # Что менять и какое событие — два независимых запроса к LLM, выполняем их
+    # параллельно, чтобы вместе они укладывались в бюджет UPDATE_DEADLINE
+    changes, deletion_like_data = await asyncio.gather(
+        extract_edit_data(message.text),
+        extract_event_to_delete(message.text)
+    )
+
+    # Шаг 1: Что менять
     if not any(value is not None for value in changes.values()):
-        await message.reply("❌ Не удалось определить, что нужно изменить.")
+        reply.add("❌ Не удалось определить, что нужно изменить.")
         await state.clear()
-        await message.answer("Что дальше?", reply_markup=main_menu)
+        await reply.finish("Что дальше?", reply_markup=main_menu)
         return
 
-    # Шаг 2: Найти событие по контексту (названию, дате и т.п.)
-    # Для простоты используем ту же логику, что и при удалении
-    deletion_like_data = await extract_event_to_delete(message.text)
-
+    # Шаг 2: Найти событие по контексту (названию, дате и т.п.) — та же логика, что и при удалении
     if not deletion_like_data["start_date"] and not changes.get("start_datetime"):
-        await message.reply("❌ Не удалось определить, какое событие изменить.")
+        reply.add("❌ Не удалось определить, какое событие изменить.")
         await state.clear()
-        await message.answer("Что дальше?", reply_markup=main_menu)
+        await reply.finish("Что дальше?", reply_markup=main_menu)
         return
 
     try:
-        user_res = supabase_client.table("users") \
-            .select("id") \
-            .eq("telegram_id", str(message.from_user.id)) \
-            .execute()
+        user_id = await storage.get_user_id(str(message.from_user.id))
 
-        if not user_res:
-            await message.reply("❌ Пользователь не найден.")
+        if not user_id:
+            reply.add("❌ Пользователь не найден.")
+            await state.clear()
+            await reply.finish("Что дальше?", reply_markup=main_menu)
             return
 
-        user_id = user_res.data[0]["id"]
-
         # Поиск события
-        query = supabase_client.table("events") \
-            .select("*") \
-            .eq("user_id", user_id)
-
         found_event = None
 
         # Приоритет: если есть точное время + дата — ищем по ним
         if deletion_like_data["start_date"] and deletion_like_data["exact_time"]:
             target_dt = f"{deletion_like_data['start_date']}T{deletion_like_data['exact_time']}:00"
-            query = query.eq("start_datetime", target_dt)
-            res = query.execute()
+            res = await storage.find_events(user_id, exact=target_dt)
             if res:
-                found_event = res.data[0]
+                found_event = res[0]
 
-        # Или по названию
+        # Или по названию: сначала локальный индекс, затем запрос в базу
         elif deletion_like_data["event_title"]:
-            res = query.ilike("event_title", f"%{deletion_like_data['event_title']}%").execute()
-            if res:
-                found_event = res.data[0]
+            candidates = await find_events_by_title(
+                user_id,
+                deletion_like_data["event_title"],
+                date=deletion_like_data["start_date"]
+            )
+            if candidates:
+                found_event = candidates[0]
+            else:
+                res = await storage.find_events(user_id, title=deletion_like_data["event_title"])
+                if res:
+                    found_event = res[0]
 
         # Или просто самое последнее
         else:
-            res = query.order("start_datetime", desc=True).limit(1).execute()
-            if res.data and len(res.data) > 0:
-                found_event = res.data[0]
-            else:
-                found_event = None
+            res = await storage.find_events(user_id, latest=True, limit=1)
+            if res:
+                found_event = res[0]
 
         if not found_event:
-            await message.reply("❌ Событие не найдено.")
+            reply.add("❌ Событие не найдено.")
             await state.clear()
-            await message.answer("Что дальше?", reply_markup=main_menu)
+            await reply.finish("Что дальше?", reply_markup=main_menu)
             return
 
         # Применяем изменения
@@ -525,51 +671,50 @@ async def handle_edit_event(message: Message, state: FSMContext):
             updated_fields["end_datetime"] = changes["end_datetime"]
 
         if not updated_fields:
-            await message.reply("❌ Нечего изменять.")
+            reply.add("❌ Нечего изменять.")
             await state.clear()
-            await message.answer("Что дальше?", reply_markup=main_menu)
+            await reply.finish("Что дальше?", reply_markup=main_menu)
             return
 
         # Показываем старые и новые значения
-        details = ""
+        details = []
         for key, new_val in updated_fields.items():
-            old_val = old_values.get(key, "не задано")
+            old_val = old_values.get(key)
             if key == "start_datetime":
-                old_val = old_val.split("T")[1][:5] if old_val else "??:??"
-                new_val_time = new_val.split("T")[1][:5] if "T" in new_val else new_val
-                details += f"🕐 Время: {old_val} → {new_val_time}\n"
+                details.append(f"🕐 Время: {format_time(old_val)} → {format_time(new_val)}")
             elif key == "event_title":
-                details += f"📌 Название: {old_val} → {new_val}\n"
+                details.append(f"📌 Название: {escape(old_val or 'не задано')} → {escape(new_val)}")
             elif key == "event_place":
-                details += f"📍 Место: {old_val or 'не задано'} → {new_val}\n"
+                details.append(f"📍 Место: {escape(old_val or 'не задано')} → {escape(new_val)}")
             elif key == "event_description":
-                details += f"📝 Описание: {old_val or 'не задано'} → {new_val}\n"
-
-        confirmation_msg = (
-            f"Будет изменено:\n\n"
-            f"Старые данные:\n"
-            f"• <b>{found_event['event_title']}</b>"
-            f" — {found_event['start_datetime'].split('T')[1][:5] if found_event['start_datetime'] else '??:??'}\n\n"
-            f"Новые значения:\n"
-            f"{details}\n"
-            f"Подтвердите изменение:"
-        )
+                details.append(f"📝 Описание: {escape(old_val or 'не задано')} → {escape(new_val)}")
 
-        await message.reply(confirmation_msg, parse_mode="HTML", reply_markup=confirm_kb)
+        reply.add(
+            "Будет изменено:\n\n"
+            "Старые данные:\n"
+            f"• <b>{escape(found_event['event_title'] or 'Без названия')}</b>"
+            f" — {format_time(found_event['start_datetime'])}",
+            parse_mode="HTML"
+        )
+        reply.add("Новые значения:\n" + "\n".join(details), parse_mode="HTML")
         await state.update_data(event_id=found_event["id"], updated_fields=updated_fields)
         await state.set_state(EventForm.confirming_edit)
+        await reply.finish("Подтвердите изменение:", reply_markup=confirm_kb)
 
+    except StateDataTooLarge:
+        # Ответит StateDataLimitMiddleware
+        raise
     except Exception as e:
-        await message.reply("❌ Ошибка при поиске события.")
+        reply.add("❌ Ошибка при поиске события.")
         print(f"Ошибка: {e}")
         await state.clear()
-        await message.answer("Что дальше?", reply_markup=main_menu)
+        await reply.finish("Что дальше?", reply_markup=main_menu)
 
 
 # --- Хендлер: Подтверждение редактирования ---
 async def confirm_edit(message: Message, state: FSMContext):
     if message.text == "❌ Нет":
-        await message.reply("❌ Изменение отменено.", reply_markup=main_menu)
+        await ReplyPipeline(message).finish("❌ Изменение отменено.", reply_markup=main_menu)
         await state.clear()
         return
 
@@ -577,18 +722,194 @@ async def confirm_edit(message: Message, state: FSMContext):
         data = await state.get_data()
         event_id = data.get("event_id")
         updated_fields = data.get("updated_fields", {})
+        reply = ReplyPipeline(message)
 
         try:
-            supabase_client.table("events").update(updated_fields).eq("id", event_id).execute()
-            await message.reply("✅ Событие успешно изменено!", reply_markup=main_menu)
+            await storage.update_event(event_id, updated_fields)
+            event_index.update(event_id, updated_fields)
+            feed_cache.invalidate(message.from_user.id)
+            reply.add("✅ Событие успешно изменено!")
         except Exception as e:
-            await message.reply("❌ Ошибка при сохранении изменений.")
+            reply.add("❌ Ошибка при сохранении изменений.")
             print(f"Ошибка: {e}")
 
         await state.clear()
-        await message.answer("Что дальше?", reply_markup=main_menu)
+        await reply.finish("Что дальше?", reply_markup=main_menu)
         return
 
     else:
         await message.reply("Пожалуйста, выберите: ✅ Да или ❌ Нет")
 
+
+# --- Массовые операции над событиями периода ---
+def describe_shift(minutes: int) -> str:
+    """60 → 'на 1 ч позже', -1470 → 'на 1 дн. 30 мин раньше'"""
+    days, rest = divmod(abs(minutes), 24 * 60)
+    hours, mins = divmod(rest, 60)
+    parts = []
+    if days:
+        parts.append(f"{days} дн.")
+    if hours:
+        parts.append(f"{hours} ч")
+    if mins:
+        parts.append(f"{mins} мин")
+    return f"на {' '.join(parts)} {'позже' if minutes > 0 else 'раньше'}"
+
+
+async def handle_bulk_operation(message: Message, state: FSMContext):
+    """Удаление, сдвиг или перенос всех событий периода ("удали всё на следующей неделе")"""
+    reply = ReplyPipeline(message)
+    await reply.progress("🔍 Определяю период и действие...")
+
+    op = await extract_bulk_operation(message.text)
+
+    if not op["action"] or not op["start_date"]:
+        reply.add("❌ Не удалось определить период или действие.")
+        await state.clear()
+        await reply.finish("Что дальше?", reply_markup=main_menu)
+        return
+
+    start_date = op["start_date"]
+    end_date = op["end_date"] or start_date
+
+    # Перенос на другую дату — это сдвиг на целое число дней
+    minutes = 0
+    if op["action"] == "shift":
+        minutes = op["shift_minutes"] or 0
+    elif op["action"] == "move" and op["target_date"]:
+        try:
+            minutes = (date.fromisoformat(op["target_date"]) - date.fromisoformat(start_date)).days * 24 * 60
+        except ValueError:
+            minutes = 0
+
+    if op["action"] != "delete" and not minutes:
+        reply.add("❌ Не удалось определить, на сколько перенести события.")
+        await state.clear()
+        await reply.finish("Что дальше?", reply_markup=main_menu)
+        return
+
+    try:
+        user_id = await storage.get_user_id(str(message.from_user.id))
+
+        if not user_id:
+            reply.add("❌ Пользователь не найден.")
+            await state.clear()
+            await reply.finish("Что дальше?", reply_markup=main_menu)
+            return
+
+        period_start = f"{start_date}T{op['start_time'] or '00:00'}:00"
+        period_end = f"{end_date}T{op['end_time'] + ':00' if op['end_time'] else '23:59:59'}"
+        events = await storage.find_events(user_id, start=period_start, end=period_end, limit=BULK_MAX_EVENTS + 1)
+
+        if not events:
+            period = start_date if start_date == end_date else f"период с {start_date} по {end_date}"
+            reply.add(f"❌ На {period} событий не найдено.")
+            await state.clear()
+            await reply.finish("Что дальше?", reply_markup=main_menu)
+            return
+
+        if len(events) > BULK_MAX_EVENTS:
+            reply.add(f"❌ В этом периоде больше {BULK_MAX_EVENTS} событий. Уточните период.")
+            await state.clear()
+            await reply.finish("Что дальше?", reply_markup=main_menu)
+            return
+
+        if op["action"] == "delete":
+            header = f"Будет удалено событий: {len(events)}"
+            question = "Удалить их все?"
+            next_state = EventForm.confirming_delete
+        else:
+            if op["action"] == "move":
+                target = date.fromisoformat(op["target_date"]).strftime("%d.%m.%Y")
+                header = f"Будет перенесено событий: {len(events)} — на {target}, время сохранится"
+            else:
+                header = f"Будет перенесено событий: {len(events)} — {describe_shift(minutes)}"
+            question = "Перенести их все?"
+            next_state = EventForm.confirming_shift
+
+        await state.update_data(
+            confirm_ids=[ev["id"] for ev in events],
+            confirm_header=header,
+            confirm_question=question,
+            shift_minutes=minutes
+        )
+        await state.set_state(next_state)
+        await show_confirm_page(reply, state, events=events)
+
+    except StateDataTooLarge:
+        # Ответит StateDataLimitMiddleware
+        raise
+    except Exception as e:
+        reply.add("❌ Ошибка при поиске событий.")
+        print(f"Ошибка: {e}")
+        await state.clear()
+        await reply.finish("Что дальше?", reply_markup=main_menu)
+
+
+async def confirm_shift(message: Message, state: FSMContext):
+    if message.text == "❌ Нет":
+        await ReplyPipeline(message).finish("❌ Перенос отменён.", reply_markup=main_menu)
+        await state.clear()
+        return
+
+    elif message.text in (PAGE_PREV, PAGE_NEXT):
+        await turn_confirm_page(message, state)
+        return
+
+    elif message.text == "✅ Да":
+        data = await state.get_data()
+        reply = ReplyPipeline(message)
+
+        try:
+            # Один запрос на все события вместо обновления по одному
+            rows = await storage.shift_events(data.get("confirm_ids", []), data.get("shift_minutes", 0))
+            for row in rows:
+                event_index.update(row["id"], {"start_datetime": row["start_datetime"]})
+            feed_cache.invalidate(message.from_user.id)
+            reply.add(f"✅ Перенесено событий: {len(rows)}.")
+        except Exception as e:
+            reply.add("❌ Ошибка при переносе событий.")
+            print(f"Ошибка: {e}")
+
+        await state.clear()
+        await reply.finish("Что дальше?", reply_markup=main_menu)
+        return
+
+    else:
+        await message.reply("Пожалуйста, выберите: ✅ Да или ❌ Нет")
+
+
+# --- Хендлер: кнопка устаревшей клавиатуры вне сценария ---
+async def stale_button_handler(message: Message):
+    # Текст кнопки ("✅ Да", "❌ Выйти из режима ...") не отдаём классификатору намерений —
+    # возвращаем главное меню вместо оставшейся клавиатуры сценария
+    await ReplyPipeline(message).finish(
+        "Это действие уже неактуально. Что дальше?", reply_markup=main_menu, force_keyboard=True
+    )
+
+
+# --- Хендлер: Свободный текст вне сценария ---
+INTENT_ROUTES = {
+    INTENT_ADD: (EventForm.waiting_for_event, handle_new_event),
+    INTENT_VIEW: (EventForm.waiting_for_period, handle_view_events),
+    INTENT_DELETE: (EventForm.waiting_for_delete, handle_delete_event),
+    INTENT_EDIT: (EventForm.waiting_for_edit, handle_edit_event),
+}
+
+
+async def handle_free_text(message: Message, state: FSMContext):
+    intent, confidence = classify_intent(message.text)
+
+    if intent is None:
+        # Неоднозначно — запоминаем текст и обработаем его после выбора действия
+        await state.update_data(pending_text=message.text, pending_text_at=time.time())
+        await ReplyPipeline(message).finish(
+            "🤔 Не совсем понял, что нужно сделать. Выберите действие — и я сразу обработаю ваше сообщение.",
+            reply_markup=main_menu
+        )
+        return
+
+    await drop_pending_text(state)
+    target_state, handler = INTENT_ROUTES[intent]
+    await state.set_state(target_state)
+    await handler(message, state)
@@ -0,0 +1,100 @@
+import math
+import re
+
+# --- Локальный классификатор намерений ---
+# Определяет по свободному тексту, что хочет пользователь: добавить, показать,
+# изменить или удалить событие. Без обращения к LLM: каждое намерение получает
+# сумму весов сработавших признаков (ключевые слова и регулярные выражения),
+# затем оценки переводятся в вероятности через softmax.
+
+INTENT_ADD = "add"
+INTENT_VIEW = "view"
+INTENT_DELETE = "delete"
+INTENT_EDIT = "edit"
+
+_TIME = r"\b\d{1,2}[:.]\d{2}\b|\bв\s+\d{1,2}\b"
+_DATE = (
+    r"\bсегодня\b|\bзавтра\b|\bпослезавтра\b|\bпонедельник\w*|\bвторник\w*|\bсред[ауы]\b|"
+    r"\bчетверг\w*|\bпятниц\w*|\bсуббот\w*|\bвоскресень\w*|\b\d{1,2}\s+(?:янв|фев|мар|апр|ма[йя]|июн|июл|авг|сен|окт|ноя|дек)\w*|"
+    r"\b\d{1,2}\.\d{1,2}(?:\.\d{2,4})?\b"
+)
+
+# (регулярное выражение, вес) для каждого намерения
+_FEATURES = {
+    INTENT_ADD: [
+        (r"\bдобав\w*|\bзапиш\w*|\bзанеси\w*|\bсоздай\w*|\bзапланируй\w*|\bнапомни\w*|\bпоставь\w*", 3.0),
+        (_TIME, 1.0),
+        (_DATE, 0.5),
+        (r"\bвстреч\w*|\bсозвон\w*|\bзвонок\b|\bпрезентаци\w*|\bлекци\w*|\bтренировк\w*|\bужин\w*|\bобед\w*|\bврач\w*", 0.5),
+        # Глаголы других действий говорят против добавления
+        (r"\bудал\w*|\bотмени\w*|\bперенес\w*|\bизмени\w*|\bпомен\w*|\bпокажи\w*", -2.0),
+    ],
+    INTENT_VIEW: [
+        (r"\?", 1.5),
+        (r"\bпокажи\w*|\bпосмотр\w*|\bчто\s+у\s+меня\b|\bкаки[ея]\b|\bчто\s+запланирован\w*|\bсписок\b|\bрасписани\w*", 2.5),
+        (r"\bдела\b|\bсвобод\w*|\bзанят\w*|\bнедел[еюя]\b|\bмесяц\w*", 1.0),
+    ],
+    INTENT_DELETE: [
+        (r"\bудал\w*|\bотмени\w*|\bотмен[аы]\b|\bубери\w*|\bсотри\w*", 3.0),
+        (r"\bне\s+будет\b|\bне\s+нужн\w*", 1.5),
+    ],
+    INTENT_EDIT: [
+        (r"\bперенес\w*|\bперенос\w*|\bизмени\w*|\bпомен\w*|\bсдвин\w*|\bпереимену\w*|\bисправ\w*", 3.0),
+        (r"\bвместо\b|\bпозже\b|\bраньше\b", 1.5),
+    ],
+}
+
+# Априорный сдвиг: утверждение с датой/временем без глаголов скорее всего — новое событие
+_BIAS = {INTENT_ADD: 0.3, INTENT_VIEW: 0.0, INTENT_DELETE: 0.0, INTENT_EDIT: 0.0}
+
+_COMPILED = {
+    intent: [(re.compile(pattern, re.IGNORECASE), weight) for pattern, weight in features]
+    for intent, features in _FEATURES.items()
+}
+
+# Операция над всем периодом, а не над одним событием: "все события завтра",
+# "все мои встречи", "всё на неделе", "всё с 21 на 23". Одиночное "все" в названии
+# ("созвон со всеми", "встреча всех отделов") к массовой операции не относится
+_BULK = re.compile(
+    r"\bвсе\s+(?:мои\s+)?(?:событи\w*|встреч\w*|дела|дел|мероприяти\w*|планы|записи)\b"
+    r"|\bвсе\s+(?:на|за|в|во|с|до|после|от|начиная|сегодня|завтра|послезавтра)\b",
+    re.IGNORECASE
+)
+
+# Ниже этих порогов считаем запрос неоднозначным и переспрашиваем
+MIN_SCORE = 1.0
+MIN_CONFIDENCE = 0.6
+
+
+def score_intents(text: str) -> dict:
+    """Сырые оценки по каждому намерению"""
+    text = (text or "").lower().replace("ё", "е")
+    scores = {}
+    for intent, features in _COMPILED.items():
+        score = _BIAS[intent]
+        for regex, weight in features:
+            if regex.search(text):
+                score += weight
+        scores[intent] = score
+    return scores
+
+
+def classify_intent(text: str):
+    """
+    Возвращает (намерение, уверенность) или (None, уверенность),
+    если текст неоднозначен и лучше уточнить у пользователя.
+    """
+    scores = score_intents(text)
+    exp_scores = {intent: math.exp(score) for intent, score in scores.items()}
+    total = sum(exp_scores.values())
+    best = max(scores, key=scores.get)
+    confidence = exp_scores[best] / total
+
+    if scores[best] < MIN_SCORE or confidence < MIN_CONFIDENCE:
+        return None, confidence
+    return best, confidence
+
+
+def is_bulk_request(text: str) -> bool:
+    """Просьба удалить или перенести все события периода"""
+    return bool(_BULK.search((text or "").lower().replace("ё", "е")))
@@ -19,6 +19,19 @@ confirm_kb = ReplyKeyboardMarkup(
     one_time_keyboard=True
 )
 
+# --- Подтверждение с листанием списка событий ---
+PAGE_PREV = "⬅️ Назад"
+PAGE_NEXT = "➡️ Далее"
+
+paged_confirm_kb = ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton(text=PAGE_PREV), KeyboardButton(text=PAGE_NEXT)],
+        [KeyboardButton(text="✅ Да"), KeyboardButton(text="❌ Нет")]
+    ],
+    resize_keyboard=True,
+    one_time_keyboard=False
+)
+
 # --- Клавиатура выхода из режима добавления ---
 exit_add_kb = ReplyKeyboardMarkup(
     keyboard=[
@@ -27,3 +40,9 @@ exit_add_kb = ReplyKeyboardMarkup(
     resize_keyboard=True,
     one_time_keyboard=False
 )
+
+# Кнопки клавиатур сценариев. Вне сценария (состояние сброшено, например, по
+# FSM_IDLE_TTL) такая кнопка означает оставшуюся на экране устаревшую клавиатуру
+SCENARIO_BUTTONS = frozenset(
+    button.text for kb in (confirm_kb, paged_confirm_kb, exit_add_kb) for row in kb.keyboard for button in row
+)
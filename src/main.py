@@ -3,24 +3,50 @@ load_dotenv()
 
 import asyncio
 from aiogram import Bot, Dispatcher, F
-from aiogram.filters import Command
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.filters import Command, StateFilter
 
-from config import TELEGRAM_BOT_TOKEN
+from config import (
+    TELEGRAM_BOT_TOKEN, DIGEST_TIME, FSM_IDLE_TTL, FSM_SWEEP_INTERVAL, FSM_MAX_DATA_BYTES,
+    PROFILE_ADMIN_IDS, PROFILE_ON_START, FEED_PORT, UPDATE_DEADLINE,
+    TRAFFIC_RECORD_PATH
+)
+from deadlines import DeadlineMiddleware
+from digest import digest_scheduler, cmd_digest_off, cmd_digest_on
+from feed import start_feed_server, cmd_feed
+from fsm_storage import ExpiringMemoryStorage, StateDataLimitMiddleware
+from keyboards import SCENARIO_BUTTONS
+from profiling import profiler, parse_profile_spec, cmd_profile, cmd_profile_dump
 from states import EventForm
+from traffic import TrafficRecorder
 from handlers import (
     cmd_start, add_event_handler, view_events_handler, exit_add_event_mode,
-    handle_new_event, handle_view_events, delete_event_handler, handle_delete_event,
-    confirm_delete, edit_event_handler, handle_edit_event, confirm_edit
+    handle_new_event, confirm_add, handle_view_events, delete_event_handler, handle_delete_event,
+    confirm_delete, edit_event_handler, handle_edit_event, confirm_edit, confirm_shift, stale_button_handler, handle_free_text
 )
 
 # --- Бот и диспетчер ---
 bot = Bot(token=TELEGRAM_BOT_TOKEN)
-dp = Dispatcher(storage=MemoryStorage())
+fsm_storage = ExpiringMemoryStorage(idle_ttl=FSM_IDLE_TTL, max_data_bytes=FSM_MAX_DATA_BYTES)
+dp = Dispatcher(storage=fsm_storage)
+# Запись трафика для воспроизведения (traffic.py) — снаружи дедлайна, чтобы попал и урезанный ответ
+if TRAFFIC_RECORD_PATH:
+    TrafficRecorder(TRAFFIC_RECORD_PATH).install(dp, bot)
+# Каждому сообщению — дедлайн на обработку (LLM и чтение из базы укладываются в него)
+dp.message.middleware(DeadlineMiddleware(UPDATE_DEADLINE))
+# Данные диалога больше FSM_MAX_DATA_BYTES — сообщение пользователю вместо падения хендлера
+dp.message.middleware(StateDataLimitMiddleware())
 
 # --- Регистрация хендлеров ---
 # Команда старт
 dp.message.register(cmd_start, Command("start"))
+dp.message.register(cmd_feed, Command("feed"))
+dp.message.register(cmd_digest_off, Command("digest_off"))
+dp.message.register(cmd_digest_on, Command("digest_on"))
+
+# Профилирование (только для администраторов)
+dp.message.register(cmd_profile, Command("profile"), F.from_user.id.in_(PROFILE_ADMIN_IDS))
+dp.message.register(cmd_profile_dump, Command("profile_dump"), F.from_user.id.in_(PROFILE_ADMIN_IDS))
+profiler.bind(dp.message.middleware)
 
 # Основные кнопки меню
 dp.message.register(add_event_handler, F.text == "📅 Добавить событие")
@@ -31,15 +57,59 @@ dp.message.register(edit_event_handler, F.text == "✏️ Изменить со
 # Обработчики состояний
 dp.message.register(exit_add_event_mode, EventForm.waiting_for_event, F.text == "❌ Выйти из режима добавления события")
 dp.message.register(handle_new_event, EventForm.waiting_for_event, F.text)
+dp.message.register(confirm_add, EventForm.confirming_add, F.text)
 dp.message.register(handle_view_events, EventForm.waiting_for_period, F.text)
 dp.message.register(handle_delete_event, EventForm.waiting_for_delete, F.text)
 dp.message.register(confirm_delete, EventForm.confirming_delete, F.text)
 dp.message.register(handle_edit_event, EventForm.waiting_for_edit, F.text)
 dp.message.register(confirm_edit, EventForm.confirming_edit, F.text)
+dp.message.register(confirm_shift, EventForm.confirming_shift, F.text)
+
+# Кнопки сценариев, оставшиеся на экране после сброса состояния
+dp.message.register(stale_button_handler, StateFilter(None), F.text.in_(SCENARIO_BUTTONS))
+
+# Свободный текст вне сценария — определяем действие без нажатия кнопки
+dp.message.register(handle_free_text, StateFilter(None), F.text, ~F.text.startswith("/"))
+
+# --- Фоновые задачи ---
+# Держим ссылки на задачи: цикл событий хранит только слабые, и задачу без
+# ссылок может собрать сборщик мусора посреди работы
+background_tasks = set()
+
+
+def _on_background_done(task: asyncio.Task):
+    background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Фоновая задача {task.get_name()} завершилась с ошибкой: {task.exception()!r}")
+
+
+def start_background(coro, name: str) -> asyncio.Task:
+    task = asyncio.create_task(coro, name=name)
+    background_tasks.add(task)
+    task.add_done_callback(_on_background_done)
+    return task
+
+
+async def stop_background():
+    for task in list(background_tasks):
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+
 
 # --- Запуск бота ---
 async def main():
-    await dp.start_polling(bot)
+    start_background(fsm_storage.sweep_forever(FSM_SWEEP_INTERVAL), "fsm_sweep")
+    if PROFILE_ON_START:
+        updates, seconds = parse_profile_spec(PROFILE_ON_START)
+        profiler.start(updates=updates, seconds=seconds)
+    if DIGEST_TIME:
+        start_background(digest_scheduler(bot), "digest_scheduler")
+    if FEED_PORT:
+        await start_feed_server()
+    try:
+        await dp.start_polling(bot)
+    finally:
+        await stop_background()
 
 if __name__ == "__main__":
     asyncio.run(main())
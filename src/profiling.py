@@ -0,0 +1,235 @@
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import time
+from contextvars import ContextVar
+from datetime import datetime
+
+from aiogram import BaseMiddleware
+from aiogram.types import FSInputFile, Message
+
+from config import PROFILE_DIR
+
+# --- Профилирование хендлеров по запросу ---
+# Пока профилирование выключено, middleware не зарегистрирована и накладных
+# расходов нет. После /profile она подключается к dp.message на следующие
+# N сообщений или на заданное время, затем отключается и пишет отчёт в файл.
+#
+# Хендлер выполняется по шагам между await'ами. cProfile включается только
+# на время шагов профилируемого хендлера и задач, которые он запустил
+# (asyncio.wait_for в within_deadline, asyncio.gather): пока профилирование
+# включено, фабрика задач цикла оборачивает задачи, созданные из хендлера, —
+# они наследуют его контекст. Чужие корутины в отчёт не попадают. Сумма
+# длительности шагов — время на CPU, остальное от wall time — ожидание
+# (LLM, база, Telegram API). Задачи, которые живут дольше хендлера, учитываются
+# в профиле, но не во времени CPU.
+
+# Профилируемый вызов хендлера; дочерние задачи наследуют его через контекст
+_active_call: ContextVar = ContextVar("profiled_call", default=None)
+
+
+class _HandlerStats:
+    def __init__(self):
+        self.profile = cProfile.Profile()
+        self.calls = 0
+        self.wall = 0.0
+        self.busy = 0.0
+        self.max_wall = 0.0
+
+    def add(self, wall: float, busy: float):
+        self.calls += 1
+        self.wall += wall
+        self.busy += busy
+        self.max_wall = max(self.max_wall, wall)
+
+
+class _ProfiledCall:
+    """Прогоняет корутину хендлера по шагам, замеряя и профилируя только её собственные шаги и шаги её задач"""
+
+    def __init__(self, coro, profile: cProfile.Profile):
+        self.coro = coro
+        self.profile = profile
+        self.busy = 0.0
+
+    def __await__(self):
+        value, error = None, None
+        while True:
+            started = time.perf_counter()
+            self.profile.enable()
+            try:
+                if error is not None:
+                    step = self.coro.throw(error)
+                else:
+                    step = self.coro.send(value)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                self.profile.disable()
+                self.busy += time.perf_counter() - started
+            try:
+                value, error = (yield step), None
+            except BaseException as e:
+                value, error = None, e
+
+    async def child(self, coro):
+        """Корутина задачи, созданной хендлером: профилируется в тот же профиль"""
+        call = _ProfiledCall(coro, self.profile)
+        try:
+            return await call
+        finally:
+            self.busy += call.busy
+
+
+class HandlerProfiler(BaseMiddleware):
+    def __init__(self):
+        self.middleware_manager = None
+        self.stats = {}
+        self.remaining_updates = 0
+        self.until = None
+        self.started_at = None
+        self.last_report = None
+        self._stop_task = None
+        self._loop = None
+        self._previous_factory = None
+
+    @property
+    def active(self) -> bool:
+        return self.started_at is not None
+
+    def bind(self, middleware_manager):
+        """Запоминает, куда подключаться (обычно dp.message.middleware)"""
+        self.middleware_manager = middleware_manager
+
+    def start(self, updates: int = 0, seconds: float = 0):
+        if self.active:
+            self.stop()
+        self.stats = {}
+        self.remaining_updates = updates
+        self.until = time.monotonic() + seconds if seconds else None
+        self.started_at = datetime.now()
+        self.middleware_manager.register(self)
+        self._loop = asyncio.get_running_loop()
+        self._previous_factory = self._loop.get_task_factory()
+        self._loop.set_task_factory(self._task_factory)
+        if seconds:
+            self._stop_task = self._loop.call_later(seconds, self.stop)
+
+    def stop(self):
+        """Отключает middleware и пишет отчёт; возвращает путь к файлу"""
+        if not self.active:
+            return None
+        self.middleware_manager.unregister(self)
+        self._loop.set_task_factory(self._previous_factory)
+        self._loop = self._previous_factory = None
+        if self._stop_task:
+            self._stop_task.cancel()
+            self._stop_task = None
+        self.last_report = self._write_report()
+        self.started_at = None
+        return self.last_report
+
+    def _task_factory(self, loop, coro, **kwargs):
+        """Задачи, созданные из профилируемого хендлера, профилируются вместе с ним"""
+        call = _active_call.get()
+        if call is not None:
+            coro = call.child(coro)
+        if self._previous_factory is not None:
+            return self._previous_factory(loop, coro, **kwargs)
+        return asyncio.Task(coro, loop=loop, **kwargs)
+
+    async def __call__(self, handler, event, data):
+        name = data["handler"].callback.__name__
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = _HandlerStats()
+
+        started = time.perf_counter()
+        call = _ProfiledCall(handler(event, data), stats.profile)
+        token = _active_call.set(call)
+        try:
+            return await call
+        finally:
+            _active_call.reset(token)
+            stats.add(time.perf_counter() - started, call.busy)
+            if self.remaining_updates:
+                self.remaining_updates -= 1
+                if self.remaining_updates == 0:
+                    self.stop()
+
+    def _write_report(self) -> str:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"profile_{datetime.now():%Y%m%d_%H%M%S}.txt")
+
+        out = io.StringIO()
+        out.write(f"Профилирование с {self.started_at:%Y-%m-%d %H:%M:%S} по {datetime.now():%Y-%m-%d %H:%M:%S}\n")
+        out.write("Учтены шаги хендлера и запущенных им задач (wait_for, gather); CPU — сумма шагов, await — ожидание\n\n")
+        out.write(f"{'хендлер':<28}{'вызовов':>8}{'wall, мс':>12}{'max, мс':>12}{'CPU, мс':>12}{'await, мс':>12}\n")
+        for name, stats in sorted(self.stats.items(), key=lambda item: item[1].wall, reverse=True):
+            avg_wall = stats.wall / stats.calls * 1000
+            avg_busy = stats.busy / stats.calls * 1000
+            out.write(
+                f"{name:<28}{stats.calls:>8}{avg_wall:>12.1f}{stats.max_wall * 1000:>12.1f}"
+                f"{avg_busy:>12.1f}{avg_wall - avg_busy:>12.1f}\n"
+            )
+
+        for name, stats in self.stats.items():
+            out.write(f"\n\n===== {name}: самые затратные пути вызовов =====\n")
+            report = pstats.Stats(stats.profile, stream=out)
+            report.strip_dirs().sort_stats("cumulative").print_stats(25)
+            report.print_callers(10)
+
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(out.getvalue())
+        print(f"Отчёт профилирования: {path}")
+        return path
+
+
+# --- Общий экземпляр профилировщика ---
+profiler = HandlerProfiler()
+
+
+def parse_profile_spec(spec: str):
+    """'20' → (20 сообщений, 0), '60s' / '5m' → (0, секунды)"""
+    spec = spec.strip().lower()
+    if spec.endswith("s"):
+        updates, seconds = 0, float(spec[:-1])
+    elif spec.endswith("m"):
+        updates, seconds = 0, float(spec[:-1]) * 60
+    else:
+        updates, seconds = int(spec), 0
+    # С нулевым, отрицательным или бесконечным пределом профилирование никогда не остановилось бы
+    if not (updates > 0 or 0 < seconds < float("inf")):
+        raise ValueError(f"Предел профилирования должен быть положительным: {spec}")
+    return updates, seconds
+
+
+# --- Хендлеры админских команд ---
+async def cmd_profile(message: Message):
+    args = (message.text or "").split(maxsplit=1)
+    spec = args[1] if len(args) > 1 else "20"
+
+    if spec.strip() == "off":
+        path = profiler.stop()
+        await message.reply(f"⏹ Профилирование остановлено. Отчёт: {path}" if path else "Профилирование не запущено.")
+        return
+
+    try:
+        updates, seconds = parse_profile_spec(spec)
+    except ValueError:
+        await message.reply("Использование: /profile 20 | /profile 60s | /profile 5m | /profile off")
+        return
+
+    profiler.start(updates=updates, seconds=seconds)
+    target = f"{updates} сообщений" if updates else f"{int(seconds)} с"
+    await message.reply(f"▶️ Профилирование включено на {target}. Отчёт: /profile_dump")
+
+
+async def cmd_profile_dump(message: Message):
+    if profiler.active:
+        profiler.stop()
+    if not profiler.last_report:
+        await message.reply("Отчётов пока нет.")
+        return
+    await message.reply_document(FSInputFile(profiler.last_report))
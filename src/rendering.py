@@ -0,0 +1,170 @@
+import html
+import re
+
+# --- Отрисовка событий для сообщений Telegram ---
+# Все списки событий (просмотр, подтверждения, дайджест) форматируются здесь.
+# Пользовательский текст (название, место, описание) экранируется под HTML
+# ровно один раз, строки собираются через join, а длинный ответ режется на
+# несколько сообщений только по границам событий.
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+BLOCK_SEPARATOR = "\n\n"
+
+# Даты из базы приходят как 'YYYY-MM-DDTHH:MM:SS': их переставляем срезами строки,
+# остальные варианты разбираем скомпилированным выражением — без datetime.fromisoformat
+# и strftime на каждое событие
+_ISO_DATETIME = re.compile(r"(\d{4})-(\d{2})-(\d{2})(?:[T ](\d{2}):(\d{2}))?")
+
+UNKNOWN_DATETIME = "??.??.???? ??:??"
+UNKNOWN_TIME = "??:??"
+
+_TAG = re.compile(r"<[^>]*>")
+
+
+def escape(text) -> str:
+    """Экранирует текст для parse_mode=HTML"""
+    return html.escape(str(text), quote=False)
+
+
+def strip_html(text: str) -> str:
+    """HTML-разметка → простой текст (теги убираются, сущности раскрываются)"""
+    return html.unescape(_TAG.sub("", text))
+
+
+def _is_iso(value: str) -> bool:
+    return (
+        len(value) >= 16 and value[4] == "-" and value[7] == "-"
+        and value[10] in "T " and value[13] == ":"
+    )
+
+
+def format_datetime(value) -> str:
+    """'2026-10-20T10:00:00' → '20.10.2026 10:00'"""
+    if value and _is_iso(value):
+        return f"{value[8:10]}.{value[5:7]}.{value[:4]} {value[11:16]}"
+    match = _ISO_DATETIME.match(value) if value else None
+    if not match:
+        return escape(value) if value else UNKNOWN_DATETIME
+    year, month, day, hour, minute = match.groups()
+    if hour is None:
+        return f"{day}.{month}.{year}"
+    return f"{day}.{month}.{year} {hour}:{minute}"
+
+
+def format_time(value) -> str:
+    """'2026-10-20T10:00:00' → '10:00'"""
+    if value and _is_iso(value):
+        return value[11:16]
+    match = _ISO_DATETIME.match(value) if value else None
+    if not match or match.group(4) is None:
+        return UNKNOWN_TIME
+    return f"{match.group(4)}:{match.group(5)}"
+
+
+def render_event(ev: dict) -> str:
+    """Блок события для списка: • <b>Название</b> — ДД.ММ.ГГГГ ЧЧ:ММ, место и описание"""
+    place = ev.get("event_place")
+    desc = ev.get("event_description")
+    return "".join((
+        "• <b>", escape(ev.get("event_title") or "Без названия"), "</b> — ",
+        format_datetime(ev.get("start_datetime")),
+        "\n📍 " + escape(place) if place else "",
+        "\n📝 " + escape(desc) if desc else "",
+    ))
+
+
+def render_events(events) -> list:
+    return [render_event(ev) for ev in events]
+
+
+# --- Разбиение на сообщения ---
+def message_length(text: str) -> int:
+    """Длина так, как её считает Telegram — в единицах UTF-16 (эмодзи занимают две)"""
+    return len(text.encode("utf-16-le")) // 2
+
+
+# Куски HTML-текста, которые нельзя разрывать: тег, сущность (&amp;), перенос,
+# пробелы; остальной текст — по символу
+_ATOM = re.compile(r"<[^>]*>|&#?\w+;|\n| +|[^<&\n ]")
+_TAG_NAME = re.compile(r"</?\s*([\w-]+)")
+
+
+def _open_tags(stack: list, atom: str) -> list:
+    """Стек открытых тегов [(имя, открывающий тег)] после atom"""
+    if not atom.startswith("<") or atom.endswith("/>"):
+        return stack
+    match = _TAG_NAME.match(atom)
+    if not match:
+        return stack
+    name = match.group(1).lower()
+    if not atom.startswith("</"):
+        return [*stack, (name, atom)]
+    for i in range(len(stack) - 1, -1, -1):
+        if stack[i][0] == name:
+            return stack[:i] + stack[i + 1:]
+    return stack
+
+
+def _closing(stack: list) -> str:
+    return "".join(f"</{name}>" for name, _ in reversed(stack))
+
+
+def _split_block(block: str, limit: int) -> list:
+    """
+    Блок, не влезающий в одно сообщение, делится по строкам, длинная строка —
+    по пробелам, без пробелов — по символам. Теги и сущности не разрываются:
+    открытые на разрыве теги закрываются в конце части и открываются заново
+    в начале следующей, иначе Telegram отклонит разметку.
+    """
+    atoms = _ATOM.findall(block)
+    lengths = [message_length(atom) for atom in atoms]
+    pieces, start, opened = [], 0, []
+    while start < len(atoms):
+        prefix = "".join(tag for _, tag in opened)
+        size, stack = message_length(prefix), opened
+        newline = space = None
+        end = start
+        while end < len(atoms):
+            after = _open_tags(stack, atoms[end])
+            if end > start and size + lengths[end] + message_length(_closing(after)) > limit:
+                break
+            size, stack = size + lengths[end], after
+            end += 1
+            if atoms[end - 1] == "\n":
+                newline = (end, stack)
+            elif atoms[end - 1].startswith(" "):
+                space = (end, stack)
+        if end < len(atoms):
+            # Разрыв — по последнему переносу строки, иначе по пробелу
+            end, stack = newline or space or (end, stack)
+        body = "".join(atoms[start:end]).rstrip("\n ")
+        pieces.append(prefix + body + _closing(stack))
+        start, opened = end, stack
+        while start < len(atoms) and atoms[start][0] in "\n ":
+            start += 1
+    return pieces
+
+
+def split_message(blocks, limit: int = TELEGRAM_MESSAGE_LIMIT, separator: str = BLOCK_SEPARATOR) -> list:
+    """
+    Собирает блоки (заголовок, события, итог) в сообщения не длиннее limit.
+    Разрыв между сообщениями приходится только на границу блоков.
+    """
+    separator_length = message_length(separator)
+    messages, current, size = [], [], 0
+    for block in blocks:
+        block_length = message_length(block)
+        if block_length <= limit:
+            pieces = ((block, block_length),)
+        else:
+            pieces = [(piece, message_length(piece)) for piece in _split_block(block, limit)]
+        for piece, piece_length in pieces:
+            extra = piece_length + (separator_length if current else 0)
+            if current and size + extra > limit:
+                messages.append(separator.join(current))
+                current, size, extra = [], 0, piece_length
+            current.append(piece)
+            size += extra
+    if current:
+        messages.append(separator.join(current))
+    return messages
@@ -0,0 +1,154 @@
+import asyncio
+from collections import OrderedDict
+from contextvars import ContextVar
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import Message, ReplyKeyboardMarkup
+
+from rendering import escape, render_events, split_message, strip_html
+
+# --- Конвейер ответов ---
+# Вместо отдельных сообщений "🔍 Ищу...", результат и "Что дальше?" копим
+# части ответа и отправляем их одним вызовом: редактируем сообщение о ходе
+# обработки на месте или, если нужна reply-клавиатура (Telegram не даёт
+# прикрепить её через editMessageText), отправляем одно объединённое сообщение.
+# Ответ длиннее лимита Telegram делится на несколько сообщений по границам частей.
+
+# Постоянная reply-клавиатура, которая сейчас показана в чате (chat_id -> markup).
+# Если нужная клавиатура уже на экране, её не надо отправлять заново,
+# и итоговый ответ можно отредактировать на месте. Это только предположение:
+# клиент мог потерять клавиатуру (очистка истории), поэтому /start и выход из
+# режима отправляют её всегда (finish(force_keyboard=True)). Хранятся последние
+# _KEYBOARD_CACHE_SIZE чатов — для вытесненного чата клавиатура просто уйдёт ещё раз.
+_KEYBOARD_CACHE_SIZE = 10000
+_shown_keyboards = OrderedDict()
+
+
+def _remember_keyboard(chat_id: int, markup):
+    _shown_keyboards[chat_id] = markup
+    _shown_keyboards.move_to_end(chat_id)
+    while len(_shown_keyboards) > _KEYBOARD_CACHE_SIZE:
+        _shown_keyboards.popitem(last=False)
+
+# Не больше стольких сообщений в одном ответе. Длинный список событий
+# обрезается с подсказкой уточнить период: сотни сообщений подряд упираются
+# в лимит Telegram на один чат (429), и читать их всё равно никто не будет
+MAX_REPLY_MESSAGES = 5
+
+# Последний конвейер, созданный при обработке текущего сообщения:
+# по нему middleware дедлайнов отправляет частичный ответ
+current_reply: ContextVar = ContextVar("current_reply", default=None)
+
+
+class ReplyPipeline:
+    def __init__(self, message: Message):
+        self.message = message
+        self._status = None
+        self._parts = []
+        # Границы списка событий в _parts: при обрезке длинного ответа сокращается только он
+        self._events_span = None
+        current_reply.set(self)
+
+    async def progress(self, text: str):
+        """Отправляет (или обновляет) сообщение о ходе обработки"""
+        if self._status is None:
+            self._status = await self.message.reply(text)
+        else:
+            await self._edit_status(text)
+
+    def add(self, text: str, parse_mode: str = None):
+        """Добавляет часть итогового ответа; обычный текст экранируется под HTML"""
+        if not text:
+            return
+        self._parts.append(text if parse_mode == "HTML" else escape(text))
+
+    def add_events(self, events):
+        """Добавляет события отдельными частями — длинный список делится между ними"""
+        start = len(self._parts)
+        self._parts.extend(render_events(events))
+        self._events_span = (start, len(self._parts))
+
+    def discard(self):
+        """Отбрасывает накопленные, ещё не отправленные части ответа"""
+        self._parts = []
+        self._events_span = None
+
+    async def finish(self, text: str = None, parse_mode: str = None, reply_markup=None, force_keyboard: bool = False):
+        """
+        Отправляет все накопленные части одним сообщением (или несколькими, если не влезают).
+        force_keyboard=True — отправить reply_markup, даже если она считается уже показанной.
+        """
+        self.add(text, parse_mode)
+        messages = split_message(self._parts)
+        if len(messages) > MAX_REPLY_MESSAGES:
+            messages = self._truncated()
+        self.discard()
+        if not messages:
+            return
+
+        chat_id = self.message.chat.id
+        if not force_keyboard and reply_markup is not None and _shown_keyboards.get(chat_id) is reply_markup:
+            _shown_keyboards.move_to_end(chat_id)
+            reply_markup = None
+
+        # Первое сообщение заменяет сообщение о ходе обработки, клавиатура — у последнего
+        for i, body in enumerate(messages):
+            markup = reply_markup if i == len(messages) - 1 else None
+            if i == 0 and self._status is not None and not isinstance(markup, ReplyKeyboardMarkup):
+                if await self._edit_status(body, markup):
+                    continue
+            await self._send(body, markup)
+
+    def _truncated(self) -> list:
+        """Сообщения ответа, в котором список событий сокращён до MAX_REPLY_MESSAGES"""
+        if self._events_span is None:
+            messages = split_message(self._parts)
+            return messages[:MAX_REPLY_MESSAGES - 1] + messages[-1:]
+
+        start, end = self._events_span
+        head, events, tail = self._parts[:start], self._parts[start:end], self._parts[end:]
+
+        def build(shown: int) -> list:
+            note = f"…и ещё событий: {len(events) - shown}. Уточните период, чтобы увидеть остальные."
+            return split_message([*head, *events[:shown], note, *tail])
+
+        # Сколько событий помещается — двоичным поиском, без перебора по одному
+        low, high = 0, len(events) - 1
+        while low < high:
+            middle = (low + high + 1) // 2
+            if len(build(middle)) <= MAX_REPLY_MESSAGES:
+                low = middle
+            else:
+                high = middle - 1
+        messages = build(low)
+        return messages[:MAX_REPLY_MESSAGES - 1] + messages[-1:] if len(messages) > MAX_REPLY_MESSAGES else messages
+
+    async def _reply(self, text: str, parse_mode, reply_markup):
+        try:
+            await self.message.reply(text, parse_mode=parse_mode, reply_markup=reply_markup)
+        except TelegramRetryAfter as e:
+            # Лимит на чат: Telegram говорит, сколько подождать — ждём и повторяем один раз
+            await asyncio.sleep(e.retry_after)
+            await self.message.reply(text, parse_mode=parse_mode, reply_markup=reply_markup)
+
+    async def _edit_status(self, text: str, reply_markup=None) -> bool:
+        try:
+            await self._status.edit_text(text, parse_mode="HTML", reply_markup=reply_markup)
+            return True
+        except TelegramBadRequest as e:
+            # Сообщение слишком старое, удалено или текст не изменился
+            print(f"Не удалось отредактировать сообщение: {e}")
+            return False
+
+    async def _send(self, text: str, reply_markup):
+        try:
+            await self._reply(text, "HTML", reply_markup)
+        except TelegramBadRequest as e:
+            # Telegram не принял разметку — лучше ответ без форматирования, чем никакого
+            print(f"Не удалось отправить сообщение с разметкой: {e}")
+            await self._reply(strip_html(text), None, reply_markup)
+        if isinstance(reply_markup, ReplyKeyboardMarkup):
+            if reply_markup.one_time_keyboard:
+                _shown_keyboards.pop(self.message.chat.id, None)
+            else:
+                _remember_keyboard(self.message.chat.id, reply_markup)
@@ -0,0 +1,203 @@
+import re
+import time
+from collections import OrderedDict, defaultdict
+
+from config import SEARCH_INDEX_MAX_USERS, SEARCH_INDEX_TTL
+
+# --- Поисковый индекс по названиям и местам событий ---
+# Держим в памяти по каждому пользователю нормализованные токены (с лёгким
+# стеммингом) и триграммы названий/мест, чтобы находить "встречу с командой"
+# по запросу "встреча с командой" без похода в базу.
+# Индекс пользователя живёт не дольше ttl секунд (потом перечитывается из базы,
+# чтобы увидеть записи других реплик и правки в обход бота), а в памяти
+# держатся только max_users последних активных пользователей.
+
+_TOKEN_RE = re.compile(r"[0-9a-zа-я]+")
+
+# Окончания отсортированы по убыванию длины — отрезаем самое длинное подходящее
+_RU_ENDINGS = sorted([
+    "иями", "ями", "ами", "ого", "его", "ому", "ему", "ыми", "ими", "ией", "ием",
+    "ой", "ей", "ий", "ый", "ая", "яя", "ое", "ее", "ую", "юю", "ом", "ем",
+    "ах", "ях", "ов", "ев", "ию", "ия", "ие",
+    "а", "я", "о", "е", "у", "ю", "ы", "и", "ь", "й",
+], key=len, reverse=True)
+
+_STOP_WORDS = {"с", "со", "в", "во", "на", "к", "ко", "по", "и", "у", "о", "об", "за", "для", "от", "до"}
+
+MIN_SCORE = 0.35
+
+
+def normalize(text: str) -> list:
+    """Разбивает текст на токены в нижнем регистре (ё → е), без стоп-слов"""
+    if not text:
+        return []
+    text = text.lower().replace("ё", "е")
+    return [t for t in _TOKEN_RE.findall(text) if t not in _STOP_WORDS]
+
+
+def stem(token: str) -> str:
+    """Лёгкий стемминг: отрезает типичное русское окончание, оставляя основу ≥ 3 символов"""
+    for ending in _RU_ENDINGS:
+        if token.endswith(ending) and len(token) - len(ending) >= 3:
+            return token[:-len(ending)]
+    return token
+
+
+def trigrams(stems) -> set:
+    """Триграммы по основам с пробелами по краям, как в pg_trgm"""
+    grams = set()
+    for s in stems:
+        padded = f"  {s} "
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+
+class _Doc:
+    __slots__ = ("event_id", "title", "place", "start_datetime", "stems", "grams")
+
+    def __init__(self, event_id, title, place, start_datetime):
+        self.event_id = event_id
+        self.title = title
+        self.place = place
+        self.start_datetime = start_datetime.replace(" ", "T") if start_datetime else None
+        self.stems = {stem(t) for t in normalize(title) + normalize(place)}
+        self.grams = trigrams(self.stems)
+
+
+class _UserIndex:
+    def __init__(self):
+        self.docs = {}
+        self.postings = defaultdict(set)
+        self.loaded_at = time.monotonic()
+
+    def add(self, doc: _Doc):
+        self.remove(doc.event_id)
+        self.docs[doc.event_id] = doc
+        for g in doc.grams:
+            self.postings[g].add(doc.event_id)
+
+    def remove(self, event_id):
+        doc = self.docs.pop(event_id, None)
+        if not doc:
+            return
+        for g in doc.grams:
+            ids = self.postings.get(g)
+            if ids is not None:
+                ids.discard(event_id)
+                if not ids:
+                    del self.postings[g]
+
+
+class EventSearchIndex:
+    """
+    Инкрементальный индекс событий по пользователям.
+    Индекс пользователя заполняется через load(), между загрузками его
+    поддерживают в актуальном состоянии upsert()/remove() на путях записи.
+    Через ttl секунд после загрузки is_loaded() возвращает False — индекс
+    перечитывается; сверх max_users вытесняются давно не искавшие пользователи.
+    """
+
+    def __init__(self, max_users: int = 1000, ttl: float = 300):
+        self.max_users = max_users
+        self.ttl = ttl
+        self._users = OrderedDict()
+        self._owners = {}
+
+    def is_loaded(self, user_id) -> bool:
+        user_index = self._users.get(user_id)
+        return user_index is not None and time.monotonic() - user_index.loaded_at < self.ttl
+
+    def load(self, user_id, events):
+        """Полностью (пере)заполняет индекс пользователя списком событий из базы"""
+        self._drop(user_id)
+        self._users[user_id] = _UserIndex()
+        for ev in events:
+            self.upsert(user_id, ev)
+        while len(self._users) > self.max_users:
+            self._drop(next(iter(self._users)))
+
+    def _drop(self, user_id):
+        user_index = self._users.pop(user_id, None)
+        if user_index is None:
+            return
+        for event_id in user_index.docs:
+            self._owners.pop(event_id, None)
+
+    def upsert(self, user_id, event: dict):
+        """Добавляет или обновляет событие; пропускается, если индекс пользователя не загружен"""
+        user_index = self._users.get(user_id)
+        if user_index is None:
+            return
+        user_index.add(_Doc(
+            event["id"],
+            event.get("event_title"),
+            event.get("event_place"),
+            event.get("start_datetime"),
+        ))
+        self._owners[event["id"]] = user_id
+
+    def update(self, event_id, fields: dict):
+        """Применяет изменённые поля к уже проиндексированному событию"""
+        user_id = self._owners.get(event_id)
+        if user_id is None:
+            return
+        doc = self._users[user_id].docs.get(event_id)
+        if doc is None:
+            return
+        self.upsert(user_id, {
+            "id": event_id,
+            "event_title": fields.get("event_title", doc.title),
+            "event_place": fields.get("event_place", doc.place),
+            "start_datetime": fields.get("start_datetime", doc.start_datetime),
+        })
+
+    def remove(self, event_ids):
+        for event_id in event_ids:
+            user_id = self._owners.pop(event_id, None)
+            if user_id is not None:
+                self._users[user_id].remove(event_id)
+
+    def search(self, user_id, query: str, date: str = None, exact_datetime: str = None,
+               limit: int = 5, min_score: float = MIN_SCORE) -> list:
+        """
+        Возвращает [(event_id, score), ...] по убыванию score.
+        score — смесь доли совпавших основ запроса и коэффициента Дайса по триграммам.
+        date ("YYYY-MM-DD") и exact_datetime ("YYYY-MM-DDTHH:MM:SS") сужают выдачу.
+        """
+        user_index = self._users.get(user_id)
+        if not user_index:
+            return []
+        self._users.move_to_end(user_id)
+
+        q_stems = {stem(t) for t in normalize(query)}
+        q_grams = trigrams(q_stems)
+        if not q_grams:
+            return []
+
+        # Кандидаты — только документы, делящие с запросом хотя бы одну триграмму
+        overlap = defaultdict(int)
+        for g in q_grams:
+            for event_id in user_index.postings.get(g, ()):
+                overlap[event_id] += 1
+
+        scored = []
+        for event_id, common in overlap.items():
+            doc = user_index.docs[event_id]
+            dt = doc.start_datetime or ""
+            if date and not dt.startswith(date):
+                continue
+            if exact_datetime and dt[:16] != exact_datetime[:16]:
+                continue
+            dice = 2 * common / (len(q_grams) + len(doc.grams))
+            stem_hit = len(q_stems & doc.stems) / len(q_stems)
+            score = 0.5 * stem_hit + 0.5 * dice
+            if score >= min_score:
+                scored.append((event_id, score))
+
+        scored.sort(key=lambda item: item[1], reverse=True)
+        return scored[:limit]
+
+
+# --- Общий экземпляр индекса для хендлеров ---
+event_index = EventSearchIndex(max_users=SEARCH_INDEX_MAX_USERS, ttl=SEARCH_INDEX_TTL)
@@ -0,0 +1,416 @@
+import asyncio
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import defaultdict
+
+from deadlines import within_deadline
+from config import STORAGE_BACKEND, SUPABASE_URL, SUPABASE_KEY, SQLITE_PATH
+
+# --- Хранилище пользователей и событий ---
+# Хендлеры работают только с интерфейсом Storage; конкретный бэкенд
+# (Supabase или локальный SQLite) выбирается переменной STORAGE_BACKEND.
+# Все методы асинхронные: блокирующие вызовы клиентов уходят в поток.
+# Чтение ограничено бюджетом времени сообщения (deadlines.py), запись — нет.
+
+EVENT_FIELDS = (
+    "event_title", "event_description", "start_datetime",
+    "end_datetime", "event_place", "event_weekly"
+)
+
+# PostgREST по умолчанию отдаёт не больше 1000 строк за запрос
+PAGE_SIZE = 1000
+
+
+def normalize_datetime(value):
+    """Приводит 'YYYY-MM-DD HH:MM' и подобное к 'YYYY-MM-DDTHH:MM:SS'"""
+    if not value:
+        return None
+    value = value.replace(" ", "T", 1)
+    if len(value) == 16:
+        value += ":00"
+    return value
+
+
+class Storage(ABC):
+    @abstractmethod
+    async def get_user_id(self, telegram_id: str):
+        """id пользователя по telegram_id или None"""
+
+    @abstractmethod
+    async def get_or_create_user_id(self, telegram_id: str):
+        """id пользователя по telegram_id; создаёт пользователя, если его нет"""
+
+    @abstractmethod
+    async def insert_events(self, events: list) -> list:
+        """Сохраняет события одним запросом и возвращает сохранённые строки (с id)"""
+
+    async def insert_event(self, event: dict) -> dict:
+        """Сохраняет событие и возвращает сохранённую строку (с id)"""
+        return (await self.insert_events([event]))[0]
+
+    @abstractmethod
+    async def find_events(self, user_id, start: str = None, end: str = None, exact: str = None,
+                          title: str = None, latest: bool = False, limit: int = None) -> list:
+        """
+        События пользователя с start_datetime в [start, end] (ISO-строки),
+        ровно в exact и/или с подстрокой title в названии без учёта регистра.
+        По умолчанию по возрастанию времени; latest=True — сначала последние.
+        """
+
+    @abstractmethod
+    async def get_events(self, event_ids) -> list:
+        """События по списку id"""
+
+    @abstractmethod
+    async def list_index_rows(self, user_id) -> list:
+        """id, название, место и время всех событий пользователя — для поискового индекса"""
+
+    @abstractmethod
+    async def update_event(self, event_id, fields: dict):
+        """Обновляет поля события"""
+
+    @abstractmethod
+    async def delete_events(self, event_ids):
+        """Удаляет события по списку id"""
+
+    @abstractmethod
+    async def shift_events(self, event_ids, minutes: int) -> list:
+        """Сдвигает начало и окончание событий на minutes минут одним запросом; возвращает обновлённые строки"""
+
+    @abstractmethod
+    async def get_day_events(self, day: str) -> dict:
+        """{telegram_id: [события дня по возрастанию времени]} для всех пользователей, не отключивших дайджест"""
+
+    @abstractmethod
+    async def set_digest_enabled(self, telegram_id: str, enabled: bool):
+        """Включает или отключает утренний дайджест пользователя"""
+
+
+# --- Supabase ---
+class SupabaseStorage(Storage):
+    def __init__(self, url: str, key: str):
+        from supabase import create_client
+        self.client = create_client(url, key)
+
+    @staticmethod
+    async def _execute(query, write: bool = False):
+        if write:
+            return await asyncio.to_thread(query.execute)
+        return await within_deadline(asyncio.to_thread(query.execute))
+
+    async def _fetch_all(self, make_query, limit: int = None) -> list:
+        """
+        Все строки запроса (не больше limit), постранично по PAGE_SIZE.
+        make_query строит запрос заново для каждой страницы: построитель
+        postgrest меняется на месте, и второй .range() добавил бы параметры.
+        Запрос должен быть упорядочен однозначно, иначе страницы перекроются.
+        """
+        rows = []
+        while True:
+            size = PAGE_SIZE if limit is None else min(PAGE_SIZE, limit - len(rows))
+            res = await self._execute(make_query().range(len(rows), len(rows) + size - 1))
+            page = res.data or []
+            rows.extend(page)
+            if len(page) < size or len(rows) == limit:
+                return rows
+
+    async def get_user_id(self, telegram_id: str):
+        res = await self._execute(
+            self.client.table("users").select("id").eq("telegram_id", str(telegram_id))
+        )
+        return res.data[0]["id"] if res.data else None
+
+    async def get_or_create_user_id(self, telegram_id: str):
+        user_id = await self.get_user_id(telegram_id)
+        if user_id:
+            return user_id
+        res = await self._execute(
+            self.client.table("users").insert({"telegram_id": str(telegram_id)}), write=True
+        )
+        return res.data[0]["id"]
+
+    async def insert_events(self, events: list) -> list:
+        res = await self._execute(self.client.table("events").insert(events), write=True)
+        if not res.data or len(res.data) != len(events):
+            # Без сохранённых строк (с id) не обновить индекс и ленту — не выдумываем их
+            raise RuntimeError(f"Вставка {len(events)} событий вернула {len(res.data or [])} строк")
+        return res.data
+
+    async def find_events(self, user_id, start=None, end=None, exact=None,
+                          title=None, latest=False, limit=None) -> list:
+        def make_query():
+            query = self.client.table("events").select("*").eq("user_id", user_id)
+            if start:
+                query = query.gte("start_datetime", start)
+            if end:
+                query = query.lte("start_datetime", end)
+            if exact:
+                query = query.eq("start_datetime", exact)
+            if title:
+                query = query.ilike("event_title", f"%{title}%")
+            return query.order("start_datetime", desc=latest).order("id", desc=latest)
+
+        return await self._fetch_all(make_query, limit or None)
+
+    async def get_events(self, event_ids) -> list:
+        res = await self._execute(self.client.table("events").select("*").in_("id", list(event_ids)))
+        return res.data or []
+
+    async def list_index_rows(self, user_id) -> list:
+        return await self._fetch_all(
+            lambda: self.client.table("events")
+            .select("id, event_title, event_place, start_datetime")
+            .eq("user_id", user_id)
+            .order("id")
+        )
+
+    async def update_event(self, event_id, fields: dict):
+        await self._execute(self.client.table("events").update(fields).eq("id", event_id), write=True)
+
+    async def delete_events(self, event_ids):
+        await self._execute(self.client.table("events").delete().in_("id", list(event_ids)), write=True)
+
+    async def shift_events(self, event_ids, minutes: int) -> list:
+        # PostgREST не умеет UPDATE с выражением — функция из sql/shift_events.sql
+        res = await self._execute(
+            self.client.rpc("shift_events", {"event_ids": list(event_ids), "shift_minutes": minutes}),
+            write=True
+        )
+        return res.data or []
+
+    async def get_day_events(self, day: str) -> dict:
+        res = await self._execute(self.client.table("digest_optout").select("telegram_id"))
+        opted_out = {row["telegram_id"] for row in res.data or []}
+
+        # Один запрос с join на users (постранично) вместо отдельной выборки на каждого пользователя
+        rows = await self._fetch_all(
+            lambda: self.client.table("events")
+            .select("*, users(telegram_id)")
+            .gte("start_datetime", f"{day}T00:00:00")
+            .lte("start_datetime", f"{day}T23:59:59")
+            .order("user_id")
+            .order("start_datetime")
+            .order("id")
+        )
+        by_user = defaultdict(list)
+        for ev in rows:
+            user = ev.pop("users", None) or {}
+            if user.get("telegram_id") and user["telegram_id"] not in opted_out:
+                by_user[user["telegram_id"]].append(ev)
+        return by_user
+
+    async def set_digest_enabled(self, telegram_id: str, enabled: bool):
+        # Таблица из sql/digest_optout.sql
+        table = self.client.table("digest_optout")
+        if enabled:
+            query = table.delete().eq("telegram_id", str(telegram_id))
+        else:
+            query = table.upsert({"telegram_id": str(telegram_id)})
+        await self._execute(query, write=True)
+
+
+# --- SQLite ---
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%S', 'now')),
+    telegram_id TEXT NOT NULL UNIQUE,
+    google_account TEXT
+);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%S', 'now')),
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    event_title TEXT,
+    event_title_norm TEXT,
+    event_description TEXT,
+    start_datetime TEXT,
+    end_datetime TEXT,
+    event_weekly INTEGER NOT NULL DEFAULT 0,
+    event_place TEXT
+);
+-- Выборки по периоду всегда ограничены пользователем
+CREATE INDEX IF NOT EXISTS idx_events_user_start ON events(user_id, start_datetime);
+-- Поиск по названию в пределах пользователя (название в нижнем регистре)
+CREATE INDEX IF NOT EXISTS idx_events_user_title ON events(user_id, event_title_norm);
+-- Дайджест: все события дня по всем пользователям
+CREATE INDEX IF NOT EXISTS idx_events_start ON events(start_datetime);
+-- Пользователи, отключившие дайджест (/digest_off)
+CREATE TABLE IF NOT EXISTS digest_optout (
+    telegram_id TEXT PRIMARY KEY
+);
+"""
+
+_EVENT_COLUMNS = "id, created_at, user_id, event_title, event_description, start_datetime, " \
+                 "end_datetime, event_weekly, event_place"
+
+
+def _norm_title(title):
+    return title.lower().replace("ё", "е") if title else None
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+class SQLiteStorage(Storage):
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(_SQLITE_SCHEMA)
+        self._lock = threading.Lock()
+
+    def _run(self, sql: str, params=()):
+        with self._lock:
+            cur = self.conn.execute(sql, params)
+            rows = [self._to_dict(row) for row in cur.fetchall()]
+            self.conn.commit()
+            return rows
+
+    async def _query(self, sql: str, params=(), write: bool = False):
+        if write:
+            return await asyncio.to_thread(self._run, sql, params)
+        return await within_deadline(asyncio.to_thread(self._run, sql, params))
+
+    @staticmethod
+    def _to_dict(row) -> dict:
+        data = dict(row)
+        if "event_weekly" in data:
+            data["event_weekly"] = bool(data["event_weekly"])
+        return data
+
+    async def get_user_id(self, telegram_id: str):
+        rows = await self._query("SELECT id FROM users WHERE telegram_id = ?", (str(telegram_id),))
+        return rows[0]["id"] if rows else None
+
+    async def get_or_create_user_id(self, telegram_id: str):
+        await self._query("INSERT OR IGNORE INTO users (telegram_id) VALUES (?)", (str(telegram_id),), write=True)
+        return await self.get_user_id(telegram_id)
+
+    async def insert_events(self, events: list) -> list:
+        # Одна многострочная вставка INSERT ... VALUES (...), (...) RETURNING
+        params = []
+        for event in events:
+            params.extend((
+                event["user_id"],
+                event.get("event_title"),
+                _norm_title(event.get("event_title")),
+                event.get("event_description"),
+                normalize_datetime(event.get("start_datetime")),
+                normalize_datetime(event.get("end_datetime")),
+                event.get("event_place"),
+                bool(event.get("event_weekly")),
+            ))
+        values = ", ".join(["(?, ?, ?, ?, ?, ?, ?, ?)"] * len(events))
+        return await self._query(
+            "INSERT INTO events (user_id, event_title, event_title_norm, event_description, "
+            f"start_datetime, end_datetime, event_place, event_weekly) VALUES {values} "
+            f"RETURNING {_EVENT_COLUMNS}",
+            params,
+            write=True
+        )
+
+    async def find_events(self, user_id, start=None, end=None, exact=None,
+                          title=None, latest=False, limit=None) -> list:
+        sql = f"SELECT {_EVENT_COLUMNS} FROM events WHERE user_id = ?"
+        params = [user_id]
+        if start:
+            sql += " AND start_datetime >= ?"
+            params.append(normalize_datetime(start))
+        if end:
+            sql += " AND start_datetime <= ?"
+            params.append(normalize_datetime(end))
+        if exact:
+            sql += " AND start_datetime = ?"
+            params.append(normalize_datetime(exact))
+        if title:
+            sql += " AND event_title_norm LIKE ? ESCAPE '\\'"
+            params.append(f"%{_escape_like(_norm_title(title))}%")
+        sql += " ORDER BY start_datetime DESC" if latest else " ORDER BY start_datetime"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return await self._query(sql, params)
+
+    async def get_events(self, event_ids) -> list:
+        event_ids = list(event_ids)
+        if not event_ids:
+            return []
+        placeholders = ", ".join("?" * len(event_ids))
+        return await self._query(f"SELECT {_EVENT_COLUMNS} FROM events WHERE id IN ({placeholders})", event_ids)
+
+    async def list_index_rows(self, user_id) -> list:
+        return await self._query(
+            "SELECT id, event_title, event_place, start_datetime FROM events WHERE user_id = ?", (user_id,)
+        )
+
+    async def update_event(self, event_id, fields: dict):
+        fields = {key: value for key, value in fields.items() if key in EVENT_FIELDS}
+        if not fields:
+            return
+        for key in ("start_datetime", "end_datetime"):
+            if key in fields:
+                fields[key] = normalize_datetime(fields[key])
+        if "event_title" in fields:
+            fields["event_title_norm"] = _norm_title(fields["event_title"])
+        assignments = ", ".join(f"{key} = ?" for key in fields)
+        await self._query(f"UPDATE events SET {assignments} WHERE id = ?", [*fields.values(), event_id], write=True)
+
+    async def delete_events(self, event_ids):
+        event_ids = list(event_ids)
+        if not event_ids:
+            return
+        placeholders = ", ".join("?" * len(event_ids))
+        await self._query(f"DELETE FROM events WHERE id IN ({placeholders})", event_ids, write=True)
+
+    async def shift_events(self, event_ids, minutes: int) -> list:
+        event_ids = list(event_ids)
+        if not event_ids:
+            return []
+        placeholders = ", ".join("?" * len(event_ids))
+        modifier = f"{minutes:+d} minutes"
+        return await self._query(
+            "UPDATE events SET "
+            "start_datetime = strftime('%Y-%m-%dT%H:%M:%S', start_datetime, ?), "
+            "end_datetime = strftime('%Y-%m-%dT%H:%M:%S', end_datetime, ?) "
+            f"WHERE id IN ({placeholders}) RETURNING {_EVENT_COLUMNS}",
+            [modifier, modifier, *event_ids],
+            write=True
+        )
+
+    async def get_day_events(self, day: str) -> dict:
+        rows = await self._query(
+            f"SELECT u.telegram_id AS telegram_id, {', '.join('e.' + c.strip() for c in _EVENT_COLUMNS.split(','))} "
+            "FROM events e JOIN users u ON u.id = e.user_id "
+            "WHERE e.start_datetime BETWEEN ? AND ? "
+            "AND NOT EXISTS (SELECT 1 FROM digest_optout o WHERE o.telegram_id = u.telegram_id) "
+            "ORDER BY e.user_id, e.start_datetime",
+            (f"{day}T00:00:00", f"{day}T23:59:59")
+        )
+        by_user = defaultdict(list)
+        for ev in rows:
+            by_user[ev.pop("telegram_id")].append(ev)
+        return by_user
+
+    async def set_digest_enabled(self, telegram_id: str, enabled: bool):
+        if enabled:
+            await self._query("DELETE FROM digest_optout WHERE telegram_id = ?", (str(telegram_id),), write=True)
+        else:
+            await self._query(
+                "INSERT OR IGNORE INTO digest_optout (telegram_id) VALUES (?)", (str(telegram_id),), write=True
+            )
+
+
+def create_storage() -> Storage:
+    if STORAGE_BACKEND == "supabase":
+        return SupabaseStorage(SUPABASE_URL, SUPABASE_KEY)
+    if STORAGE_BACKEND == "sqlite":
+        return SQLiteStorage(SQLITE_PATH)
+    raise ValueError(f"Неизвестный STORAGE_BACKEND: {STORAGE_BACKEND}")
+
+
+# --- Общий экземпляр хранилища ---
+storage = create_storage()
@@ -0,0 +1,482 @@
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import re
+import secrets
+import sys
+import time
+import uuid
+from collections import defaultdict
+from contextvars import ContextVar
+from datetime import datetime
+
+from aiogram import BaseMiddleware
+
+# --- Запись и воспроизведение реального трафика ---
+# Запись (TRAFFIC_RECORD_PATH): каждое текстовое сообщение сохраняется одной
+# строкой JSON в append-only файл вместе с тем, что было нужно для его
+# обработки: состояние EventForm и данные диалога до обработки, ответы
+# LLM-извлечения и хранилища (по порядку вызова, с длительностью), хендлер,
+# отправленные ботом тексты и время обработки.
+#
+# Обезличивание: telegram_id и id пользователя в базе (в ответах хранилища и
+# в колонке user_id каждой строки) заменяются псевдонимами — HMAC с солью,
+# которая живёт только в памяти процесса. Свободный текст (сообщения,
+# названия, места и описания событий) пишется как есть, из него вырезаются
+# только e-mail, телефоны и ссылки — файл записи остаётся персональными
+# данными и хранится соответственно.
+#
+# Воспроизведение (python traffic.py traffic.jsonl --speed 10):
+# сообщения подаются в настоящий Dispatcher из main.py, а LLM и хранилище
+# отвечают записанными ответами (по умолчанию — с записанными задержками).
+# Отчёт: задержка по хендлерам (было / стало) и расхождения в ответах бота.
+#
+# LLM записывается на уровне функций извлечения (extract_*), а не сырых
+# HTTP-ответов: так запись не зависит от того, попал ли запрос в общий пакет.
+#
+# Первая строка каждого запуска записи — заголовок {"header": {...}} с
+# настройками, от которых зависит, какие вызовы делает бот (TTL индекса,
+# дедлайн и т.п.); при воспроизведении с другими значениями выводится
+# предупреждение. Поисковый индекс при воспроизведении перечитывается ровно
+# тогда, когда он перечитывался при записи, независимо от TTL и скорости.
+
+LLM_FUNCTIONS = (
+    "extract_events_data", "extract_date_range", "extract_event_to_delete",
+    "extract_edit_data", "extract_bulk_operation"
+)
+
+# Настройки из config.py, которые пишутся в заголовок записи
+RECORDED_SETTINGS = (
+    "SEARCH_INDEX_TTL", "SEARCH_INDEX_MAX_USERS", "UPDATE_DEADLINE",
+    "FSM_MAX_DATA_BYTES", "LLM_BATCHING", "FEED_PORT"
+)
+
+_EMAIL = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+_PHONE = re.compile(r"\+\d[\d\s()-]{8,}\d|\b8\s?\(?\d{3}\)?\s?\d{3}-?\d{2}-?\d{2}\b")
+_URL = re.compile(r"https?://\S+")
+
+# Запись обрабатываемого сейчас сообщения (и при записи, и при воспроизведении)
+_current: ContextVar = ContextVar("traffic_record", default=None)
+# Внутри записанного вызова: вложенные вызовы (get_or_create → get_user_id) не пишем
+_in_call: ContextVar = ContextVar("traffic_in_call", default=False)
+
+
+def scrub(value):
+    """Убирает из строк (в том числе вложенных) e-mail, телефоны и ссылки"""
+    if isinstance(value, str):
+        value = _EMAIL.sub("[email]", value)
+        value = _PHONE.sub("[phone]", value)
+        return _URL.sub("[url]", value)
+    if isinstance(value, dict):
+        return {key: scrub(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [scrub(item) for item in value]
+    return value
+
+
+def recorded_settings() -> dict:
+    import config
+
+    return {name: getattr(config, name) for name in RECORDED_SETTINGS}
+
+
+def instrument(handlers_module, storage, wrap):
+    """Оборачивает функции LLM-извлечения в handlers и методы хранилища"""
+    from storage import Storage
+
+    for name in LLM_FUNCTIONS:
+        setattr(handlers_module, name, wrap(f"llm.{name}", getattr(handlers_module, name)))
+    for name in sorted(Storage.__abstractmethods__):
+        setattr(storage, name, wrap(f"storage.{name}", getattr(storage, name)))
+
+
+# --- Запись ---
+class TrafficRecorder(BaseMiddleware):
+    def __init__(self, path: str):
+        self.path = path
+        self.started = time.monotonic()
+        # Соль только в памяти: псевдонимы стабильны в пределах запуска и необратимы
+        self._salt = secrets.token_bytes(16)
+        self._file = None
+
+    def install(self, dispatcher, bot):
+        import handlers
+        from storage import storage
+
+        self._file = open(self.path, "a", encoding="utf-8", buffering=1)
+        header = {"started": datetime.now().isoformat(timespec="seconds"), "settings": recorded_settings()}
+        self._file.write(json.dumps({"header": header}, ensure_ascii=False) + "\n")
+        dispatcher.message.middleware(self)
+        bot.session.middleware(self._on_request)
+        instrument(handlers, storage, self._wrap)
+        print(f"Запись трафика: {self.path}")
+
+    def pseudonym(self, value):
+        """Псевдоним telegram_id или id пользователя в базе; uuid остаётся uuid, число — числом"""
+        digest = hmac.new(self._salt, str(value).encode(), hashlib.sha256).hexdigest()
+        if isinstance(value, str) and not value.isdigit():
+            return str(uuid.UUID(digest[:32]))
+        return 10 ** 9 + int(digest[:12], 16) % (9 * 10 ** 9)
+
+    def anonymize(self, value):
+        """Заменяет user_id в строках (в том числе вложенных) и вырезает контакты из текста"""
+        if isinstance(value, dict):
+            return {
+                key: self.pseudonym(item) if key == "user_id" and item is not None else self.anonymize(item)
+                for key, item in value.items()
+            }
+        if isinstance(value, (list, tuple)):
+            return [self.anonymize(item) for item in value]
+        return scrub(value)
+
+    def _anonymize_result(self, name, result):
+        if result is None:
+            return None
+        if name in ("storage.get_user_id", "storage.get_or_create_user_id"):
+            return self.pseudonym(result)
+        if name == "storage.get_day_events":
+            # Ключи — telegram_id
+            return {self.pseudonym(key): self.anonymize(rows) for key, rows in result.items()}
+        return self.anonymize(result)
+
+    def _wrap(self, name, func):
+        async def wrapper(*args, **kwargs):
+            record = _current.get()
+            if record is None or _in_call.get():
+                return await func(*args, **kwargs)
+            token = _in_call.set(True)
+            started = time.perf_counter()
+            try:
+                result = await func(*args, **kwargs)
+            except BaseException as e:
+                record["calls"].append([name, None, _ms(started), type(e).__name__])
+                raise
+            finally:
+                _in_call.reset(token)
+            record["calls"].append([name, self._anonymize_result(name, result), _ms(started)])
+            return result
+        return wrapper
+
+    async def _on_request(self, make_request, bot, method):
+        record = _current.get()
+        if record is not None:
+            record["out"].append([type(method).__name__, scrub(getattr(method, "text", None) or "")])
+        return await make_request(bot, method)
+
+    async def __call__(self, handler, event, data):
+        if event.text is None:
+            return await handler(event, data)
+
+        fsm = data.get("state")
+        record = {
+            "t": round(time.monotonic() - self.started, 3),
+            "user": self.pseudonym(event.from_user.id),
+            "chat": self.pseudonym(event.chat.id),
+            "text": scrub(event.text),
+            "state": data.get("raw_state"),
+            "data": self.anonymize(await fsm.get_data()) if fsm else {},
+            "handler": data["handler"].callback.__name__,
+            "calls": [],
+            "out": [],
+        }
+        token = _current.set(record)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            record["ms"] = _ms(started)
+            _current.reset(token)
+            self._file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":"), default=str) + "\n")
+
+
+def _ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+# --- Воспроизведение ---
+class RecordedCallError(Exception):
+    """Записанный вызов завершился ошибкой или для вызова нет записанного ответа"""
+
+
+class Replayer(BaseMiddleware):
+    def __init__(self, delays: bool):
+        self.delays = delays
+
+    def _wrap(self, name, func):
+        from deadlines import DeadlineExceeded, within_deadline
+
+        async def wrapper(*args, **kwargs):
+            ctx = _current.get()
+            if ctx is None:
+                return await func(*args, **kwargs)
+            # Первый ещё не использованный вызов с тем же именем: параллельные вызовы
+            # (asyncio.gather) могут быть записаны в другом порядке
+            calls = ctx["record"]["calls"]
+            for i, call in enumerate(calls):
+                if i in ctx["used"] or call[0] != name:
+                    continue
+                ctx["used"].add(i)
+                _, result, ms, *error = call
+                if self.delays and ms:
+                    # Задержка подчиняется тому же бюджету времени, что и настоящий вызов
+                    await within_deadline(asyncio.sleep(ms / 1000))
+                if error == ["DeadlineExceeded"]:
+                    raise DeadlineExceeded()
+                if error:
+                    raise RecordedCallError(f"{name}: {error[0]}")
+                return result
+            ctx["problems"].append(f"нет записанного ответа: {name}")
+            raise RecordedCallError(f"нет записанного ответа: {name}")
+        return wrapper
+
+    async def __call__(self, handler, event, data):
+        ctx = _current.get()
+        if ctx is not None:
+            ctx["handler"] = data["handler"].callback.__name__
+        return await handler(event, data)
+
+
+def _make_session():
+    from aiogram.client.session.base import BaseSession
+    from aiogram.methods import EditMessageText, SendDocument, SendMessage
+    from aiogram.types import Message
+
+    class ReplaySession(BaseSession):
+        """Сессия без сети: запоминает исходящие тексты и возвращает правдоподобные ответы"""
+
+        def __init__(self):
+            super().__init__()
+            self._message_id = 0
+
+        async def make_request(self, bot, method, timeout=None):
+            ctx = _current.get()
+            if ctx is not None:
+                ctx["out"].append([type(method).__name__, scrub(getattr(method, "text", None) or "")])
+            if isinstance(method, (SendMessage, EditMessageText, SendDocument)):
+                self._message_id += 1
+                chat_id = getattr(method, "chat_id", None) or 0
+                return Message.model_validate(
+                    {
+                        "message_id": self._message_id,
+                        "date": int(time.time()),
+                        "chat": {"id": chat_id, "type": "private"},
+                        "text": getattr(method, "text", None) or "",
+                    },
+                    context={"bot": bot},
+                )
+            return True
+
+        async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+            yield b""
+
+        async def close(self):
+            pass
+
+    return ReplaySession()
+
+
+def load_records(path: str) -> tuple:
+    """Возвращает (заголовки запусков записи, сообщения)"""
+    headers, records = [], []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if "header" in item:
+                headers.append(item["header"])
+            else:
+                records.append(item)
+    return headers, records
+
+
+def settings_mismatch(headers: list) -> list:
+    """Настройки, с которыми запись делалась иначе, чем идёт воспроизведение"""
+    current = recorded_settings()
+    notes = []
+    for name, value in current.items():
+        recorded = sorted({str(header["settings"][name]) for header in headers if name in header.get("settings", {})})
+        if recorded and recorded != [str(value)]:
+            notes.append(f"{name}: при записи {', '.join(recorded)}, сейчас {value}")
+    return notes
+
+
+def _follow_recorded_refills(event_index):
+    """
+    Поисковый индекс перечитывается там же, где он перечитывался при записи.
+    Индекс считается загруженным, пока в записи текущего сообщения нет
+    неиспользованного list_index_rows; TTL и вытеснение отключены.
+    """
+    is_loaded = event_index.is_loaded
+    event_index.ttl = float("inf")
+    event_index.max_users = sys.maxsize
+
+    def replay_is_loaded(user_id):
+        ctx = _current.get()
+        if ctx is None:
+            return is_loaded(user_id)
+        refill = any(
+            call[0] == "storage.list_index_rows" and i not in ctx["used"]
+            for i, call in enumerate(ctx["record"]["calls"])
+        )
+        return not refill and is_loaded(user_id)
+
+    event_index.is_loaded = replay_is_loaded
+
+
+def _percentile(values: list, share: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+async def replay(records: list, speed: float, delays: bool, show: int):
+    # Настоящий Dispatcher со всеми хендлерами и middleware из main.py
+    import handlers
+    import main as app
+    from aiogram import Bot
+    from aiogram.types import Update
+    from replies import _shown_keyboards
+    from search_index import event_index
+    from storage import storage
+
+    replayer = Replayer(delays)
+    instrument(handlers, storage, replayer._wrap)
+    _follow_recorded_refills(event_index)
+    app.dp.message.middleware(replayer)
+    bot = Bot(token="1:replay", session=_make_session())
+
+    results = []
+    by_user = defaultdict(list)
+    for index, record in enumerate(records):
+        by_user[record["user"]].append((index, record))
+
+    started = time.monotonic()
+
+    async def run_user(items):
+        for index, record in items:
+            if speed:
+                delay = record["t"] / speed - (time.monotonic() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            # Каждое сообщение воспроизводится из записанного состояния диалога
+            fsm = app.dp.fsm.get_context(bot=bot, chat_id=record["chat"], user_id=record["user"])
+            drift = await fsm.get_state() != record["state"]
+            await fsm.set_state(record["state"])
+            await fsm.set_data(record["data"])
+            # Клавиатура отправляется заново: reply_markup в отчёте не сравнивается
+            # и на вызовы не влияет, а показанная при записи клавиатура неизвестна
+            _shown_keyboards.pop(record["chat"], None)
+
+            ctx = {"record": record, "used": set(), "out": [], "problems": [], "handler": None}
+            token = _current.set(ctx)
+            update = Update.model_validate(
+                {
+                    "update_id": index + 1,
+                    "message": {
+                        "message_id": index + 1,
+                        "date": int(time.time()),
+                        "chat": {"id": record["chat"], "type": "private"},
+                        "from": {"id": record["user"], "is_bot": False, "first_name": "user"},
+                        "text": record["text"],
+                    },
+                },
+                context={"bot": bot},
+            )
+            call_started = time.perf_counter()
+            try:
+                await app.dp.feed_update(bot, update)
+            except Exception as e:
+                ctx["problems"].append(f"исключение: {type(e).__name__}: {e}")
+            finally:
+                _current.reset(token)
+            ms = (time.perf_counter() - call_started) * 1000
+
+            left = [call for i, call in enumerate(record["calls"]) if i not in ctx["used"]]
+            if left:
+                ctx["problems"].append("не вызваны: " + ", ".join(call[0] for call in left))
+            results.append({
+                "index": index,
+                "record": record,
+                "handler": ctx["handler"],
+                "ms": ms,
+                "out": [text for _, text in ctx["out"]],
+                "problems": ctx["problems"],
+                "drift": drift,
+            })
+
+    await asyncio.gather(*(run_user(items) for items in by_user.values()))
+    total = time.monotonic() - started
+    await bot.session.close()
+    print_report(results, total, show)
+
+
+def print_report(results: list, total: float, show: int):
+    print(f"\nВоспроизведено сообщений: {len(results)} за {total:.1f} с\n")
+
+    print(f"{'хендлер':<26}{'сообщ.':>7}{'p50 было':>10}{'p50 стало':>11}{'p95 было':>10}{'p95 стало':>11}{'max стало':>11}")
+    by_handler = defaultdict(list)
+    for result in results:
+        by_handler[result["handler"] or result["record"]["handler"]].append(result)
+    for name, items in sorted(by_handler.items(), key=lambda item: -len(item[1])):
+        before = [item["record"].get("ms", 0) for item in items]
+        after = [item["ms"] for item in items]
+        print(
+            f"{name:<26}{len(items):>7}{_percentile(before, 0.5):>10.1f}{_percentile(after, 0.5):>11.1f}"
+            f"{_percentile(before, 0.95):>10.1f}{_percentile(after, 0.95):>11.1f}{max(after):>11.1f}"
+        )
+
+    diffs = []
+    for result in sorted(results, key=lambda item: item["index"]):
+        record = result["record"]
+        expected = [text for _, text in record["out"]]
+        notes = list(result["problems"])
+        if result["handler"] and result["handler"] != record["handler"]:
+            notes.append(f"хендлер: {record['handler']} → {result['handler']}")
+        if result["out"] != expected:
+            notes.append(f"ответ: {expected!r}\n        → {result['out']!r}")
+        if notes:
+            diffs.append((result["index"], record, notes))
+
+    drift = sum(1 for result in results if result["drift"])
+    print(f"\nРасхождений: {len(diffs)} из {len(results)} (состояние диалога восстановлено из записи: {drift})")
+    for index, record, notes in diffs[:show]:
+        print(f"\n#{index} [{record['state'] or '-'}] {record['handler']}: {record['text'][:80]!r}")
+        for note in notes:
+            print(f"    {note}")
+
+
+def parse_speed(value: str) -> float:
+    """'1' → 1.0, '10' / '10x' → 10.0, 'max' → 0 (без пауз)"""
+    value = value.lower()
+    return 0.0 if value == "max" else float(value.rstrip("x×"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Воспроизведение записанного трафика через Dispatcher")
+    parser.add_argument("path", help="файл записи (TRAFFIC_RECORD_PATH)")
+    parser.add_argument("--speed", default="1", help="1, N (в N раз быстрее) или max")
+    parser.add_argument("--no-delays", action="store_true", help="отвечать за LLM и базу без записанных задержек")
+    parser.add_argument("--show", type=int, default=20, help="сколько расхождений показать")
+    args = parser.parse_args()
+
+    # Воспроизведение никогда не ходит в настоящие базу, LLM и Telegram
+    os.environ["STORAGE_BACKEND"] = "sqlite"
+    os.environ["SQLITE_PATH"] = ":memory:"
+    os.environ["TRAFFIC_RECORD_PATH"] = ""
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "1:replay")
+
+    headers, records = load_records(args.path)
+    print(f"{datetime.now():%Y-%m-%d %H:%M:%S} загружено {len(records)} сообщений из {args.path}")
+    for note in settings_mismatch(headers):
+        print(f"⚠️ настройки отличаются от записи — {note}")
+    asyncio.run(replay(records, parse_speed(args.speed), not args.no_delays, args.show))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
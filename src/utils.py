@@ -1,7 +1,10 @@
 import httpx
 import json
+import re
 from datetime import datetime
-from config import DEEPSEEK_API_KEY, DEEPSEEK_URL
+from config import DEEPSEEK_API_KEY, DEEPSEEK_URL, LLM_BATCHING, LLM_BATCH_MAX_SIZE, LLM_BATCH_MAX_WAIT_MS
+from batching import MicroBatcher
+from deadlines import within_deadline
 
 
 def clean_api_response(data):
@@ -14,28 +17,23 @@ def clean_api_response(data):
             cleaned[key] = value
     return cleaned
 
-# --- Функция: извлечение данных о событии ---
-async def extract_event_data(text: str) -> dict:
-    today = datetime.now().strftime('%Y-%m-%d')
-    prompt = f"""
-    Извлеки из сообщения информацию о событии.
-    Верни ТОЛЬКО JSON в строгом формате:
-    {{
-      "event_title": "строка, обязательна",
-      "event_description": "строка или null",
-      "start_datetime": "строка в формате YYYY-MM-DD HH:MM или null",
-      "end_datetime": "строка в формате YYYY-MM-DD HH:MM или null",
-      "event_place": "строка (адрес, кафе, Zoom и т.п.) или null"
-    }}
 
-    Если дата/время указаны неявно (например, 'завтра', 'в понедельник'), рассчитай относительно сегодня: {today}.
-    Если время окончания не указано — оставь как null.
-    Если место не указано — event_place = null.
+# --- Клиент DeepSeek ---
+# Один клиент на процесс: соединение с API переиспользуется между запросами
+_http_client = None
+# Предельное время одного запроса; внутри обработки сообщения — не больше остатка бюджета
+LLM_TIMEOUT = 15.0
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(timeout=LLM_TIMEOUT)
+    return _http_client
 
-    Сообщение:
-    {text}
-    """
 
+async def ask_deepseek(prompt: str) -> dict:
+    """Отправляет промпт в DeepSeek и возвращает разобранный JSON из ответа"""
     headers = {
         "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
         "Content-Type": "application/json"
@@ -48,48 +46,155 @@ async def extract_event_data(text: str) -> dict:
         "temperature": 0.1
     }
 
-    async with httpx.AsyncClient(timeout=15.0) as client:
-        try:
-            response = await client.post(DEEPSEEK_URL, json=payload, headers=headers)
-            response.raise_for_status()
-            data = response.json()
-
-            content = data["choices"][0]["message"]["content"]
-            parsed = json.loads(content)
-
-            result = {
-                "event_title": parsed.get("event_title"),
-                "event_description": parsed.get("event_description"),
-                "start_datetime": parsed.get("start_datetime"),
-                "end_datetime": parsed.get("end_datetime"),
-                "event_place": parsed.get("event_place")
-            }
-            return clean_api_response(result)
-        except Exception as e:
-            print(f"Ошибка при обращении к DeepSeek: {e}")
-            return {
-                "event_title": None,
-                "event_description": None,
-                "start_datetime": None,
-                "end_datetime": None,
-                "event_place": None
-            }
+    response = await within_deadline(
+        _get_http_client().post(DEEPSEEK_URL, json=payload, headers=headers), LLM_TIMEOUT
+    )
+    response.raise_for_status()
+    data = response.json()
 
+    content = data["choices"][0]["message"]["content"]
+    return json.loads(content)
 
-# --- Функция: извлечение периода (для запроса событий) ---
-async def extract_date_range(text: str) -> dict:
+
+# --- Пакетная обработка: несколько сообщений в одном промпте ---
+def build_batch_prompt(instructions: str, texts: list) -> str:
+    messages = "\n".join(
+        json.dumps({"id": i, "text": text}, ensure_ascii=False) for i, text in enumerate(texts)
+    )
+    return f"""
+    {instructions}
+
+    Ниже {len(texts)} независимых сообщений от разных пользователей (по одному JSON на строку).
+    Обработай КАЖДОЕ сообщение отдельно по инструкции выше.
+    Верни ТОЛЬКО JSON в формате:
+    {{
+      "items": [
+        {{"id": номер сообщения, "result": JSON для этого сообщения в формате выше}}
+      ]
+    }}
+
+    Сообщения:
+    {messages}
     """
-    Анализирует текст и возвращает:
-    {
-        "start_date": "YYYY-MM-DD",
-        "end_date": "YYYY-MM-DD",
-        "start_time": "HH:MM",   # опционально
-        "end_time": "HH:MM",     # опционально
-        "exact_time": "HH:MM"    # если указано одно время
-    }
+
+
+def make_batcher(instructions_fn, parse_fn, single_fn) -> MicroBatcher:
     """
+    Пакетизатор для одного вида извлечения. Элементы с отсутствующим
+    или неразборчивым результатом уходят в single_fn по одному.
+    """
+    async def run_batch(texts):
+        parsed = await ask_deepseek(build_batch_prompt(instructions_fn(), texts))
+        by_id = {}
+        for item in parsed.get("items") or []:
+            if not isinstance(item, dict) or not isinstance(item.get("result"), dict):
+                continue
+            # Модель может вернуть номер строкой ("0") — приводим к int, иначе элемент не сопоставится
+            try:
+                item_id = int(item.get("id"))
+            except (TypeError, ValueError):
+                continue
+            by_id[item_id] = item["result"]
+
+        results = []
+        for i in range(len(texts)):
+            try:
+                results.append(parse_fn(by_id[i]) if i in by_id else None)
+            except Exception:
+                results.append(None)
+        return results
+
+    return MicroBatcher(
+        run_batch,
+        single_fn,
+        max_batch=LLM_BATCH_MAX_SIZE,
+        max_wait=LLM_BATCH_MAX_WAIT_MS / 1000
+    )
+
+
+# --- Функция: извлечение событий (одного или нескольких) ---
+EMPTY_EVENT = {
+    "event_title": None,
+    "event_description": None,
+    "start_datetime": None,
+    "end_datetime": None,
+    "event_place": None
+}
+
+
+def _events_instructions() -> str:
     today = datetime.now().strftime('%Y-%m-%d')
-    prompt = f"""
+    return f"""
+    Извлеки из сообщения информацию о событиях. В сообщении может быть одно или несколько событий.
+    Верни ТОЛЬКО JSON в строгом формате:
+    {{
+      "events": [
+        {{
+          "event_title": "строка, обязательна",
+          "event_description": "строка или null",
+          "start_datetime": "строка в формате YYYY-MM-DD HH:MM или null",
+          "end_datetime": "строка в формате YYYY-MM-DD HH:MM или null",
+          "event_place": "строка (адрес, кафе, Zoom и т.п.) или null"
+        }}
+      ]
+    }}
+
+    Если дата/время указаны неявно (например, 'завтра', 'в понедельник'), рассчитай относительно сегодня: {today}.
+    Если несколько событий перечислены через запятую с общей датой ("завтра в 10 стендап, в 15 созвон"),
+    общая дата относится к каждому из них.
+    Если время окончания не указано — оставь как null.
+    Если место не указано — event_place = null.
+    """
+
+
+def _parse_events(parsed: dict) -> list:
+    events = []
+    for item in parsed.get("events") or []:
+        if not isinstance(item, dict):
+            continue
+        events.append(clean_api_response({key: item.get(key) for key in EMPTY_EVENT}))
+    return events or [dict(EMPTY_EVENT)]
+
+
+async def _extract_events_single(text: str) -> list:
+    prompt = f"""{_events_instructions()}
+    Сообщение:
+    {text}
+    """
+    try:
+        return _parse_events(await ask_deepseek(prompt))
+    except Exception as e:
+        print(f"Ошибка при обращении к DeepSeek: {e}")
+        return [dict(EMPTY_EVENT)]
+
+
+_events_batcher = make_batcher(_events_instructions, _parse_events, _extract_events_single)
+
+
+async def extract_events_data(text: str) -> list:
+    """
+    Извлекает из сообщения все упомянутые события за один запрос к LLM.
+    Возвращает список словарей с полями event_title, event_description,
+    start_datetime, end_datetime, event_place (минимум один элемент).
+    """
+    if LLM_BATCHING:
+        return await within_deadline(_events_batcher.submit(text))
+    return await _extract_events_single(text)
+
+
+# --- Функция: извлечение периода (для запроса событий) ---
+EMPTY_RANGE = {
+    "start_date": None,
+    "end_date": None,
+    "start_time": None,
+    "end_time": None,
+    "exact_time": None
+}
+
+
+def _date_range_instructions() -> str:
+    today = datetime.now().strftime('%Y-%m-%d')
+    return f"""
     Определи диапазон дат и/или времени из сообщения.
     Верни ТОЛЬКО JSON в формате:
     {{
@@ -106,49 +211,42 @@ async def extract_date_range(text: str) -> dict:
     - "после 18:00 сегодня" → start_date=today, start_time=18:00
     - "до 12:00 завтра" → end_date=tomorrow, end_time=12:00
     - "вечером в пятницу" → start_date=friday, start_time="18:00", end_time="22:00"
+    """
+
+
+def _parse_date_range(parsed: dict) -> dict:
+    return clean_api_response({key: parsed.get(key) for key in EMPTY_RANGE})
 
+
+async def _extract_date_range_single(text: str) -> dict:
+    prompt = f"""{_date_range_instructions()}
     Сообщение:
     {text}
     """
+    try:
+        return _parse_date_range(await ask_deepseek(prompt))
+    except Exception as e:
+        print(f"Ошибка при извлечении диапазона: {e}")
+        return dict(EMPTY_RANGE)
 
-    headers = {
-        "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
-        "Content-Type": "application/json"
-    }
 
-    payload = {
-        "model": "deepseek-chat",
-        "messages": [{"role": "user", "content": prompt}],
-        "response_format": {"type": "json_object"},
-        "temperature": 0.1
-    }
+_date_range_batcher = make_batcher(_date_range_instructions, _parse_date_range, _extract_date_range_single)
 
-    async with httpx.AsyncClient(timeout=15.0) as client:
-        try:
-            response = await client.post(DEEPSEEK_URL, json=payload, headers=headers)
-            response.raise_for_status()
-            data = response.json()
-
-            content = data["choices"][0]["message"]["content"]
-            parsed = json.loads(content)
-
-            result = {
-                "start_date": parsed.get("start_date"),
-                "end_date": parsed.get("end_date"),
-                "start_time": parsed.get("start_time"),
-                "end_time": parsed.get("end_time"),
-                "exact_time": parsed.get("exact_time")
-            }
-            return clean_api_response(result)
-        except Exception as e:
-            print(f"Ошибка при извлечении диапазона: {e}")
-            return {
-                "start_date": None,
-                "end_date": None,
-                "start_time": None,
-                "end_time": None,
-                "exact_time": None
-            }
+
+async def extract_date_range(text: str) -> dict:
+    """
+    Анализирует текст и возвращает:
+    {
+        "start_date": "YYYY-MM-DD",
+        "end_date": "YYYY-MM-DD",
+        "start_time": "HH:MM",   # опционально
+        "end_time": "HH:MM",     # опционально
+        "exact_time": "HH:MM"    # если указано одно время
+    }
+    """
+    if LLM_BATCHING:
+        return await within_deadline(_date_range_batcher.submit(text))
+    return await _extract_date_range_single(text)
 
 # --- Функция: извлечение названий событий для удаления ---
 async def extract_event_to_delete(text: str) -> dict:
@@ -181,36 +279,18 @@ async def extract_event_to_delete(text: str) -> dict:
     {text}
     """
 
-    headers = {
-        "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
-        "Content-Type": "application/json"
-    }
+    try:
+        parsed = await ask_deepseek(prompt)
 
-    payload = {
-        "model": "deepseek-chat",
-        "messages": [{"role": "user", "content": prompt}],
-        "response_format": {"type": "json_object"},
-        "temperature": 0.1
-    }
-
-    async with httpx.AsyncClient(timeout=15.0) as client:
-        try:
-            response = await client.post(DEEPSEEK_URL, json=payload, headers=headers)
-            response.raise_for_status()
-            data = response.json()
-
-            content = data["choices"][0]["message"]["content"]
-            parsed = json.loads(content)
-
-            result = {
-                "event_title": parsed.get("event_title"),
-                "start_date": parsed.get("start_date"),
-                "exact_time": parsed.get("exact_time")
-            }
-            return clean_api_response(result)
-        except Exception as e:
-            print(f"Ошибка при извлечении данных для удаления: {e}")
-            return {"event_title": None, "start_date": None, "exact_time": None}
+        result = {
+            "event_title": parsed.get("event_title"),
+            "start_date": parsed.get("start_date"),
+            "exact_time": parsed.get("exact_time")
+        }
+        return clean_api_response(result)
+    except Exception as e:
+        print(f"Ошибка при извлечении данных для удаления: {e}")
+        return {"event_title": None, "start_date": None, "exact_time": None}
 
 # --- Функция: извлечение данных для изменения ---
 async def extract_edit_data(text: str) -> dict:
@@ -240,51 +320,107 @@ async def extract_edit_data(text: str) -> dict:
     {text}
     """
 
-    headers = {
-        "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
-        "Content-Type": "application/json"
-    }
+    try:
+        parsed = await ask_deepseek(prompt)
 
-    payload = {
-        "model": "deepseek-chat",
-        "messages": [{"role": "user", "content": prompt}],
-        "response_format": {"type": "json_object"},
-        "temperature": 0.1
+        # Приводим к нужному формату
+        def validate_dt(dt_str):
+            if not dt_str or len(dt_str) < 16:
+                return None
+            # Проверяем, что это YYYY-MM-DDTHH:MM:SS
+            if re.match(r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}$", dt_str):
+                return dt_str
+            return None
+
+        result = {
+            "event_title": parsed.get("event_title"),
+            "event_description": parsed.get("event_description"),
+            "start_datetime": validate_dt(parsed.get("start_datetime")),
+            "end_datetime": validate_dt(parsed.get("end_datetime")),
+            "event_place": parsed.get("event_place")
+        }
+        return clean_api_response(result)
+    except Exception as e:
+        print(f"Ошибка при извлечении данных для редактирования: {e}")
+        return {
+            "event_title": None,
+            "event_description": None,
+            "start_datetime": None,
+            "end_datetime": None,
+            "event_place": None
+        }
+
+# --- Функция: извлечение массовой операции над событиями периода ---
+async def extract_bulk_operation(text: str) -> dict:
+    """
+    Извлекает массовую операцию над всеми событиями периода.
+    Возвращает:
+    {
+        "action": "delete" | "shift" | "move",
+        "start_date": "YYYY-MM-DD",
+        "end_date": "YYYY-MM-DD",
+        "start_time": "HH:MM",      # опционально
+        "end_time": "HH:MM",        # опционально
+        "shift_minutes": 60,        # для shift: + позже, - раньше
+        "target_date": "YYYY-MM-DD" # для move
     }
+    """
+    today = datetime.now().strftime('%Y-%m-%d')
+    prompt = f"""
+    Пользователь хочет удалить или перенести ВСЕ события за период.
+    Верни ТОЛЬКО JSON в формате:
+    {{
+      "action": "delete, shift или move",
+      "start_date": "YYYY-MM-DD",
+      "end_date": "YYYY-MM-DD или null",
+      "start_time": "HH:MM или null",
+      "end_time": "HH:MM или null",
+      "shift_minutes": "целое число минут или null",
+      "target_date": "YYYY-MM-DD или null"
+    }}
+    delete — удалить события периода;
+    shift — сдвинуть на время (shift_minutes > 0 — позже, < 0 — раньше);
+    move — перенести на другую дату с сохранением времени (target_date — новая дата
+    для первого дня периода).
+    Сегодня: {today}
 
-    async with httpx.AsyncClient(timeout=15.0) as client:
-        try:
-            response = await client.post(DEEPSEEK_URL, json=payload, headers=headers)
-            response.raise_for_status()
-            data = response.json()
-
-            content = data["choices"][0]["message"]["content"]
-            parsed = json.loads(content)
-
-            # Приводим к нужному формату
-            def validate_dt(dt_str):
-                if not dt_str or len(dt_str) < 16:
-                    return None
-                # Проверяем, что это YYYY-MM-DDTHH:MM:SS
-                import re
-                if re.match(r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}$", dt_str):
-                    return dt_str
-                return None
+    Примеры:
+    - "удали всё на следующей неделе" → action=delete, start_date=понедельник, end_date=воскресенье
+    - "перенеси все события завтра на час позже" → action=shift, start_date=завтра, shift_minutes=60
+    - "сдвинь всё после 15:00 сегодня на 30 минут раньше" → action=shift, start_date=сегодня, start_time="15:00", shift_minutes=-30
+    - "перенеси все встречи с пятницы на понедельник" → action=move, start_date=пятница, target_date=понедельник
+
+    Сообщение:
+    {text}
+    """
 
-            result = {
-                "event_title": parsed.get("event_title"),
-                "event_description": parsed.get("event_description"),
-                "start_datetime": validate_dt(parsed.get("start_datetime")),
-                "end_datetime": validate_dt(parsed.get("end_datetime")),
-                "event_place": parsed.get("event_place")
-            }
-            return clean_api_response(result)
-        except Exception as e:
-            print(f"Ошибка при извлечении данных для редактирования: {e}")
-            return {
-                "event_title": None,
-                "event_description": None,
-                "start_datetime": None,
-                "end_datetime": None,
-                "event_place": None
-            }
+    try:
+        parsed = await ask_deepseek(prompt)
+
+        action = parsed.get("action")
+        try:
+            shift_minutes = int(parsed.get("shift_minutes"))
+        except (TypeError, ValueError):
+            shift_minutes = None
+
+        result = {
+            "action": action if action in ("delete", "shift", "move") else None,
+            "start_date": parsed.get("start_date"),
+            "end_date": parsed.get("end_date"),
+            "start_time": parsed.get("start_time"),
+            "end_time": parsed.get("end_time"),
+            "shift_minutes": shift_minutes,
+            "target_date": parsed.get("target_date")
+        }
+        return clean_api_response(result)
+    except Exception as e:
+        print(f"Ошибка при извлечении массовой операции: {e}")
+        return {
+            "action": None,
+            "start_date": None,
+            "end_date": None,
+            "start_time": None,
+            "end_time": None,
+            "shift_minutes": None,
+            "target_date": None
+        }
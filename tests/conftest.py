@@ -0,0 +1,10 @@
+import os
+import sys
+
+# Модули бота читают окружение при импорте: тесты всегда идут на SQLite в памяти,
+# без Supabase, DeepSeek и Telegram
+os.environ["STORAGE_BACKEND"] = "sqlite"
+os.environ["SQLITE_PATH"] = ":memory:"
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "1:test")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
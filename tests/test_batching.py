@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+
+import batching
+import utils
+from batching import MicroBatcher
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    # Запросы приходят с интервалом 1 мс — батчер считает это нагрузкой
+    now = [1000.0]
+
+    def monotonic():
+        now[0] += 0.001
+        return now[0]
+
+    monkeypatch.setattr(batching.time, "monotonic", monotonic)
+
+
+class Calls:
+    def __init__(self, batch_results=None, batch_error=None):
+        self.batches = []
+        self.singles = []
+        self.batch_results = batch_results
+        self.batch_error = batch_error
+
+    async def run_batch(self, items):
+        self.batches.append(list(items))
+        if self.batch_error:
+            raise self.batch_error
+        if self.batch_results is not None:
+            return self.batch_results(items)
+        return [f"batch:{item}" for item in items]
+
+    async def run_single(self, item):
+        self.singles.append(item)
+        await asyncio.sleep(0.01)
+        if item == "bad":
+            raise RuntimeError("bad item")
+        return f"single:{item}"
+
+
+def submit_all(calls: Calls, items, max_batch: int = 3):
+    async def scenario():
+        batcher = MicroBatcher(calls.run_batch, calls.run_single, max_batch=max_batch, max_wait=0.05)
+        return await asyncio.gather(*(batcher.submit(item) for item in items), return_exceptions=True)
+
+    return asyncio.run(scenario())
+
+
+def test_idle_request_goes_straight_to_single():
+    calls = Calls()
+    assert submit_all(calls, ["a"]) == ["single:a"]
+    assert calls.batches == []
+
+
+def test_concurrent_requests_are_batched():
+    calls = Calls()
+    # Первый уходит сразу, следующие копятся до max_batch
+    results = submit_all(calls, ["a", "b", "c", "d"])
+    assert results == ["single:a", "batch:b", "batch:c", "batch:d"]
+    assert calls.batches == [["b", "c", "d"]]
+
+
+def test_window_flushes_incomplete_batch():
+    calls = Calls()
+    results = submit_all(calls, ["a", "b", "c"], max_batch=10)
+    assert results == ["single:a", "batch:b", "batch:c"]
+    assert calls.batches == [["b", "c"]]
+
+
+def test_unparsed_and_missing_items_fall_back_to_single():
+    # Для второго элемента ответа нет, третий модель не вернула вовсе
+    calls = Calls(batch_results=lambda items: [f"batch:{items[0]}", None])
+    results = submit_all(calls, ["a", "b", "c", "d"])
+    assert results == ["single:a", "batch:b", "single:c", "single:d"]
+    assert calls.singles == ["a", "c", "d"]
+
+
+def test_failed_batch_is_processed_one_by_one():
+    calls = Calls(batch_error=RuntimeError("timeout"))
+    results = submit_all(calls, ["a", "b", "c", "d"])
+    assert results == ["single:a", "single:b", "single:c", "single:d"]
+
+
+def test_single_fallback_error_reaches_the_caller():
+    calls = Calls(batch_error=RuntimeError("timeout"))
+    results = submit_all(calls, ["a", "b", "bad", "d"])
+    assert results[1] == "single:b"
+    assert isinstance(results[2], RuntimeError)
+
+
+def test_batch_prompt_numbers_messages():
+    prompt = utils.build_batch_prompt("Инструкция", ["первое", "второе"])
+    assert '{"id": 0, "text": "первое"}' in prompt
+    assert '{"id": 1, "text": "второе"}' in prompt
+
+
+def test_batch_response_accepts_string_ids(monkeypatch):
+    async def fake_deepseek(prompt):
+        return {"items": [
+            {"id": "1", "result": {"value": "второе"}},
+            {"id": 0, "result": {"value": "первое"}},
+            {"id": "x", "result": {"value": "мусор"}},
+            {"id": 2, "result": "не объект"},
+            {"id": 3, "result": {"fail": True}},
+        ]}
+
+    def parse(result):
+        if result.get("fail"):
+            raise ValueError("не разобран")
+        return result["value"]
+
+    async def single(text):
+        return f"single:{text}"
+
+    monkeypatch.setattr(utils, "ask_deepseek", fake_deepseek)
+    batcher = utils.make_batcher(lambda: "Инструкция", parse, single)
+    results = asyncio.run(batcher.run_batch(["a", "b", "c", "d", "e"]))
+    assert results == ["первое", "второе", None, None, None]
@@ -0,0 +1,80 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from deadlines import DEGRADED_TEXT, DeadlineExceeded, DeadlineMiddleware, remaining, within_deadline
+from replies import ReplyPipeline
+
+
+class FakeMessage:
+    def __init__(self):
+        self.chat = SimpleNamespace(id=1)
+        self.sent = []
+
+    async def reply(self, text, parse_mode=None, reply_markup=None):
+        self.sent.append(text)
+
+
+def run_in_middleware(handler, budget: float):
+    message = FakeMessage()
+    data = {"handler": SimpleNamespace(callback=handler)}
+    result = asyncio.run(DeadlineMiddleware(budget)(handler, message, data))
+    return result, message.sent
+
+
+def test_no_deadline_outside_handlers():
+    assert remaining() is None
+    assert asyncio.run(within_deadline(asyncio.sleep(0, "ok"))) == "ok"
+
+
+def test_own_timeout_raises_timeout_error():
+    with pytest.raises(TimeoutError):
+        asyncio.run(within_deadline(asyncio.sleep(1), timeout=0.01))
+
+
+def test_fast_handler_is_untouched():
+    async def handler(event, data):
+        assert 0 < remaining() <= 1
+        return await within_deadline(asyncio.sleep(0.01, "done"), timeout=5)
+
+    assert run_in_middleware(handler, budget=1) == ("done", [])
+
+
+def test_exhausted_budget_sends_partial_reply():
+    async def handler(event, data):
+        reply = ReplyPipeline(event)
+        reply.add("Найдено: 3 события")
+        await within_deadline(asyncio.sleep(1))
+        reply.add("не дойдёт")
+
+    result, sent = run_in_middleware(handler, budget=0.05)
+    assert result is None
+    assert sent == [f"Найдено: 3 события\n\n{DEGRADED_TEXT}"]
+
+
+def test_spent_budget_fails_before_starting_the_call():
+    started = []
+
+    async def call():
+        started.append(True)
+
+    async def handler(event, data):
+        await asyncio.sleep(0.06)
+        await within_deadline(call())
+
+    _, sent = run_in_middleware(handler, budget=0.05)
+    assert started == []
+    assert sent == [DEGRADED_TEXT]
+
+
+def test_deadline_is_not_swallowed_by_except_exception():
+    async def handler(event, data):
+        try:
+            await within_deadline(asyncio.sleep(1))
+        except Exception:
+            pytest.fail("DeadlineExceeded перехвачен как обычная ошибка")
+
+    assert not issubclass(DeadlineExceeded, Exception)
+    _, sent = run_in_middleware(handler, budget=0.02)
+    assert sent == [DEGRADED_TEXT]
@@ -0,0 +1,123 @@
+import asyncio
+from email.utils import formatdate
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import make_mocked_request
+
+from feed import _escape, _fold, _not_modified, feed_cache, feed_token, handle_feed, render_event
+from storage import storage
+
+
+def request_feed(telegram_id: str, token: str, headers=None):
+    request = make_mocked_request(
+        "GET", f"/feed/{telegram_id}/{token}.ics", headers=headers or {},
+        match_info={"telegram_id": telegram_id, "token": token},
+    )
+    return asyncio.run(handle_feed(request))
+
+
+def test_wrong_token_is_not_found():
+    with pytest.raises(web.HTTPNotFound):
+        request_feed("42", "0" * 32)
+
+
+def test_non_ascii_token_is_not_found():
+    with pytest.raises(web.HTTPNotFound):
+        request_feed("42", "токен")
+
+
+def test_non_numeric_id_is_not_found():
+    with pytest.raises(web.HTTPNotFound):
+        request_feed("abc", feed_token("42"))
+
+
+def test_valid_token_is_served():
+    response = request_feed("42", feed_token(42))
+    assert response.status == 200
+    assert response.content_type == "text/calendar"
+
+
+def test_escape_text_values():
+    assert _escape("a,b;c\\d\nline\r\nend") == "a\\,b\\;c\\\\d\\nline\\nend"
+
+
+def test_short_lines_are_not_folded():
+    assert _fold("SUMMARY:Встреча") == "SUMMARY:Встреча\r\n"
+
+
+def test_long_lines_fold_at_75_bytes_without_breaking_utf8():
+    line = "DESCRIPTION:" + "Длинное описание встречи 😀 " * 10
+    folded = _fold(line)
+    physical = folded[:-2].split("\r\n")
+    assert len(physical) > 1
+    assert all(len(part.encode("utf-8")) <= 75 for part in physical)
+    assert all(part.startswith(" ") for part in physical[1:])
+    # Развёртка (RFC 5545: CRLF + пробел удаляются) возвращает исходную строку
+    assert folded[:-2].replace("\r\n ", "") == line
+
+
+def test_render_event_lines():
+    text = render_event({
+        "id": 5, "event_title": "Обед, с командой", "start_datetime": "2026-10-20T13:00:00",
+        "end_datetime": "2026-10-20T14:00:00", "event_place": "Кафе; зал 2", "event_weekly": True,
+    }, "20261019T000000Z")
+    assert text.split("\r\n")[:-1] == [
+        "BEGIN:VEVENT", "UID:5@calendar-bot", "DTSTAMP:20261019T000000Z",
+        "DTSTART:20261020T130000", "DTEND:20261020T140000", "SUMMARY:Обед\\, с командой",
+        "LOCATION:Кафе\\; зал 2", "RRULE:FREQ=WEEKLY", "END:VEVENT",
+    ]
+    # Событие без даты в ленту не попадает
+    assert render_event({"id": 6, "event_title": "Без даты", "start_datetime": None}, "x") == ""
+
+
+ETAG = '"42-1-0"'
+LAST_MODIFIED = 1_800_000_000
+
+
+def conditional(headers: dict) -> bool:
+    return _not_modified(make_mocked_request("GET", "/", headers=headers), ETAG, LAST_MODIFIED)
+
+
+@pytest.mark.parametrize("headers, expected", [
+    ({}, False),
+    ({"If-None-Match": ETAG}, True),
+    ({"If-None-Match": f'"other", W/{ETAG}'}, True),
+    ({"If-None-Match": "*"}, True),
+    ({"If-None-Match": '"other"'}, False),
+    # If-None-Match важнее даты
+    ({"If-None-Match": '"other"', "If-Modified-Since": formatdate(LAST_MODIFIED, usegmt=True)}, False),
+    ({"If-Modified-Since": formatdate(LAST_MODIFIED, usegmt=True)}, True),
+    ({"If-Modified-Since": formatdate(LAST_MODIFIED - 60, usegmt=True)}, False),
+    ({"If-Modified-Since": "вчера"}, False),
+])
+def test_not_modified(headers, expected):
+    assert conditional(headers) is expected
+
+
+def test_feed_with_current_etag_gets_304_until_invalidated():
+    _, etag = feed_cache.version(43)
+    response = request_feed("43", feed_token(43), headers={"If-None-Match": etag})
+    assert response.status == 304
+
+    feed_cache.invalidate(43)
+    response = request_feed("43", feed_token(43), headers={"If-None-Match": etag})
+    assert response.status == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_feed_body_is_cached_until_invalidated():
+    async def scenario():
+        user_id = await storage.get_or_create_user_id("44")
+        await storage.insert_event({"user_id": user_id, "event_title": "Встреча", "start_datetime": "2026-10-20T10:00:00"})
+        first = b"".join(await feed_cache.get_body(44))
+        await storage.insert_event({"user_id": user_id, "event_title": "Обед", "start_datetime": "2026-10-20T13:00:00"})
+        cached = b"".join(await feed_cache.get_body(44))
+        feed_cache.invalidate(44)
+        fresh = b"".join(await feed_cache.get_body(44))
+        return first, cached, fresh
+
+    first, cached, fresh = asyncio.run(scenario())
+    assert first.startswith(b"BEGIN:VCALENDAR\r\n") and first.endswith(b"END:VCALENDAR\r\n")
+    assert cached == first
+    assert "SUMMARY:Обед".encode() in fresh
@@ -0,0 +1,112 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+
+import fsm_storage
+from fsm_storage import (
+    STATE_TOO_LARGE_TEXT, ExpiringMemoryStorage, StateDataLimitMiddleware, StateDataTooLarge, estimate_size,
+)
+from states import EventForm
+
+KEY = StorageKey(bot_id=1, chat_id=10, user_id=10)
+OTHER = StorageKey(bot_id=1, chat_id=20, user_id=20)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(fsm_storage.time, "monotonic", lambda: now[0])
+    return now
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_state_and_data_round_trip():
+    storage = ExpiringMemoryStorage(idle_ttl=60, max_data_bytes=1000)
+    run(storage.set_state(KEY, EventForm.waiting_for_event))
+    run(storage.set_data(KEY, {"partial_event": {"event_title": "Встреча"}}))
+    assert run(storage.get_state(KEY)) == EventForm.waiting_for_event.state
+    data = run(storage.get_data(KEY))
+    assert data == {"partial_event": {"event_title": "Встреча"}}
+    # Наружу отдаётся копия
+    data["extra"] = 1
+    assert "extra" not in run(storage.get_data(KEY))
+    assert run(storage.get_data(OTHER)) == {}
+
+
+def test_finished_conversation_frees_the_record():
+    storage = ExpiringMemoryStorage(idle_ttl=60, max_data_bytes=1000)
+    run(storage.set_state(KEY, EventForm.waiting_for_event))
+    run(storage.set_data(KEY, {"a": 1}))
+    run(storage.set_state(KEY, None))
+    run(storage.set_data(KEY, {}))
+    assert storage.storage == {}
+
+
+def test_idle_record_expires_on_read(clock):
+    storage = ExpiringMemoryStorage(idle_ttl=60, max_data_bytes=1000)
+    run(storage.set_state(KEY, EventForm.waiting_for_period))
+    clock[0] += 50
+    # Чтение продлевает жизнь записи
+    assert run(storage.get_state(KEY)) == EventForm.waiting_for_period.state
+    clock[0] += 50
+    assert run(storage.get_state(KEY)) == EventForm.waiting_for_period.state
+    clock[0] += 61
+    assert run(storage.get_state(KEY)) is None
+    assert run(storage.get_data(KEY)) == {}
+
+
+def test_sweep_removes_only_idle_records(clock):
+    storage = ExpiringMemoryStorage(idle_ttl=60, max_data_bytes=1000)
+    run(storage.set_state(KEY, EventForm.waiting_for_edit))
+    clock[0] += 40
+    run(storage.set_data(OTHER, {"pending_text": "встреча"}))
+    clock[0] += 30
+    assert storage.sweep() == 1
+    assert list(storage.storage) == [OTHER]
+    assert storage.stats() == {
+        "live_conversations": 0,
+        "records": 1,
+        "memory_bytes": estimate_size({"pending_text": "встреча"}) + fsm_storage._RECORD_OVERHEAD_BYTES,
+    }
+
+
+def test_too_large_data_is_rejected_and_previous_data_kept():
+    storage = ExpiringMemoryStorage(idle_ttl=60, max_data_bytes=100)
+    run(storage.set_data(KEY, {"ids": [1, 2, 3]}))
+    with pytest.raises(StateDataTooLarge):
+        run(storage.set_data(KEY, {"ids": list(range(100))}))
+    assert run(storage.get_data(KEY)) == {"ids": [1, 2, 3]}
+    assert issubclass(StateDataTooLarge, ValueError)
+
+
+class FakeMessage:
+    def __init__(self):
+        self.chat = SimpleNamespace(id=10)
+        self.sent = []
+
+    async def reply(self, text, parse_mode=None, reply_markup=None):
+        self.sent.append(text)
+
+
+def test_middleware_resets_conversation_on_too_large_data():
+    storage = ExpiringMemoryStorage(idle_ttl=60, max_data_bytes=100)
+    state = FSMContext(storage=storage, key=KEY)
+    message = FakeMessage()
+
+    async def handler(event, data):
+        await state.set_state(EventForm.confirming_delete)
+        await state.update_data(event_ids_to_delete=list(range(100)))
+
+    async def scenario():
+        data = {"state": state, "handler": SimpleNamespace(callback=handler)}
+        await StateDataLimitMiddleware()(handler, message, data)
+        return await state.get_state()
+
+    assert run(scenario()) is None
+    assert message.sent == [STATE_TOO_LARGE_TEXT]
@@ -0,0 +1,51 @@
+import pytest
+
+import intents
+from intents import (
+    INTENT_ADD, INTENT_DELETE, INTENT_EDIT, INTENT_VIEW, MIN_CONFIDENCE, MIN_SCORE,
+    classify_intent, score_intents,
+)
+
+
+@pytest.mark.parametrize("text, intent", [
+    ("Завтра в 18:00 встреча с командой в Zoom", INTENT_ADD),
+    ("Добавь обед с Машей в пятницу", INTENT_ADD),
+    ("Какие у меня дела на завтра?", INTENT_VIEW),
+    ("Покажи расписание на неделю", INTENT_VIEW),
+    ("Удали презентацию в пятницу", INTENT_DELETE),
+    ("Отмена тренировки, её не будет", INTENT_DELETE),
+    ("Перенеси встречу на 19:00", INTENT_EDIT),
+    ("Сдвинь созвон на час позже", INTENT_EDIT),
+])
+def test_clear_requests_are_classified(text, intent):
+    result, confidence = classify_intent(text)
+    assert result == intent
+    assert confidence >= MIN_CONFIDENCE
+
+
+@pytest.mark.parametrize("text", ["встреча с Петей", "привет", "", None, "удали и перенеси"])
+def test_ambiguous_text_is_not_classified(text):
+    result, confidence = classify_intent(text)
+    assert result is None
+    assert 0 < confidence < 1
+
+
+def test_low_score_is_ambiguous_even_when_confident(monkeypatch):
+    # Одно слово о встрече без глагола: лидер есть, но его оценка ниже MIN_SCORE
+    scores = score_intents("встреча")
+    assert max(scores.values()) < MIN_SCORE
+    monkeypatch.setattr(intents, "MIN_CONFIDENCE", 0.0)
+    assert classify_intent("встреча")[0] is None
+
+
+def test_low_confidence_is_ambiguous_even_with_high_score():
+    # Два действия с одинаковым весом: оценка высокая, уверенность около половины
+    scores = score_intents("удали и перенеси")
+    assert scores[INTENT_DELETE] >= MIN_SCORE
+    result, confidence = classify_intent("удали и перенеси")
+    assert result is None
+    assert confidence < MIN_CONFIDENCE
+
+
+def test_yo_is_treated_as_e():
+    assert score_intents("перенёс") == score_intents("перенес")
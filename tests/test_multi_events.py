@@ -0,0 +1,91 @@
+import asyncio
+from types import SimpleNamespace
+
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+import handlers
+import utils
+from states import EventForm
+from storage import storage
+from utils import EMPTY_EVENT, _parse_events
+
+
+def test_parse_events_keeps_every_event():
+    events = _parse_events({"events": [
+        {"event_title": "Стендап", "start_datetime": "2026-10-20 10:00", "event_place": "null", "extra": 1},
+        "мусор",
+        {"event_title": "Созвон", "start_datetime": "2026-10-20 15:00", "end_datetime": ""},
+    ]})
+    assert events == [
+        {**EMPTY_EVENT, "event_title": "Стендап", "start_datetime": "2026-10-20 10:00"},
+        {**EMPTY_EVENT, "event_title": "Созвон", "start_datetime": "2026-10-20 15:00"},
+    ]
+
+
+def test_parse_events_without_events_returns_one_empty_event():
+    assert _parse_events({}) == [EMPTY_EVENT]
+    assert _parse_events({"events": []}) == [EMPTY_EVENT]
+
+
+def test_llm_failure_returns_one_empty_event(monkeypatch):
+    async def failing(prompt):
+        raise RuntimeError("503")
+
+    monkeypatch.setattr(utils, "ask_deepseek", failing)
+    assert asyncio.run(utils.extract_events_data("завтра стендап")) == [EMPTY_EVENT]
+
+
+class FakeMessage:
+    def __init__(self, user_id: int, text: str, sent: list):
+        self.chat = SimpleNamespace(id=user_id)
+        self.from_user = SimpleNamespace(id=user_id)
+        self.text = text
+        self.sent = sent
+
+    async def reply(self, text, parse_mode=None, reply_markup=None):
+        self.sent.append(text)
+        return self
+
+    async def edit_text(self, text, parse_mode=None, reply_markup=None):
+        self.sent.append(text)
+
+
+def test_several_events_are_confirmed_once_and_inserted_together(monkeypatch):
+    async def extract(text):
+        return [
+            {**EMPTY_EVENT, "event_title": "Стендап", "start_datetime": "2026-10-20 10:00"},
+            {**EMPTY_EVENT, "event_title": "Созвон", "start_datetime": "2026-10-20 15:00"},
+            {**EMPTY_EVENT, "event_title": "Без времени"},
+        ]
+
+    inserts = []
+    insert_events = storage.insert_events
+
+    async def counting_insert(events):
+        inserts.append(len(events))
+        return await insert_events(events)
+
+    monkeypatch.setattr(handlers, "extract_events_data", extract)
+    monkeypatch.setattr(storage, "insert_events", counting_insert)
+    state = FSMContext(storage=MemoryStorage(), key=StorageKey(bot_id=1, chat_id=77, user_id=77))
+    sent = []
+
+    async def scenario():
+        await state.set_state(EventForm.waiting_for_event)
+        await handlers.handle_new_event(FakeMessage(77, "завтра в 10 стендап, в 15 созвон и ещё что-то", sent), state)
+        asked = await state.get_state()
+        await handlers.confirm_add(FakeMessage(77, "✅ Да", sent), state)
+        user_id = await storage.get_user_id("77")
+        return asked, await storage.find_events(user_id)
+
+    asked, rows = asyncio.run(scenario())
+    assert asked == EventForm.confirming_add.state
+    assert "Найдено событий: 2" in sent[-2]
+    assert "Пропущено: 1" in sent[-2]
+    assert sent[-1].startswith("✅ Добавлено событий в календарь: 2.")
+    assert inserts == [2]
+    assert [(row["event_title"], row["start_datetime"]) for row in rows] == [
+        ("Стендап", "2026-10-20T10:00:00"), ("Созвон", "2026-10-20T15:00:00"),
+    ]
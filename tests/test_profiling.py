@@ -0,0 +1,72 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import profiling
+from profiling import HandlerProfiler, parse_profile_spec
+
+
+@pytest.mark.parametrize("spec, expected", [
+    ("20", (20, 0)),
+    (" 60s ", (0, 60.0)),
+    ("5m", (0, 300.0)),
+    ("1.5M", (0, 90.0)),
+])
+def test_parse_profile_spec(spec, expected):
+    assert parse_profile_spec(spec) == expected
+
+
+@pytest.mark.parametrize("spec", ["0", "-5", "0s", "-1m", "infs", "nanm", "abc", "s"])
+def test_parse_profile_spec_rejects_bad_limits(spec):
+    with pytest.raises(ValueError):
+        parse_profile_spec(spec)
+
+
+class FakeMiddlewareManager:
+    def __init__(self):
+        self.registered = []
+
+    def register(self, middleware):
+        self.registered.append(middleware)
+
+    def unregister(self, middleware):
+        self.registered.remove(middleware)
+
+
+def burn_in_child_task():
+    return sum(i * i for i in range(20000))
+
+
+async def child_work():
+    await asyncio.sleep(0)
+    return burn_in_child_task()
+
+
+async def handler_with_children(event, data):
+    await asyncio.wait_for(child_work(), timeout=5)
+    return await asyncio.gather(child_work(), child_work())
+
+
+def test_child_tasks_are_profiled(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    profiler = HandlerProfiler()
+    manager = FakeMiddlewareManager()
+    profiler.bind(manager)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        profiler.start(updates=1)
+        assert manager.registered == [profiler]
+        data = {"handler": SimpleNamespace(callback=handler_with_children)}
+        result = await profiler(handler_with_children, None, data)
+        # Последнее сообщение останавливает профилирование и возвращает фабрику задач
+        assert loop.get_task_factory() is None
+        return result
+
+    assert len(asyncio.run(run())) == 2
+    assert manager.registered == []
+    report = open(profiler.last_report, encoding="utf-8").read()
+    assert "handler_with_children" in report
+    assert "burn_in_child_task" in report
+    assert profiler.stats["handler_with_children"].calls == 1
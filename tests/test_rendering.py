@@ -0,0 +1,85 @@
+import re
+
+import pytest
+
+from rendering import (
+    TELEGRAM_MESSAGE_LIMIT, escape, format_datetime, format_time, message_length,
+    render_event, split_message, strip_html,
+)
+
+_TAG = re.compile(r"<(/?)([\w-]+)[^>]*>")
+
+
+def assert_valid_html(text: str):
+    """Теги сбалансированы, сущности не разорваны"""
+    stack = []
+    for closing, name in _TAG.findall(text):
+        if closing:
+            assert stack and stack[-1] == name, text
+            stack.pop()
+        else:
+            stack.append(name)
+    assert not stack, text
+    assert not re.search(r"&(?!(amp|lt|gt|quot|#\d+);)", text), text
+
+
+def visible(text: str) -> str:
+    return re.sub(r"\s", "", strip_html(text))
+
+
+def test_format_datetime_and_time():
+    assert format_datetime("2026-10-20T10:05:00") == "20.10.2026 10:05"
+    assert format_datetime("2026-10-20") == "20.10.2026"
+    assert format_datetime(None) == "??.??.???? ??:??"
+    assert format_time("2026-10-20T10:05:00") == "10:05"
+    assert format_time("2026-10-20") == "??:??"
+
+
+def test_render_event_escapes_user_text():
+    text = render_event({
+        "event_title": "<script> & co", "start_datetime": "2026-10-20T10:00:00",
+        "event_place": "A&B", "event_description": None,
+    })
+    assert text == "• <b>&lt;script&gt; &amp; co</b> — 20.10.2026 10:00\n📍 A&amp;B"
+
+
+def test_message_length_counts_utf16_units():
+    assert message_length("abc") == 3
+    assert message_length("😀") == 2
+
+
+def test_short_blocks_stay_in_one_message():
+    assert split_message(["заголовок", "событие", "итог"]) == ["заголовок\n\nсобытие\n\nитог"]
+
+
+def test_messages_break_only_between_blocks():
+    blocks = [f"<b>событие {i}</b> " + "x" * 80 for i in range(200)]
+    messages = split_message(blocks)
+    assert len(messages) > 1
+    for message in messages:
+        assert message_length(message) <= TELEGRAM_MESSAGE_LIMIT
+        assert all(part in blocks for part in message.split("\n\n"))
+    assert sum(len(message.split("\n\n")) for message in messages) == len(blocks)
+
+
+@pytest.mark.parametrize("limit", [40, 57, 100, 333])
+def test_long_block_cut_keeps_tags_and_entities(limit):
+    title = escape("R&D <план> " * 30)
+    block = f"• <b>{title}</b> — <i>{title}</i>\n📝 {escape('A&B' * 60)}\n😀" + "я" * 200
+    messages = split_message(["Заголовок", block], limit=limit)
+    for message in messages:
+        assert message_length(message) <= limit
+        assert_valid_html(message)
+    assert visible("".join(messages)) == visible("Заголовок" + block)
+
+
+def test_cut_prefers_line_breaks_and_spaces():
+    block = "первая строка\n" + "слово " * 20
+    messages = split_message([block], limit=40)
+    assert messages[0] == "первая строка"
+    assert all(not message.startswith(" ") and not message.endswith(" ") for message in messages)
+    assert all(set(message.split()) == {"слово"} for message in messages[1:])
+
+
+def test_strip_html():
+    assert strip_html("<b>R&amp;D</b> &lt;x&gt;") == "R&D <x>"
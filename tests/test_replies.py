@@ -0,0 +1,60 @@
+import asyncio
+from types import SimpleNamespace
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import SendMessage
+
+from rendering import TELEGRAM_MESSAGE_LIMIT, message_length
+from replies import MAX_REPLY_MESSAGES, ReplyPipeline
+
+
+class FakeMessage:
+    def __init__(self, reject_html: bool = False):
+        self.chat = SimpleNamespace(id=1)
+        self.sent = []
+        self.reject_html = reject_html
+
+    async def reply(self, text, parse_mode=None, reply_markup=None):
+        if self.reject_html and parse_mode == "HTML":
+            raise TelegramBadRequest(method=SendMessage(chat_id=1, text=text), message="can't parse entities")
+        self.sent.append((text, parse_mode))
+
+
+def events(count: int) -> list:
+    return [
+        {"event_title": f"Событие {i}", "start_datetime": "2026-10-20T10:00:00", "event_description": "д" * 200}
+        for i in range(count)
+    ]
+
+
+def test_long_event_list_is_truncated_with_note():
+    message = FakeMessage()
+    reply = ReplyPipeline(message)
+    reply.add("📅 События:")
+    reply.add_events(events(500))
+    asyncio.run(reply.finish("Что дальше?"))
+
+    texts = [text for text, _ in message.sent]
+    assert len(texts) == MAX_REPLY_MESSAGES
+    assert all(message_length(text) <= TELEGRAM_MESSAGE_LIMIT for text in texts)
+    assert texts[0].startswith("📅 События:")
+    assert texts[-1].endswith("Что дальше?")
+    shown = sum(text.count("• <b>") for text in texts)
+    assert f"…и ещё событий: {500 - shown}." in texts[-1]
+
+
+def test_short_event_list_has_no_note():
+    message = FakeMessage()
+    reply = ReplyPipeline(message)
+    reply.add_events(events(3))
+    asyncio.run(reply.finish("Что дальше?"))
+    assert len(message.sent) == 1
+    assert "…и ещё" not in message.sent[0][0]
+
+
+def test_rejected_markup_is_sent_as_plain_text():
+    message = FakeMessage(reject_html=True)
+    reply = ReplyPipeline(message)
+    reply.add_events([{"event_title": "R&D", "start_datetime": "2026-10-20T10:00:00"}])
+    asyncio.run(reply.finish())
+    assert message.sent == [("• R&D — 20.10.2026 10:00", None)]
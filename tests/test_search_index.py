@@ -0,0 +1,108 @@
+import pytest
+
+import search_index
+from search_index import EventSearchIndex, normalize, stem, trigrams
+
+
+EVENTS = [
+    {"id": 1, "event_title": "Встреча с командой", "event_place": "Офис", "start_datetime": "2026-10-20T10:00:00"},
+    {"id": 2, "event_title": "Созвон с клиентом", "event_place": None, "start_datetime": "2026-10-20T15:00:00"},
+    {"id": 3, "event_title": "Встреча с врачом", "event_place": "Клиника", "start_datetime": "2026-10-21 09:30:00"},
+]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(search_index.time, "monotonic", lambda: now[0])
+    return now
+
+
+def loaded_index(**kwargs) -> EventSearchIndex:
+    index = EventSearchIndex(**kwargs)
+    index.load(7, EVENTS)
+    return index
+
+
+def test_normalize_and_stem():
+    assert normalize("Встреча с Командой, ёлка") == ["встреча", "командой", "елка"]
+    assert stem("встречами") == "встреч"
+    assert stem("командой") == "команд"
+    # Основа не короче трёх символов
+    assert stem("дом") == "дом"
+    assert trigrams({"ab"}) == {"  a", " ab", "ab "}
+
+
+def test_other_word_forms_find_the_event():
+    hits = loaded_index().search(7, "встречу с командой")
+    assert hits[0][0] == 1
+    assert 2 not in [event_id for event_id, _ in hits]
+
+
+def test_ranking_prefers_more_matching_stems():
+    hits = loaded_index().search(7, "встреча врач")
+    assert [event_id for event_id, _ in hits][:2] == [3, 1]
+    assert hits[0][1] > hits[1][1]
+
+
+def test_place_is_searchable_and_unrelated_query_finds_nothing():
+    index = loaded_index()
+    assert index.search(7, "клиника")[0][0] == 3
+    assert index.search(7, "футбол") == []
+    assert index.search(8, "встреча") == []
+
+
+def test_date_and_exact_time_filters():
+    index = loaded_index()
+    assert [event_id for event_id, _ in index.search(7, "встреча", date="2026-10-21")] == [3]
+    assert [event_id for event_id, _ in index.search(7, "встреча", exact_datetime="2026-10-20T10:00:00")] == [1]
+
+
+def test_upsert_update_and_remove():
+    index = loaded_index()
+    index.upsert(7, {"id": 4, "event_title": "Презентация проекта", "start_datetime": "2026-10-22T12:00:00"})
+    assert index.search(7, "презентацию")[0][0] == 4
+
+    index.update(4, {"event_title": "Демо проекта"})
+    assert index.search(7, "презентация") == []
+    assert index.search(7, "демо")[0][0] == 4
+
+    index.remove([4, 1])
+    assert index.search(7, "демо") == []
+    assert [event_id for event_id, _ in index.search(7, "встреча")] == [3]
+
+
+def test_upsert_is_skipped_until_user_is_loaded():
+    index = EventSearchIndex()
+    index.upsert(7, EVENTS[0])
+    assert not index.is_loaded(7)
+    assert index.search(7, "встреча") == []
+
+
+def test_index_expires_after_ttl(clock):
+    index = loaded_index(ttl=60)
+    assert index.is_loaded(7)
+    clock[0] += 59
+    assert index.is_loaded(7)
+    clock[0] += 2
+    assert not index.is_loaded(7)
+
+    index.load(7, EVENTS[:1])
+    assert index.is_loaded(7)
+    assert [event_id for event_id, _ in index.search(7, "встреча")] == [1]
+
+
+def test_least_recently_searched_user_is_evicted():
+    index = EventSearchIndex(max_users=2)
+    index.load(1, EVENTS[:1])
+    index.load(2, EVENTS[1:2])
+    # Поиск освежает пользователя 1 — вытеснен будет 2
+    index.search(1, "встреча")
+    index.load(3, [{"id": 30, "event_title": "Обед", "start_datetime": "2026-10-20T13:00:00"}])
+    assert index.is_loaded(1) and index.is_loaded(3)
+    assert not index.is_loaded(2)
+
+    # События вытесненного пользователя не обновляются и не удаляются по id
+    index.update(EVENTS[1]["id"], {"event_title": "Другое"})
+    index.remove([EVENTS[1]["id"]])
+    assert index.search(2, "созвон") == []
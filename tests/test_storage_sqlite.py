@@ -0,0 +1,131 @@
+import asyncio
+
+import pytest
+
+from storage import EVENT_FIELDS, SQLiteStorage, Storage, normalize_datetime
+
+
+@pytest.fixture
+def db():
+    return SQLiteStorage(":memory:")
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def event(user_id, title, start, **fields):
+    return {"user_id": user_id, "event_title": title, "start_datetime": start, **fields}
+
+
+def test_implements_the_storage_contract(db):
+    assert isinstance(db, Storage)
+    assert not SQLiteStorage.__abstractmethods__
+
+
+def test_normalize_datetime():
+    assert normalize_datetime("2026-10-20 10:00") == "2026-10-20T10:00:00"
+    assert normalize_datetime("2026-10-20T10:00:00") == "2026-10-20T10:00:00"
+    assert normalize_datetime(None) is None
+
+
+def test_users_are_created_once(db):
+    assert run(db.get_user_id("42")) is None
+    user_id = run(db.get_or_create_user_id("42"))
+    assert run(db.get_or_create_user_id(42)) == user_id
+    assert run(db.get_user_id("42")) == user_id
+
+
+def test_insert_returns_saved_rows_in_order(db):
+    user_id = run(db.get_or_create_user_id("1"))
+    rows = run(db.insert_events([
+        event(user_id, "Встреча", "2026-10-20 10:00", event_place="Офис", event_weekly=True),
+        event(user_id, "Обед", "2026-10-20T13:00:00"),
+    ]))
+    assert [row["event_title"] for row in rows] == ["Встреча", "Обед"]
+    assert all(row["id"] for row in rows)
+    assert rows[0]["start_datetime"] == "2026-10-20T10:00:00"
+    assert rows[0]["event_weekly"] is True and rows[1]["event_weekly"] is False
+    assert set(EVENT_FIELDS) <= set(rows[0])
+
+    single = run(db.insert_event(event(user_id, "Ужин", "2026-10-20T19:00:00")))
+    assert single["event_title"] == "Ужин"
+
+
+def test_find_events_filters_and_order(db):
+    user_id = run(db.get_or_create_user_id("1"))
+    other = run(db.get_or_create_user_id("2"))
+    run(db.insert_events([
+        event(user_id, "Встреча с Ёлкиным", "2026-10-20T10:00:00"),
+        event(user_id, "Обед", "2026-10-21T13:00:00"),
+        event(user_id, "50%_скидка", "2026-10-22T09:00:00"),
+        event(other, "Встреча", "2026-10-20T10:00:00"),
+    ]))
+    titles = lambda rows: [row["event_title"] for row in rows]  # noqa: E731
+
+    assert titles(run(db.find_events(user_id))) == ["Встреча с Ёлкиным", "Обед", "50%_скидка"]
+    assert titles(run(db.find_events(user_id, start="2026-10-21T00:00:00", end="2026-10-21T23:59:59"))) == ["Обед"]
+    assert titles(run(db.find_events(user_id, exact="2026-10-20 10:00"))) == ["Встреча с Ёлкиным"]
+    assert titles(run(db.find_events(user_id, title="ЕЛКИН"))) == ["Встреча с Ёлкиным"]
+    # % и _ в запросе — обычные символы, а не шаблоны LIKE
+    assert titles(run(db.find_events(user_id, title="0%_"))) == ["50%_скидка"]
+    assert titles(run(db.find_events(user_id, title="%"))) == ["50%_скидка"]
+    assert titles(run(db.find_events(user_id, latest=True, limit=1))) == ["50%_скидка"]
+
+
+def test_get_update_delete_and_index_rows(db):
+    user_id = run(db.get_or_create_user_id("1"))
+    first, second = run(db.insert_events([
+        event(user_id, "Встреча", "2026-10-20T10:00:00"),
+        event(user_id, "Обед", "2026-10-20T13:00:00", event_place="Кафе"),
+    ]))
+    assert {row["id"] for row in run(db.get_events([first["id"], second["id"]]))} == {first["id"], second["id"]}
+    assert run(db.get_events([])) == []
+
+    run(db.update_event(first["id"], {"event_title": "Планёрка", "start_datetime": "2026-10-20 11:00", "id": 999}))
+    [updated] = run(db.get_events([first["id"]]))
+    assert updated["event_title"] == "Планёрка"
+    assert updated["start_datetime"] == "2026-10-20T11:00:00"
+    assert run(db.find_events(user_id, title="планерка"))[0]["id"] == first["id"]
+
+    rows = run(db.list_index_rows(user_id))
+    assert sorted(rows, key=lambda row: row["id"]) == [
+        {"id": first["id"], "event_title": "Планёрка", "event_place": None, "start_datetime": "2026-10-20T11:00:00"},
+        {"id": second["id"], "event_title": "Обед", "event_place": "Кафе", "start_datetime": "2026-10-20T13:00:00"},
+    ]
+
+    run(db.delete_events([first["id"]]))
+    run(db.delete_events([]))
+    assert [row["id"] for row in run(db.find_events(user_id))] == [second["id"]]
+
+
+def test_shift_events_moves_start_and_end(db):
+    user_id = run(db.get_or_create_user_id("1"))
+    row = run(db.insert_event(event(user_id, "Встреча", "2026-10-20T23:30:00", end_datetime="2026-10-21T00:30:00")))
+    [shifted] = run(db.shift_events([row["id"]], 90))
+    assert shifted["start_datetime"] == "2026-10-21T01:00:00"
+    assert shifted["end_datetime"] == "2026-10-21T02:00:00"
+    [back] = run(db.shift_events([row["id"]], -90))
+    assert back["start_datetime"] == "2026-10-20T23:30:00"
+    assert run(db.shift_events([], 10)) == []
+
+
+def test_day_events_group_by_user_and_skip_opted_out(db):
+    alice = run(db.get_or_create_user_id("100"))
+    bob = run(db.get_or_create_user_id("200"))
+    run(db.insert_events([
+        event(alice, "Поздно", "2026-10-20T18:00:00"),
+        event(alice, "Рано", "2026-10-20T08:00:00"),
+        event(alice, "Завтра", "2026-10-21T08:00:00"),
+        event(bob, "Встреча", "2026-10-20T12:00:00"),
+    ]))
+    day = run(db.get_day_events("2026-10-20"))
+    assert {key: [ev["event_title"] for ev in rows] for key, rows in day.items()} == {
+        "100": ["Рано", "Поздно"], "200": ["Встреча"],
+    }
+
+    run(db.set_digest_enabled("200", False))
+    run(db.set_digest_enabled("200", False))
+    assert set(run(db.get_day_events("2026-10-20"))) == {"100"}
+    run(db.set_digest_enabled("200", True))
+    assert set(run(db.get_day_events("2026-10-20"))) == {"100", "200"}